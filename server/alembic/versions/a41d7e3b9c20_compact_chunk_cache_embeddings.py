@@ -0,0 +1,92 @@
+"""Compact chunk cache embeddings
+
+Revision ID: a41d7e3b9c20
+Revises: 7c2c5e9f1d4a
+Create Date: 2026-10-18 10:00:00.000000
+
+Rewrites pickled embedding lists as compact float32 blobs (8-byte header + little-endian
+vector, see app.services.embedding_codec). Rows are converted in keyset-paginated batches
+so large caches are never loaded into memory at once. The codec is inlined to keep this
+revision independent of later application code.
+"""
+import pickle
+import struct
+from typing import Sequence, Union
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a41d7e3b9c20"
+down_revision: Union[str, Sequence[str], None] = "7c2c5e9f1d4a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_ROWS = 2000
+_HEADER = struct.Struct("<2sBBI")
+_MAGIC = b"IE"
+_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+
+
+def _is_compact(blob: bytes) -> bool:
+    return len(blob) >= _HEADER.size and blob[:2] == _MAGIC
+
+
+def _to_compact(blob: bytes):
+    if _is_compact(blob):
+        return None
+    vector = np.asarray(pickle.loads(blob), dtype="<f4").reshape(-1)
+    return _HEADER.pack(_MAGIC, 1, 1, vector.shape[0]) + vector.tobytes()
+
+
+def _to_pickle(blob: bytes):
+    if not _is_compact(blob):
+        return None
+    _, _, code, dim = _HEADER.unpack_from(blob)
+    vector = np.frombuffer(blob, dtype=_DTYPES[code], count=dim, offset=_HEADER.size)
+    return pickle.dumps([float(v) for v in vector])
+
+
+def _convert_rows(convert) -> None:
+    bind = op.get_bind()
+    select_page = sa.text(
+        """
+        SELECT text_hash, model_name, embedding FROM chunk_cache
+        WHERE text_hash > :text_hash OR (text_hash = :text_hash AND model_name > :model_name)
+        ORDER BY text_hash, model_name
+        LIMIT :limit
+        """
+    )
+    update_row = sa.text(
+        "UPDATE chunk_cache SET embedding = :embedding WHERE text_hash = :text_hash AND model_name = :model_name"
+    )
+    last_hash, last_model = "", ""
+    converted = 0
+    while True:
+        rows = bind.execute(
+            select_page, {"text_hash": last_hash, "model_name": last_model, "limit": BATCH_ROWS}
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for text_hash, model_name, embedding in rows:
+            new_blob = convert(bytes(embedding))
+            if new_blob is not None:
+                updates.append({"embedding": new_blob, "text_hash": text_hash, "model_name": model_name})
+        if updates:
+            bind.execute(update_row, updates)
+            converted += len(updates)
+        last_hash, last_model = rows[-1][0], rows[-1][1]
+    print(f"[Migration] Converted {converted} chunk_cache embedding(s)")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _convert_rows(_to_compact)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _convert_rows(_to_pickle)
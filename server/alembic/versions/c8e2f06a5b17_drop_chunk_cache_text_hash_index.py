@@ -0,0 +1,30 @@
+"""Drop the redundant chunk cache text_hash index
+
+Revision ID: c8e2f06a5b17
+Revises: a41d7e3b9c20
+Create Date: 2026-10-18 11:00:00.000000
+
+Cache lookups filter on model_name = ? AND text_hash IN (...), which the (text_hash, model_name)
+primary key already serves. The single-column text_hash index duplicates the key's leading
+column and only costs a second B-tree write per cached chunk.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c8e2f06a5b17"
+down_revision: Union[str, Sequence[str], None] = "a41d7e3b9c20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_index(op.f("ix_chunk_cache_text_hash"), table_name="chunk_cache")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(op.f("ix_chunk_cache_text_hash"), "chunk_cache", ["text_hash"], unique=False)
@@ -0,0 +1,38 @@
+"""Track chunk cache last access
+
+Revision ID: d5a9c1e7f3b2
+Revises: c8e2f06a5b17
+Create Date: 2026-10-18 12:00:00.000000
+
+Adds a unix-seconds last_accessed_at column (backfilled with the migration time) and an
+index on it so cache GC can evict the least recently used rows first.
+"""
+import time
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d5a9c1e7f3b2"
+down_revision: Union[str, Sequence[str], None] = "c8e2f06a5b17"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("chunk_cache", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("last_accessed_at", sa.Integer(), nullable=False, server_default=sa.text("0"))
+        )
+    op.execute(sa.text("UPDATE chunk_cache SET last_accessed_at = :now").bindparams(now=int(time.time())))
+    op.create_index("ix_chunk_cache_last_accessed", "chunk_cache", ["last_accessed_at"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_chunk_cache_last_accessed", table_name="chunk_cache")
+    with op.batch_alter_table("chunk_cache", schema=None) as batch_op:
+        batch_op.drop_column("last_accessed_at")
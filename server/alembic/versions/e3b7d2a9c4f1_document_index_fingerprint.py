@@ -0,0 +1,37 @@
+"""Record the index fingerprint of documents
+
+Revision ID: e3b7d2a9c4f1
+Revises: d5a9c1e7f3b2
+Create Date: 2026-10-18 14:00:00.000000
+
+Adds documents.index_fingerprint (parser/chunking/embedding config of the indexed rows) and an
+index on (file_hash, index_fingerprint) so ingestion can find a READY copy of the same artifact
+in another notebook and clone its nodes. Existing rows stay NULL and are never cloned from.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e3b7d2a9c4f1"
+down_revision: Union[str, Sequence[str], None] = "d5a9c1e7f3b2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("documents", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("index_fingerprint", sa.String(length=16), nullable=True))
+    op.create_index(
+        "ix_documents_file_hash_fingerprint", "documents", ["file_hash", "index_fingerprint"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_documents_file_hash_fingerprint", table_name="documents")
+    with op.batch_alter_table("documents", schema=None) as batch_op:
+        batch_op.drop_column("index_fingerprint")
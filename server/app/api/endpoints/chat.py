@@ -1,51 +1,33 @@
 import asyncio
 import json
-import os
 import time
-from typing import List, Optional, Tuple
+from typing import AsyncIterator, List, Optional, Tuple
 
-import requests
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
-from llama_index.core import StorageContext, load_index_from_storage
-from llama_index.core.vector_stores import MetadataFilter, MetadataFilters
+from llama_index.core import Settings as LlamaSettings
+from llama_index.core.schema import QueryBundle
+from llama_index.core.vector_stores import FilterOperator, MetadataFilter, MetadataFilters
 from pydantic import BaseModel
 
 from app.core.config import settings
 from app.core.prompts import prompts
+from app.services.dashscope_client import ENDPOINT_CHAT, dashscope_client, force_no_proxy_enabled
+from app.services.index_cache import notebook_index_cache
+from app.services.query_embedding_cache import query_embedding_cache
 
 router = APIRouter()
 
 
-def _add_dashscope_no_proxy() -> None:
-    base = os.environ.get("NO_PROXY", "")
-    parts = [p.strip() for p in base.split(",") if p.strip()]
-    for host in ("aliyuncs.com", "dashscope.aliyuncs.com"):
-        if host not in parts:
-            parts.append(host)
-    merged = ",".join(parts)
-    os.environ["NO_PROXY"] = merged
-    os.environ["no_proxy"] = merged
-
-
-def _clear_proxy_env() -> None:
-    for key in ("HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY", "http_proxy", "https_proxy", "all_proxy"):
-        os.environ.pop(key, None)
-
-
-def _force_no_proxy_enabled() -> bool:
-    val = str(os.environ.get("DASHSCOPE_FORCE_NO_PROXY", "")).lower()
-    return val in ("1", "true", "yes", "on")
-
-
 def _resolve_llm_api_key() -> str:
     return settings.DASHSCOPE_LLM_API_KEY or settings.DASHSCOPE_API_KEY or ""
 
 
 def _build_dashscope_payload(messages: List[dict]) -> dict:
     model_name = settings.LLM_MODEL_NAME
-    parameters = {"result_format": "message"}
-    # DashScope qwen3 non-streaming calls require this parameter.
+    # incremental_output makes every SSE event carry only the new tokens instead of the full text so far.
+    parameters = {"result_format": "message", "incremental_output": True}
+    # qwen3 models think by default; the chat UI only renders the final answer.
     if model_name.lower().startswith("qwen3"):
         parameters["enable_thinking"] = False
     return {
@@ -62,73 +44,109 @@ def _extract_dashscope_text(body: dict) -> str:
         return ""
 
 
-def _call_dashscope_chat(messages: List[dict]) -> Tuple[str, str]:
+def _dashscope_attempts() -> List[Tuple[str, bool]]:
+    """
+    (name, direct) network attempts, tried in order. The former no_proxy / proxy_off fallbacks
+    both bypass the proxy on the pooled client, so they are a single direct attempt; with
+    DASHSCOPE_FORCE_NO_PROXY the primary attempt is already direct and is the only one.
+    """
+    if force_no_proxy_enabled():
+        return [("direct", True)]
+    return [
+        ("primary", False),
+        ("direct", True),
+    ]
+
+
+async def _iter_dashscope_sse(resp) -> AsyncIterator[str]:
+    """Yield incremental answer text from a DashScope SSE response; raise on an error event."""
+    event = ""
+    async for line in resp.aiter_lines():
+        if not line:
+            event = ""
+            continue
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+            continue
+        if not line.startswith("data:"):
+            continue
+        try:
+            body = json.loads(line[len("data:"):].strip())
+        except ValueError:
+            continue
+        if not isinstance(body, dict):
+            continue
+        if event == "error" or (body.get("code") and "output" not in body):
+            raise RuntimeError(f"SSE error {body.get('code', '')} {body.get('message', '')}".strip())
+        text = _extract_dashscope_text(body)
+        if text:
+            yield text
+
+
+async def _stream_dashscope_chat(messages: List[dict]) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Stream a DashScope chat completion as ("token", text) events as they arrive.
+    Yields a single ("error", detail) event when no attempt produced an answer.
+
+    Network attempts (primary, then direct without proxy) share DASHSCOPE_CHAT_TIMEOUT_SECONDS as the
+    budget for reaching the first token. Once tokens have been forwarded, a failure ends the stream
+    instead of retrying, so the client never sees a duplicated answer.
+    """
     api_key = _resolve_llm_api_key()
     if not api_key:
-        return "", "Missing DASHSCOPE LLM API key"
+        yield "error", "Missing DASHSCOPE LLM API key"
+        return
 
-    url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
+        "Accept": "text/event-stream",
+        "X-DashScope-SSE": "enable",
     }
     payload = _build_dashscope_payload(messages)
     timeout_s = max(10, int(settings.DASHSCOPE_CHAT_TIMEOUT_SECONDS))
 
-    base_env = {k: os.environ.get(k) for k in (
-        "NO_PROXY", "no_proxy",
-        "HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY",
-        "http_proxy", "https_proxy", "all_proxy",
-    )}
-    attempts = [
-        ("primary", _force_no_proxy_enabled(), _force_no_proxy_enabled()),
-        ("no_proxy", True, False),
-        ("proxy_off", True, True),
-    ]
-    # Use DASHSCOPE_CHAT_TIMEOUT_SECONDS as the total budget instead of per-attempt timeout.
+    attempts = _dashscope_attempts()
     started_at = time.monotonic()
     per_attempt_timeout_s = max(5, (timeout_s + len(attempts) - 1) // len(attempts))
 
     last_error = ""
-    for name, use_no_proxy, clear_proxy in attempts:
+    for name, direct in attempts:
+        streamed = False
         try:
-            elapsed_s = time.monotonic() - started_at
-            remaining_s = timeout_s - elapsed_s
+            remaining_s = timeout_s - (time.monotonic() - started_at)
             if remaining_s <= 0:
                 break
             request_timeout_s = max(1, min(per_attempt_timeout_s, int(remaining_s)))
-
-            for k, v in base_env.items():
-                if v is None:
-                    os.environ.pop(k, None)
-                else:
-                    os.environ[k] = v
-
-            if clear_proxy:
-                _clear_proxy_env()
-            if use_no_proxy:
-                _add_dashscope_no_proxy()
-
-            req_kwargs = {"headers": headers, "json": payload, "timeout": request_timeout_s}
-            if clear_proxy or _force_no_proxy_enabled():
-                req_kwargs["proxies"] = {"http": None, "https": None}
-
-            resp = requests.post(url, **req_kwargs)
-            body = resp.json() if resp.content else {}
-            text = _extract_dashscope_text(body)
-            if resp.status_code == 200 and text.strip():
-                return text.strip(), ""
-
-            code = body.get("code", "") if isinstance(body, dict) else ""
-            msg = body.get("message", "") if isinstance(body, dict) else ""
-            last_error = f"{name}: HTTP {resp.status_code} {code} {msg}".strip()
+            async with dashscope_client.astream(
+                ENDPOINT_CHAT, headers=headers, json=payload, timeout=request_timeout_s, direct=direct,
+            ) as resp:
+                if resp.status_code != 200:
+                    raw = await resp.aread()
+                    try:
+                        body = json.loads(raw) if raw else {}
+                    except ValueError:
+                        body = {}
+                    code = body.get("code", "") if isinstance(body, dict) else ""
+                    msg = body.get("message", "") if isinstance(body, dict) else ""
+                    last_error = f"{name}: HTTP {resp.status_code} {code} {msg}".strip()
+                    continue
+                async for text in _iter_dashscope_sse(resp):
+                    streamed = True
+                    yield "token", text
+            if streamed:
+                return
+            last_error = f"{name}: empty response"
         except Exception as e:
+            if streamed:
+                print(f"[STREAM] DashScope stream interrupted after first token: {name}: {e}", flush=True)
+                return
             last_error = f"{name}: {e}"
             print(f"[STREAM] DashScope attempt failed: {last_error}", flush=True)
 
     if not last_error and (time.monotonic() - started_at) >= timeout_s:
         last_error = f"timeout: exhausted total budget {timeout_s}s"
-    return "", last_error or "DashScope request failed"
+    yield "error", last_error or "DashScope request failed"
 
 
 def _classify_llm_error(err: str) -> Tuple[str, str]:
@@ -149,11 +167,7 @@ def _classify_llm_error(err: str) -> Tuple[str, str]:
 
 
 def get_cached_index(notebook_id: str):
-    notebook_path = os.path.join(settings.VECTOR_STORE_DIR, notebook_id)
-    if not os.path.exists(notebook_path) or not os.listdir(notebook_path):
-        return None
-    storage_context = StorageContext.from_defaults(persist_dir=notebook_path)
-    return load_index_from_storage(storage_context)
+    return notebook_index_cache.get(notebook_id)
 
 
 def _dedupe_nodes(nodes) -> list:
@@ -233,7 +247,7 @@ class StudioRequest(BaseModel):
 
 @router.post("/chat/query")
 async def query_notebook_stream(request: ChatRequest):
-    index = get_cached_index(request.notebook_id)
+    index = await asyncio.to_thread(get_cached_index, request.notebook_id)
     use_rag = index is not None and not (isinstance(request.source_ids, list) and len(request.source_ids) == 0)
 
     async def event_generator():
@@ -253,15 +267,28 @@ async def query_notebook_stream(request: ChatRequest):
             if use_rag:
                 filters = None
                 if request.source_ids:
-                    meta = [MetadataFilter(key=k, value=sid) for sid in request.source_ids for k in ("source_file_id", "doc_id")]
+                    # One IN filter per field; NotebookVectorStore resolves these through its source postings.
+                    meta = [
+                        MetadataFilter(key=k, value=list(request.source_ids), operator=FilterOperator.IN)
+                        for k in ("source_file_id", "doc_id")
+                    ]
                     filters = MetadataFilters(filters=meta, condition="or")
 
-                def _retrieve():
+                def _retrieve(query_bundle: QueryBundle):
                     retriever = index.as_retriever(similarity_top_k=15, filters=filters)
-                    return retriever.retrieve(request.question)
+                    return retriever.retrieve(query_bundle)
 
                 try:
-                    nodes = await asyncio.to_thread(_retrieve)
+                    # Repeated / retried questions skip the embedding round trip.
+                    embedding = await query_embedding_cache.get_or_embed(LlamaSettings.embed_model, request.question)
+                except Exception as e:
+                    print(f"[STREAM] Query embedding cache unavailable, retriever will embed: {e}", flush=True)
+                    embedding = None
+
+                try:
+                    nodes = await asyncio.to_thread(
+                        _retrieve, QueryBundle(query_str=request.question, embedding=embedding)
+                    )
                 except Exception as e:
                     print(f"[STREAM] Retrieve failed: {e}", flush=True)
                     nodes = []
@@ -284,11 +311,17 @@ async def query_notebook_stream(request: ChatRequest):
                     context_prompt = prompts.chat_rag.format(context_str=ctx, query_str=request.question)
 
             messages = history_msgs + [{"role": "user", "content": context_prompt}]
-            text, err = await asyncio.to_thread(_call_dashscope_chat, messages)
+            answered = False
+            err = ""
+            async for kind, value in _stream_dashscope_chat(messages):
+                if kind == "token":
+                    answered = True
+                    yield f"data: {json.dumps({'token': value})}\n\n"
+                else:
+                    err = value
 
-            if text:
-                async for t in _yield_tokens(text):
-                    yield t
+            if answered:
+                print("[STREAM] Answer streamed", flush=True)
             elif citations:
                 # Keep UX alive even when remote generation fails.
                 fallback = _build_local_fallback_answer(citations)
@@ -308,7 +341,7 @@ async def query_notebook_stream(request: ChatRequest):
 
 @router.post("/studio/generate")
 async def generate_studio_content(request: StudioRequest):
-    index = get_cached_index(request.notebook_id)
+    index = await asyncio.to_thread(get_cached_index, request.notebook_id)
     if not index:
         raise HTTPException(status_code=404, detail="Not found")
     try:
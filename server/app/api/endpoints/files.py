@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+import asyncio
 import os
 import json
 from pathlib import Path
@@ -9,9 +10,11 @@ from pathlib import Path
 from app.db.session import get_db
 from app.models.artifact import Artifact
 from app.models.document import Document, DocStatus
-from app.schemas.file import FileUploadResponse, FileCheckRequest
+from app.schemas.file import BulkDeleteRequest, FileUploadResponse, FileCheckRequest
 from app.services.storage import storage_service
 from app.services.document_parser import SUPPORTED_DOCUMENT_EXTENSIONS
+from app.services.ingest_checkpoint import ingest_checkpoints
+from app.services.parse_cache import parse_result_cache
 from app.services.pdf_preview import extract_pdf_page_preview
 from app.worker.tasks import ingest_document_task
 from app.core.config import settings
@@ -293,21 +296,82 @@ async def delete_document(
     # 2. Remove from DB
     await db.delete(doc)
     await db.commit()
+    ingest_checkpoints.clear(doc.id)
 
     # 3. Cleanup orphan artifact (CAS) when no document references it anymore.
-    stmt_ref = select(Document.id).where(Document.file_hash == file_hash).limit(1)
-    res_ref = await db.execute(stmt_ref)
-    if res_ref.scalar_one_or_none() is None:
-        stmt_art = select(Artifact).where(Artifact.hash == file_hash)
-        res_art = await db.execute(stmt_art)
-        artifact = res_art.scalar_one_or_none()
-        if artifact:
-            await db.delete(artifact)
-            await db.commit()
-            storage_service.delete_file(file_hash)
+    await _cleanup_orphan_artifacts(db, {file_hash})
     
     return {"status": "success", "message": "Document removed from index and database."}
 
+
+async def _cleanup_orphan_artifacts(db: AsyncSession, file_hashes: set[str]) -> int:
+    """Delete artifacts (DB row + CAS file) that no document references anymore."""
+    if not file_hashes:
+        return 0
+    stmt_ref = select(Document.file_hash).where(Document.file_hash.in_(file_hashes)).distinct()
+    still_referenced = set((await db.execute(stmt_ref)).scalars().all())
+    orphans = file_hashes - still_referenced
+    if not orphans:
+        return 0
+
+    stmt_art = select(Artifact).where(Artifact.hash.in_(orphans))
+    artifacts = (await db.execute(stmt_art)).scalars().all()
+    for artifact in artifacts:
+        await db.delete(artifact)
+    await db.commit()
+    for artifact in artifacts:
+        storage_service.delete_file(artifact.hash)
+        parse_result_cache.delete(artifact.hash)
+    return len(artifacts)
+
+
+@router.post("/bulk-delete")
+async def bulk_delete_documents(
+    request: BulkDeleteRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Delete many documents of one notebook (or all of them) with a single index rewrite.
+    """
+    from app.services.ingestion import ingestion_service
+
+    if not request.all_documents and not request.doc_ids:
+        raise HTTPException(status_code=400, detail="doc_ids 不能为空（或设置 all_documents=true）")
+
+    stmt = select(Document).where(Document.notebook_id == request.notebook_id)
+    if not request.all_documents:
+        stmt = stmt.where(Document.id.in_(request.doc_ids))
+    docs = (await db.execute(stmt)).scalars().all()
+
+    # 1. Remove from Vector Index
+    if request.all_documents:
+        await asyncio.to_thread(ingestion_service.delete_notebook_index, request.notebook_id)
+        removed_nodes = None
+    else:
+        removed_nodes = await ingestion_service.delete_documents(
+            request.notebook_id, [doc.id for doc in docs], compact=True
+        )
+
+    # 2. Remove from DB
+    file_hashes = {doc.file_hash for doc in docs}
+    for doc in docs:
+        await db.delete(doc)
+    await db.commit()
+    for doc in docs:
+        ingest_checkpoints.clear(doc.id)
+
+    # 3. Cleanup orphan artifacts (CAS)
+    removed_artifacts = await _cleanup_orphan_artifacts(db, file_hashes)
+
+    missing = sorted(set(request.doc_ids) - {doc.id for doc in docs})
+    return {
+        "status": "success",
+        "deleted": [doc.id for doc in docs],
+        "missing": missing,
+        "removed_nodes": removed_nodes,
+        "removed_artifacts": removed_artifacts,
+    }
+
 @router.post("/{doc_id}/classify")
 async def classify_document_content(
     doc_id: str,
@@ -4,6 +4,9 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 
 from app.core.config import settings
+from app.services.dashscope_client import dashscope_client
+from app.services.index_cache import notebook_index_cache
+from app.services.query_embedding_cache import query_embedding_cache
 
 router = APIRouter()
 
@@ -108,3 +111,18 @@ async def update_pdf_ocr_config(payload: PdfOcrConfigUpdate):
         settings.PDF_VISION_INCLUDE_TEXT_PAGES = bool(updates["vision_include_text_pages"])
 
     return _current_pdf_ocr_config()
+
+
+@router.get("/index-cache")
+async def get_index_cache_stats():
+    return notebook_index_cache.stats()
+
+
+@router.get("/dashscope-http")
+async def get_dashscope_http_stats():
+    return dashscope_client.stats()
+
+
+@router.get("/query-embedding-cache")
+async def get_query_embedding_cache_stats():
+    return query_embedding_cache.stats()
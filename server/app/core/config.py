@@ -3,7 +3,6 @@ from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from llama_index.core import Settings as LlamaSettings
 from llama_index.llms.dashscope import DashScope, DashScopeGenerationModels
-from app.services.dashscope_http_embedding import DashScopeHTTPEmbedding
 
 class Settings(BaseSettings):
     # App
@@ -18,7 +17,39 @@ class Settings(BaseSettings):
     LLM_MODEL_NAME: str = "qwen-plus" # Default fallback, user uses qwen3-32b
     EMBED_MODEL_NAME: str = "text-embedding-v3" # Default fallback
     EMBED_BATCH_SIZE: int = 1
+    EMBED_MAX_IN_FLIGHT: int = 4
+    EMBED_BATCH_MAX_TOKENS: int = 8000  # 0 = fixed EMBED_BATCH_SIZE batches
+    EMBED_BATCH_MAX_ITEMS: int = 10
+    EMBED_AIMD_ENABLED: bool = True
+    EMBED_AIMD_TARGET_LATENCY_MS: int = 4000
+    EMBED_CACHE_DTYPE: str = "float32"  # float32 | float16
+    EMBED_CACHE_LOOKUP_CHUNK: int = 500
+    EMBED_MEMORY_CACHE_MAX_MB: int = 64  # 0 disables the in-process tier
+    EMBED_REDIS_CACHE_ENABLED: bool = False
+    EMBED_REDIS_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    EMBED_REDIS_CACHE_MAX_MB: int = 512  # pause cache writes above this Redis used_memory; 0 = no cap
+    EMBED_CACHE_MAX_MB: int = 2048  # chunk_cache size budget, oldest-accessed rows evicted first; 0 = unbounded
+    EMBED_CACHE_MAX_AGE_DAYS: int = 90  # evict rows not accessed for this long; 0 = never
+    EMBED_CACHE_GC_DROP_OTHER_MODELS: bool = True
+    EMBED_CACHE_GC_INTERVAL_HOURS: int = 24  # 0 = only via `manage.py cache-gc`
+    EMBED_CACHE_TOUCH_FLUSH_ROWS: int = 5000
+    EMBED_CACHE_TOUCH_FLUSH_SECONDS: int = 300
+    EMBED_CACHE_TOUCH_GRANULARITY_SECONDS: int = 3600
+    EMBED_SINGLEFLIGHT_ENABLED: bool = True
+    EMBED_SINGLEFLIGHT_CLAIM_TTL_SECONDS: int = 900
+    EMBED_SINGLEFLIGHT_WAIT_SECONDS: int = 900
+    EMBED_SINGLEFLIGHT_POLL_MS: int = 250
+    EMBED_QUERY_CACHE_ENABLED: bool = True
+    EMBED_QUERY_CACHE_MAX_MB: int = 8
+    EMBED_QUERY_CACHE_TTL_SECONDS: int = 24 * 3600  # Redis tier, when EMBED_REDIS_CACHE_ENABLED
     DASHSCOPE_CHAT_TIMEOUT_SECONDS: int = 90
+    DASHSCOPE_EMBED_TIMEOUT_SECONDS: int = 30
+    DASHSCOPE_HTTP_MAX_CONNECTIONS: int = 32
+    DASHSCOPE_HTTP_KEEPALIVE_SECONDS: int = 60
+    DASHSCOPE_CHAT_MAX_CONCURRENCY: int = 16
+    DASHSCOPE_EMBED_MAX_CONCURRENCY: int = 4
+    DASHSCOPE_OCR_MAX_CONCURRENCY: int = 4
+    DASHSCOPE_VISION_MAX_CONCURRENCY: int = 4
     PDF_OCR_MODEL_NAME: str = "qwen-vl-max-latest"
     PDF_OCR_ENABLED: bool = False
     PDF_OCR_MAX_PAGES: int = 12
@@ -47,6 +78,22 @@ class Settings(BaseSettings):
     STORAGE_BASE: str = "./data"
     CAS_DIR: str = "./data/cas"
     VECTOR_STORE_DIR: str = "./data/vector_store"
+    PARSE_CACHE_DIR: str = "./data/parse_cache"
+    PARSE_CACHE_ENABLED: bool = True
+    INDEX_CACHE_MAX_NOTEBOOKS: int = 8
+    VECTOR_COMPACT_MAX_SEGMENTS: int = 16
+    VECTOR_COMPACT_TOMBSTONE_RATIO: float = 0.25
+    VECTOR_ANN_MODE: str = "exact"  # exact | ivf
+    VECTOR_ANN_MIN_CHUNKS: int = 20000
+    VECTOR_ANN_NPROBE: int = 16
+    INDEX_COMMIT_WINDOW_MS: int = 300
+    INGEST_PAGE_QUEUE_SIZE: int = 8  # parsed pages buffered ahead of chunking
+    INGEST_EMBED_BATCH_NODES: int = 256  # chunks per streamed embedding batch
+    INGEST_EMBED_MAX_PENDING_BATCHES: int = 2
+    INGEST_CHECKPOINT_DIR: str = "./data/ingest_checkpoints"
+    INGEST_CHECKPOINT_ENABLED: bool = True
+    INGEST_CHECKPOINT_TTL_HOURS: float = 24.0  # older checkpoints are discarded instead of resumed
+    INDEX_WRITE_LOCK_TIMEOUT_SECONDS: int = 300
     
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
@@ -112,6 +159,8 @@ class Settings(BaseSettings):
         
         # Embedding
         if embed_key:
+            # Imported here: the embedding client depends on these settings.
+            from app.services.dashscope_http_embedding import DashScopeHTTPEmbedding
             LlamaSettings.embed_model = DashScopeHTTPEmbedding(
                 model_name=self.EMBED_MODEL_NAME,
                 api_key=embed_key
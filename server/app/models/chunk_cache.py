@@ -1,4 +1,6 @@
-from sqlalchemy import Column, String, LargeBinary, PrimaryKeyConstraint
+import time
+
+from sqlalchemy import Column, Index, Integer, String, LargeBinary, PrimaryKeyConstraint
 from app.db.session import Base
 
 class ChunkCache(Base):
@@ -8,15 +10,20 @@ class ChunkCache(Base):
     """
     __tablename__ = "chunk_cache"
     __table_args__ = (
+        # Also serves lookups (model_name = ? AND text_hash IN (...)): both key columns are equality filters.
         PrimaryKeyConstraint("text_hash", "model_name", name="pk_chunk_cache_text_model"),
+        Index("ix_chunk_cache_last_accessed", "last_accessed_at"),
     )
 
     # Hash of the text chunk content (normalized)
-    text_hash = Column(String(64), nullable=False, index=True)
+    text_hash = Column(String(64), nullable=False)
     
     # Model name/version is part of cache identity to avoid cross-model contamination.
     model_name = Column(String, nullable=False, default="default")
     
-    # The actual embedding vector stored as bytes (serialized list of floats)
+    # The actual embedding vector stored as bytes (app.services.embedding_codec: header + float32/float16)
     # This saves API costs and latency.
     embedding = Column(LargeBinary, nullable=False)
+
+    # Unix seconds of the last cache hit or write; refreshed in batches, coarse by design (GC only).
+    last_accessed_at = Column(Integer, nullable=False, default=lambda: int(time.time()), server_default="0")
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, ForeignKey, DateTime, Enum, UniqueConstraint
+from sqlalchemy import Column, String, ForeignKey, DateTime, Enum, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import enum
@@ -21,10 +21,14 @@ DOC_STATUS_ENUM = Enum(
     validate_strings=True,
 )
 
+DEFAULT_DOCUMENT_EMOJI = "📄"
+
+
 class Document(Base):
     __tablename__ = "documents"
     __table_args__ = (
         UniqueConstraint("notebook_id", "file_hash", name="uq_documents_notebook_file_hash"),
+        Index("ix_documents_file_hash_fingerprint", "file_hash", "index_fingerprint"),
     )
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
@@ -36,9 +40,12 @@ class Document(Base):
     # Reference to physical file (Artifact)
     file_hash = Column(String(64), ForeignKey("artifacts.hash"), nullable=False)
     
-    emoji = Column(String, default="📄")
+    emoji = Column(String, default=DEFAULT_DOCUMENT_EMOJI)
     status = Column(DOC_STATUS_ENUM, default=DocStatus.PENDING, nullable=False)
     error_msg = Column(String, nullable=True)
+
+    # Parser / chunking / embedding config the indexed rows were built with (see node_cloning).
+    index_fingerprint = Column(String(16), nullable=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class FileCheckRequest(BaseModel):
@@ -7,6 +7,11 @@ class FileCheckRequest(BaseModel):
     notebook_id: str
     filename: str
 
+class BulkDeleteRequest(BaseModel):
+    notebook_id: str
+    doc_ids: List[str] = []
+    all_documents: bool = False
+
 class FileUploadResponse(BaseModel):
     doc_id: str
     status: str
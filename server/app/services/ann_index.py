@@ -0,0 +1,136 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+ANN_FILENAME = "ann_ivf.npz"
+ANN_MODE_EXACT = "exact"
+ANN_MODE_IVF = "ivf"
+
+_MIN_LISTS = 16
+_MAX_LISTS = 4096
+_TRAIN_POINTS_PER_LIST = 40
+_ASSIGN_CHUNK_ROWS = 65536
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+def default_list_count(rows: int) -> int:
+    return int(np.clip(int(np.sqrt(max(rows, 1))), _MIN_LISTS, _MAX_LISTS))
+
+
+def training_sample_size(rows: int, nlist: int) -> int:
+    return min(rows, nlist * _TRAIN_POINTS_PER_LIST)
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file (IVF-flat) index over the rows of a NotebookVectorStore.
+
+    Rows are clustered around `nlist` spherical k-means centroids; a query scores only the rows
+    assigned to its `nprobe` closest centroids. The index stores one centroid id per store row,
+    so the store keeps owning the vectors, row numbering and the alive mask: inserts append
+    assignments, deletes are masked by the store and physically dropped when rows are renumbered.
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: Optional[np.ndarray] = None, trained_rows: int = 0):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self._assign = np.zeros(0, dtype=np.int32) if assignments is None else np.asarray(assignments, dtype=np.int32)
+        self.trained_rows = int(trained_rows)
+        self._order: Optional[np.ndarray] = None
+        self._bounds: Optional[np.ndarray] = None
+
+    @property
+    def nlist(self) -> int:
+        return int(self.centroids.shape[0])
+
+    @property
+    def size(self) -> int:
+        return int(self._assign.shape[0])
+
+    @classmethod
+    def train(
+        cls,
+        sample: np.ndarray,
+        nlist: int,
+        trained_rows: Optional[int] = None,
+        iterations: int = 10,
+        seed: int = 0,
+    ) -> "IVFFlatIndex":
+        """Spherical k-means over an L2-normalized training sample."""
+        sample = np.asarray(sample, dtype=np.float32)
+        rows = sample.shape[0]
+        if rows == 0:
+            raise ValueError("Cannot train an IVF index without vectors")
+        nlist = max(1, min(int(nlist), rows))
+        rng = np.random.default_rng(seed)
+        centroids = sample[rng.choice(rows, nlist, replace=False)].copy()
+
+        for _ in range(max(1, iterations)):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                # Re-seed empty lists from random points so every list stays useful.
+                sums[empty] = sample[rng.choice(rows, len(empty), replace=False)]
+            centroids = _normalize(sums)
+        return cls(centroids, trained_rows=rows if trained_rows is None else trained_rows)
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        labels = np.empty(vectors.shape[0], dtype=np.int32)
+        for begin in range(0, vectors.shape[0], _ASSIGN_CHUNK_ROWS):
+            chunk = np.asarray(vectors[begin:begin + _ASSIGN_CHUNK_ROWS], dtype=np.float32)
+            labels[begin:begin + chunk.shape[0]] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return labels
+
+    def extend(self, vectors: np.ndarray) -> None:
+        """Assign rows appended to the end of the store."""
+        if vectors.shape[0] == 0:
+            return
+        self._assign = np.concatenate([self._assign, self.assign(vectors)])
+        self._order = None
+
+    def remap(self, rows: np.ndarray) -> None:
+        """Keep only `rows` (old row numbers, in their new order) after the store renumbers."""
+        self._assign = self._assign[np.asarray(rows, dtype=np.int64)]
+        self._order = None
+
+    def _ensure_postings(self) -> None:
+        if self._order is not None:
+            return
+        self._order = np.argsort(self._assign, kind="stable")
+        self._bounds = np.searchsorted(self._assign[self._order], np.arange(self.nlist + 1))
+
+    def candidates(self, query_vector: np.ndarray, nprobe: int) -> np.ndarray:
+        """Rows assigned to the `nprobe` centroids closest to the query, ascending."""
+        self._ensure_postings()
+        nprobe = max(1, min(int(nprobe), self.nlist))
+        centroid_scores = self.centroids @ query_vector
+        if nprobe < self.nlist:
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(self.nlist)
+        parts = [self._order[self._bounds[c]:self._bounds[c + 1]] for c in probe]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def save(self, path: str) -> None:
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                assignments=self._assign,
+                trained_rows=np.int64(self.trained_rows),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFFlatIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["assignments"], int(data["trained_rows"]))
@@ -0,0 +1,279 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, not_, or_, select, update
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.chunk_cache import ChunkCache
+from app.services.redis_clients import shared_redis_client
+
+CACHE_STATS_KEY = "embed:cache:stats"
+CACHE_GC_GATE_KEY = "embed:cache:gc_gate"
+_KEYS_PER_STATEMENT = 500
+_GC_SCAN_ROWS = 2000
+
+
+def _chunks(items: List[str], size: int = _KEYS_PER_STATEMENT) -> Iterable[List[str]]:
+    for begin in range(0, len(items), size):
+        yield items[begin:begin + size]
+
+
+def _redis_client():
+    return shared_redis_client(decode_responses=True)
+
+
+class ChunkCacheAccessTracker:
+    """
+    Batches last-access refreshes for chunk_cache rows instead of writing on every hit.
+
+    Hits from every tier (LRU, Redis, SQLite) are recorded in memory and flushed as chunked
+    `UPDATE ... WHERE text_hash IN (...)` statements once EMBED_CACHE_TOUCH_FLUSH_ROWS keys are
+    pending or EMBED_CACHE_TOUCH_FLUSH_SECONDS have passed. Rows touched within the last
+    EMBED_CACHE_TOUCH_GRANULARITY_SECONDS are skipped by the WHERE clause, so hot rows are not
+    rewritten over and over. Lookup/hit counters are added to a Redis hash for `manage.py cache-stats`.
+    """
+
+    def __init__(self, redis_factory=_redis_client):
+        self._redis_factory = redis_factory
+        # WORKER_POOL=threads runs several ingestions in one process; they all record into this tracker.
+        self._lock = threading.Lock()
+        self._pending: Dict[str, set] = defaultdict(set)
+        self._pending_count = 0
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._last_flush = time.monotonic()
+
+    def touch(self, model_name: str, text_hashes: Iterable[str]) -> None:
+        text_hashes = list(text_hashes)
+        with self._lock:
+            bucket = self._pending[model_name]
+            before = len(bucket)
+            bucket.update(text_hashes)
+            self._pending_count += len(bucket) - before
+
+    def record_lookups(self, lookups: int, hits: int) -> None:
+        with self._lock:
+            self._counters["lookups"] += lookups
+            self._counters["hits"] += hits
+
+    @property
+    def pending(self) -> int:
+        return self._pending_count
+
+    def flush_due(self) -> bool:
+        with self._lock:
+            count, last_flush = self._pending_count, self._last_flush
+        if count >= settings.EMBED_CACHE_TOUCH_FLUSH_ROWS:
+            return True
+        return count > 0 and time.monotonic() - last_flush >= settings.EMBED_CACHE_TOUCH_FLUSH_SECONDS
+
+    async def flush(self, db) -> int:
+        """Write pending touches through `db` (caller commits). Returns rows updated."""
+        # Swap the buffers under the lock; touches recorded while we write go into the fresh ones.
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(set)
+            self._pending_count = 0
+            self._last_flush = time.monotonic()
+        now = int(time.time())
+        stale_before = now - max(0, int(settings.EMBED_CACHE_TOUCH_GRANULARITY_SECONDS))
+        updated = 0
+        for model_name, hashes in pending.items():
+            for chunk in _chunks(sorted(hashes)):
+                result = await db.execute(
+                    update(ChunkCache)
+                    .where(
+                        ChunkCache.model_name == model_name,
+                        ChunkCache.text_hash.in_(chunk),
+                        ChunkCache.last_accessed_at < stale_before,
+                    )
+                    .values(last_accessed_at=now)
+                )
+                updated += result.rowcount or 0
+        await self._flush_counters()
+        return updated
+
+    async def _flush_counters(self) -> None:
+        with self._lock:
+            counters, self._counters = dict(self._counters), defaultdict(int)
+        if not any(counters.values()):
+            return
+        try:
+            pipe = self._redis_factory().pipeline(transaction=False)
+            for field, value in counters.items():
+                pipe.hincrby(CACHE_STATS_KEY, field, value)
+            await pipe.execute()
+        except Exception as exc:
+            print(f"[EmbedCache] Could not record cache counters: {exc}")
+
+
+async def _rows_and_bytes(db, *conditions) -> Tuple[int, int]:
+    stmt = select(func.count(), func.coalesce(func.sum(func.length(ChunkCache.embedding)), 0))
+    if conditions:
+        stmt = stmt.where(*conditions)
+    rows, size = (await db.execute(stmt)).one()
+    return int(rows), int(size)
+
+
+def _gc_conditions(now: int) -> List[Tuple[str, object]]:
+    conditions = []
+    if settings.EMBED_CACHE_GC_DROP_OTHER_MODELS:
+        conditions.append(("other_models", ChunkCache.model_name != settings.EMBED_MODEL_NAME))
+    max_age_days = int(settings.EMBED_CACHE_MAX_AGE_DAYS)
+    if max_age_days > 0:
+        conditions.append(("expired", ChunkCache.last_accessed_at < now - max_age_days * 86400))
+    return conditions
+
+
+async def _oldest_over_budget(db, budget_bytes: int) -> Tuple[List[Tuple[str, str]], int]:
+    """Least recently used keys whose removal brings the table under `budget_bytes`."""
+    _, total = await _rows_and_bytes(db)
+    excess = total - budget_bytes
+    victims: List[Tuple[str, str]] = []
+    freed = 0
+    # Keyset paging on the LRU order: each page seeks past the last row of the previous one
+    # instead of re-reading and skipping everything before it. model_name breaks text_hash ties.
+    after: Optional[Tuple[int, str, str]] = None
+    while freed < excess:
+        stmt = select(
+            ChunkCache.last_accessed_at, ChunkCache.text_hash, ChunkCache.model_name, func.length(ChunkCache.embedding)
+        )
+        if after is not None:
+            last_accessed_at, text_hash, model_name = after
+            stmt = stmt.where(or_(
+                ChunkCache.last_accessed_at > last_accessed_at,
+                and_(ChunkCache.last_accessed_at == last_accessed_at, ChunkCache.text_hash > text_hash),
+                and_(
+                    ChunkCache.last_accessed_at == last_accessed_at,
+                    ChunkCache.text_hash == text_hash,
+                    ChunkCache.model_name > model_name,
+                ),
+            ))
+        rows = (await db.execute(
+            stmt.order_by(ChunkCache.last_accessed_at, ChunkCache.text_hash, ChunkCache.model_name).limit(_GC_SCAN_ROWS)
+        )).all()
+        if not rows:
+            break
+        after = tuple(rows[-1][:3])
+        for _, text_hash, model_name, size in rows:
+            if freed >= excess:
+                break
+            victims.append((model_name, text_hash))
+            freed += int(size or 0)
+    return victims, freed
+
+
+async def collect_garbage(db, dry_run: bool = False, now: Optional[int] = None) -> dict:
+    """
+    Evict chunk_cache rows for models other than EMBED_MODEL_NAME, rows not accessed for
+    EMBED_CACHE_MAX_AGE_DAYS, then least recently used rows until the table fits in
+    EMBED_CACHE_MAX_MB. With dry_run nothing is deleted and the result is what would be reclaimed.
+    Caller commits.
+    """
+    now = int(time.time()) if now is None else now
+    result = {"dry_run": dry_run, "deleted_rows": 0, "deleted_bytes": 0, "by_reason": {}}
+
+    earlier = []
+    for reason, condition in _gc_conditions(now):
+        # A row matching several reasons is counted once, under the first (what a real run deletes).
+        effective = and_(condition, not_(or_(*earlier))) if earlier else condition
+        earlier.append(condition)
+        rows, size = await _rows_and_bytes(db, effective)
+        result["by_reason"][reason] = {"rows": rows, "bytes": size}
+        result["deleted_rows"] += rows
+        result["deleted_bytes"] += size
+        if rows and not dry_run:
+            await db.execute(delete(ChunkCache).where(effective))
+
+    budget_mb = int(settings.EMBED_CACHE_MAX_MB)
+    if budget_mb > 0:
+        budget_bytes = budget_mb * 1024 * 1024
+        if dry_run:
+            # Rows counted above are still present; measure the budget against what would remain.
+            _, total = await _rows_and_bytes(db)
+            over = max(0, total - result["deleted_bytes"] - budget_bytes)
+            result["by_reason"]["over_budget"] = {"rows": None, "bytes": over}
+            result["deleted_bytes"] += over
+        else:
+            victims, freed = await _oldest_over_budget(db, budget_bytes)
+            by_model: Dict[str, List[str]] = defaultdict(list)
+            for model_name, text_hash in victims:
+                by_model[model_name].append(text_hash)
+            for model_name, hashes in by_model.items():
+                for chunk in _chunks(hashes):
+                    await db.execute(
+                        delete(ChunkCache).where(ChunkCache.model_name == model_name, ChunkCache.text_hash.in_(chunk))
+                    )
+            result["by_reason"]["over_budget"] = {"rows": len(victims), "bytes": freed}
+            result["deleted_rows"] += len(victims)
+            result["deleted_bytes"] += freed
+    return result
+
+
+async def cache_report(db, redis_factory=_redis_client) -> dict:
+    """Size per model, cumulative hit rate across workers, and what a GC run would reclaim."""
+    models = []
+    rows = (await db.execute(
+        select(
+            ChunkCache.model_name,
+            func.count(),
+            func.coalesce(func.sum(func.length(ChunkCache.embedding)), 0),
+            func.min(ChunkCache.last_accessed_at),
+            func.max(ChunkCache.last_accessed_at),
+        ).group_by(ChunkCache.model_name)
+    )).all()
+    for model_name, count, size, oldest, newest in rows:
+        models.append({
+            "model_name": model_name,
+            "rows": int(count),
+            "bytes": int(size),
+            "oldest_access": int(oldest or 0),
+            "newest_access": int(newest or 0),
+            "current_model": model_name == settings.EMBED_MODEL_NAME,
+        })
+
+    counters = {}
+    try:
+        counters = await redis_factory().hgetall(CACHE_STATS_KEY) or {}
+    except Exception as exc:
+        print(f"[EmbedCache] Could not read cache counters: {exc}")
+    lookups = int(counters.get("lookups", 0))
+    hits = int(counters.get("hits", 0))
+
+    reclaimable = await collect_garbage(db, dry_run=True)
+    return {
+        "rows": sum(m["rows"] for m in models),
+        "bytes": sum(m["bytes"] for m in models),
+        "models": models,
+        "lookups": lookups,
+        "hits": hits,
+        "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        "reclaimable_bytes": reclaimable["deleted_bytes"],
+        "reclaimable": reclaimable["by_reason"],
+    }
+
+
+async def run_garbage_collection(dry_run: bool = False) -> dict:
+    """One GC pass in its own session, after flushing this process's pending access times."""
+    async with AsyncSessionLocal() as db:
+        if chunk_cache_access_tracker.pending:
+            await chunk_cache_access_tracker.flush(db)
+        result = await collect_garbage(db, dry_run=dry_run)
+        await db.commit()
+    print(
+        f"[EmbedCache] GC {'dry run' if dry_run else 'done'}: "
+        f"{result['deleted_rows']} rows, {result['deleted_bytes'] / 1024 / 1024:.1f} MB ({result['by_reason']})"
+    )
+    return result
+
+
+async def claim_gc_slot(r) -> bool:
+    """At most one GC per EMBED_CACHE_GC_INTERVAL_HOURS across all workers (SET NX EX gate)."""
+    hours = int(settings.EMBED_CACHE_GC_INTERVAL_HOURS)
+    if hours <= 0:
+        return False
+    return bool(await r.set(CACHE_GC_GATE_KEY, int(time.time()), nx=True, ex=hours * 3600))
+
+
+chunk_cache_access_tracker = ChunkCacheAccessTracker()
@@ -0,0 +1,365 @@
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+
+DASHSCOPE_API_BASE = "https://dashscope.aliyuncs.com/api/v1"
+
+ENDPOINT_CHAT = "chat"
+ENDPOINT_EMBEDDING = "embedding"
+ENDPOINT_OCR = "ocr"
+ENDPOINT_VISION = "vision"
+
+ENDPOINT_URLS = {
+    ENDPOINT_CHAT: f"{DASHSCOPE_API_BASE}/services/aigc/text-generation/generation",
+    ENDPOINT_EMBEDDING: f"{DASHSCOPE_API_BASE}/services/embeddings/text-embedding/text-embedding",
+    ENDPOINT_OCR: f"{DASHSCOPE_API_BASE}/services/aigc/multimodal-generation/generation",
+    ENDPOINT_VISION: f"{DASHSCOPE_API_BASE}/services/aigc/multimodal-generation/generation",
+}
+
+_CONNECT_TIMEOUT_SECONDS = 10.0
+_STAT_KEYS = ("requests", "failures", "new_connections", "reused_connections", "direct_fallbacks")
+
+
+def force_no_proxy_enabled() -> bool:
+    val = str(os.environ.get("DASHSCOPE_FORCE_NO_PROXY", "")).lower()
+    return val in ("1", "true", "yes", "on")
+
+
+def endpoint_timeout_seconds(endpoint: str) -> float:
+    """Read on every request: OCR/vision timeouts can be changed at runtime from the system API."""
+    if endpoint == ENDPOINT_CHAT:
+        return float(max(10, int(settings.DASHSCOPE_CHAT_TIMEOUT_SECONDS)))
+    if endpoint == ENDPOINT_EMBEDDING:
+        return float(max(1, int(settings.DASHSCOPE_EMBED_TIMEOUT_SECONDS)))
+    if endpoint == ENDPOINT_OCR:
+        return float(max(10, int(settings.PDF_OCR_TIMEOUT_SECONDS)))
+    if endpoint == ENDPOINT_VISION:
+        return float(max(8, int(settings.PDF_VISION_TIMEOUT_SECONDS)))
+    raise ValueError(f"Unknown DashScope endpoint: {endpoint}")
+
+
+def endpoint_concurrency(endpoint: str) -> int:
+    limits = {
+        ENDPOINT_CHAT: settings.DASHSCOPE_CHAT_MAX_CONCURRENCY,
+        ENDPOINT_EMBEDDING: settings.DASHSCOPE_EMBED_MAX_CONCURRENCY,
+        ENDPOINT_OCR: settings.DASHSCOPE_OCR_MAX_CONCURRENCY,
+        ENDPOINT_VISION: settings.DASHSCOPE_VISION_MAX_CONCURRENCY,
+    }
+    return max(1, int(limits[endpoint]))
+
+
+class _ConnectionTrace:
+    """httpcore trace hook: notes whether a request had to open (TCP + TLS) a new connection."""
+
+    def __init__(self):
+        self.connected = False
+
+    def sync(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.started":
+            self.connected = True
+
+    async def async_(self, event_name: str, info: dict) -> None:
+        self.sync(event_name, info)
+
+
+class _LoopState:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.clients: Dict[bool, httpx.AsyncClient] = {}
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+class DashScopeClient:
+    """
+    Process-wide keep-alive HTTP clients for DashScope.
+
+    One pooled client per route (through the configured proxy, or `direct` with proxy
+    variables ignored) so consecutive calls reuse TLS connections instead of handshaking
+    every time. Sync callers (Celery ingestion threads) share one httpx.Client per route;
+    async callers get pooled httpx.AsyncClients bound to their event loop. Each endpoint
+    (chat / embedding / ocr / vision) has its own timeout and in-flight request limit, and
+    per-endpoint counters record how many requests opened a new connection vs reused one.
+    """
+
+    def __init__(
+        self,
+        transport: Optional[httpx.BaseTransport] = None,
+        async_transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self._transport = transport
+        self._async_transport = async_transport
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._clients: Dict[bool, httpx.Client] = {}
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._loop_states: Dict[int, _LoopState] = {}
+        self._stats = {endpoint: dict.fromkeys(_STAT_KEYS, 0) for endpoint in ENDPOINT_URLS}
+
+    # ---- pool management ----
+
+    @staticmethod
+    def _limits() -> httpx.Limits:
+        max_connections = max(1, int(settings.DASHSCOPE_HTTP_MAX_CONNECTIONS))
+        return httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=float(settings.DASHSCOPE_HTTP_KEEPALIVE_SECONDS),
+        )
+
+    def _check_fork(self) -> None:
+        # Pooled sockets must not be shared with a forked child (prefork worker pools).
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._clients = {}
+            self._semaphores = {}
+            self._loop_states = {}
+
+    def _client(self, direct: bool) -> httpx.Client:
+        with self._lock:
+            self._check_fork()
+            client = self._clients.get(direct)
+            if client is None:
+                client = httpx.Client(
+                    transport=self._transport,
+                    limits=self._limits(),
+                    trust_env=not direct and self._transport is None,
+                )
+                self._clients[direct] = client
+            return client
+
+    def _semaphore(self, endpoint: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            self._check_fork()
+            semaphore = self._semaphores.get(endpoint)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(endpoint_concurrency(endpoint))
+                self._semaphores[endpoint] = semaphore
+            return semaphore
+
+    def _loop_state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._check_fork()
+            for key, state in list(self._loop_states.items()):
+                if state.loop.is_closed():
+                    # A fresh loop per Celery task leaves closed loops behind. run_async() closes their
+                    # clients before shutdown; aclose() can no longer run once the loop is closed.
+                    del self._loop_states[key]
+            state = self._loop_states.get(id(loop))
+            if state is None or state.loop is not loop:
+                state = _LoopState(loop)
+                self._loop_states[id(loop)] = state
+            return state
+
+    def _async_client(self, state: _LoopState, direct: bool) -> httpx.AsyncClient:
+        client = state.clients.get(direct)
+        if client is None:
+            client = httpx.AsyncClient(
+                transport=self._async_transport,
+                limits=self._limits(),
+                trust_env=not direct and self._async_transport is None,
+            )
+            state.clients[direct] = client
+        return client
+
+    @staticmethod
+    def _async_semaphore(state: _LoopState, endpoint: str) -> asyncio.Semaphore:
+        semaphore = state.semaphores.get(endpoint)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(endpoint_concurrency(endpoint))
+            state.semaphores[endpoint] = semaphore
+        return semaphore
+
+    def close(self) -> None:
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            client.close()
+
+    async def aclose(self) -> None:
+        """Close the async clients bound to the running event loop."""
+        state = self._loop_state()
+        clients, state.clients = list(state.clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+    # ---- requests ----
+
+    @staticmethod
+    def _timeout(endpoint: str, timeout: Optional[float]) -> httpx.Timeout:
+        total = endpoint_timeout_seconds(endpoint) if timeout is None else float(timeout)
+        return httpx.Timeout(total, connect=min(_CONNECT_TIMEOUT_SECONDS, total))
+
+    def _record(self, endpoint: str, trace: _ConnectionTrace, ok: bool) -> None:
+        with self._lock:
+            stats = self._stats[endpoint]
+            stats["requests"] += 1
+            if not ok:
+                stats["failures"] += 1
+            if trace.connected:
+                stats["new_connections"] += 1
+            elif ok:
+                stats["reused_connections"] += 1
+
+    def _count_fallback(self, endpoint: str, exc: Exception) -> None:
+        print(f"[DashScope] {endpoint} request through proxy failed ({exc}); retrying direct", flush=True)
+        with self._lock:
+            self._stats[endpoint]["direct_fallbacks"] += 1
+
+    @contextmanager
+    def _sync_slot(self, endpoint: str):
+        semaphore = self._semaphore(endpoint)
+        with semaphore:
+            yield
+
+    def _send(self, endpoint: str, direct: bool, headers: dict, json: dict, timeout: Optional[float]) -> httpx.Response:
+        trace = _ConnectionTrace()
+        try:
+            response = self._client(direct).post(
+                ENDPOINT_URLS[endpoint],
+                headers=headers,
+                json=json,
+                timeout=self._timeout(endpoint, timeout),
+                extensions={"trace": trace.sync},
+            )
+        except Exception:
+            self._record(endpoint, trace, ok=False)
+            raise
+        self._record(endpoint, trace, ok=True)
+        return response
+
+    def post(
+        self,
+        endpoint: str,
+        headers: dict,
+        json: dict,
+        timeout: Optional[float] = None,
+        direct: Optional[bool] = None,
+    ) -> httpx.Response:
+        """
+        POST to a DashScope endpoint on the pooled sync client.
+        A transport error through the proxy is retried once on the direct route.
+        """
+        direct = force_no_proxy_enabled() if direct is None else direct
+        with self._sync_slot(endpoint):
+            try:
+                return self._send(endpoint, direct, headers, json, timeout)
+            except httpx.TransportError as exc:
+                if direct:
+                    raise
+                self._count_fallback(endpoint, exc)
+                return self._send(endpoint, True, headers, json, timeout)
+
+    async def _asend(
+        self,
+        state: _LoopState,
+        endpoint: str,
+        direct: bool,
+        headers: dict,
+        json: dict,
+        timeout: Optional[float],
+    ) -> httpx.Response:
+        trace = _ConnectionTrace()
+        try:
+            response = await self._async_client(state, direct).post(
+                ENDPOINT_URLS[endpoint],
+                headers=headers,
+                json=json,
+                timeout=self._timeout(endpoint, timeout),
+                extensions={"trace": trace.async_},
+            )
+        except Exception:
+            self._record(endpoint, trace, ok=False)
+            raise
+        self._record(endpoint, trace, ok=True)
+        return response
+
+    async def apost(
+        self,
+        endpoint: str,
+        headers: dict,
+        json: dict,
+        timeout: Optional[float] = None,
+        direct: Optional[bool] = None,
+    ) -> httpx.Response:
+        """Async variant of `post` on the running loop's pooled client."""
+        direct = force_no_proxy_enabled() if direct is None else direct
+        state = self._loop_state()
+        async with self._async_semaphore(state, endpoint):
+            try:
+                return await self._asend(state, endpoint, direct, headers, json, timeout)
+            except httpx.TransportError as exc:
+                if direct:
+                    raise
+                self._count_fallback(endpoint, exc)
+                return await self._asend(state, endpoint, True, headers, json, timeout)
+
+    @asynccontextmanager
+    async def astream(
+        self,
+        endpoint: str,
+        headers: dict,
+        json: dict,
+        timeout: Optional[float] = None,
+        direct: Optional[bool] = None,
+    ):
+        """
+        Streaming POST (SSE). The endpoint slot is held until the response is closed.
+        No direct-route retry here: callers decide whether a retry is safe once data has flowed.
+        """
+        direct = force_no_proxy_enabled() if direct is None else direct
+        state = self._loop_state()
+        trace = _ConnectionTrace()
+        ok = False
+        async with self._async_semaphore(state, endpoint):
+            try:
+                async with self._async_client(state, direct).stream(
+                    "POST",
+                    ENDPOINT_URLS[endpoint],
+                    headers=headers,
+                    json=json,
+                    timeout=self._timeout(endpoint, timeout),
+                    extensions={"trace": trace.async_},
+                ) as response:
+                    ok = True
+                    yield response
+            finally:
+                self._record(endpoint, trace, ok=ok)
+
+    # ---- stats ----
+
+    def stats(self) -> dict:
+        with self._lock:
+            endpoints = {name: dict(values) for name, values in self._stats.items()}
+            sync_clients = len(self._clients)
+            async_loops = len(self._loop_states)
+        for values in endpoints.values():
+            completed = values["requests"] - values["failures"]
+            values["reuse_ratio"] = round(values["reused_connections"] / completed, 3) if completed else 0.0
+        return {
+            "endpoints": endpoints,
+            "sync_clients": sync_clients,
+            "async_loops": async_loops,
+            "max_connections": int(settings.DASHSCOPE_HTTP_MAX_CONNECTIONS),
+            "keepalive_seconds": int(settings.DASHSCOPE_HTTP_KEEPALIVE_SECONDS),
+        }
+
+    def summary(self) -> str:
+        """One-line reuse report for worker logs."""
+        parts = []
+        for name, values in self.stats()["endpoints"].items():
+            if values["requests"]:
+                parts.append(
+                    f"{name} {values['requests']} req / {values['new_connections']} new conn / "
+                    f"{values['reused_connections']} reused"
+                )
+        return ", ".join(parts) or "no requests"
+
+
+dashscope_client = DashScopeClient()
@@ -2,13 +2,14 @@ import base64
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Iterator, List, Optional, Tuple
 
-import requests
 from llama_index.core import Document as LlamaDocument
 from llama_index.core import SimpleDirectoryReader
 
 from app.core.config import settings
+from app.services.dashscope_client import ENDPOINT_OCR, ENDPOINT_VISION, dashscope_client
+from app.services.parse_cache import ParseCacheEntryBroken, parse_result_cache
 
 try:
     import fitz  # type: ignore
@@ -27,6 +28,9 @@ class ParseStats:
     vision_pages: int = 0
     vision_images: int = 0
     skipped_pages: int = 0
+    # OCR / vision calls that failed and left their page text incomplete
+    failed_provider_calls: int = 0
+    cache_hit: bool = False
 
     def to_detail(self) -> dict:
         return {
@@ -37,6 +41,8 @@ class ParseStats:
             "vision_pages": self.vision_pages,
             "vision_images": self.vision_images,
             "skipped_pages": self.skipped_pages,
+            "failed_provider_calls": self.failed_provider_calls,
+            "cache_hit": self.cache_hit,
         }
 
 
@@ -53,6 +59,20 @@ class BaseDocumentParser(ABC):
     def parse(self, file_path: str, filename: str) -> Tuple[List[LlamaDocument], ParseStats]:
         raise NotImplementedError
 
+    def cache_fingerprint(self) -> Optional[dict]:
+        """Settings that change this parser's output; None means results are not worth caching."""
+        return None
+
+    def iter_pages(self, file_path: str, filename: str, stats: ParseStats) -> Iterator[LlamaDocument]:
+        """
+        Yield documents as they are produced, filling `stats` along the way. Parsers that
+        cannot stream parse everything first.
+        """
+        docs, parsed_stats = self.parse(file_path=file_path, filename=filename)
+        for field in vars(parsed_stats):
+            setattr(stats, field, getattr(parsed_stats, field))
+        yield from docs
+
 
 class TextDocumentParser(BaseDocumentParser):
     name = "simple_reader"
@@ -70,6 +90,10 @@ class TextDocumentParser(BaseDocumentParser):
         return docs, stats
 
 
+class PdfProviderError(RuntimeError):
+    """An OCR / vision call failed (transport or HTTP error), as opposed to finding no text."""
+
+
 class BasePdfOcrProvider(ABC):
     @abstractmethod
     def enabled(self) -> bool:
@@ -124,8 +148,6 @@ class DashScopeQwenOcrProvider(BasePdfOcrProvider):
     Uses Qwen-VL via DashScope multimodal endpoint.
     """
 
-    _url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation"
-
     def __init__(self):
         self._model_name = settings.PDF_OCR_MODEL_NAME
         self._api_key = settings.DASHSCOPE_LLM_API_KEY or settings.DASHSCOPE_API_KEY or ""
@@ -163,18 +185,19 @@ class DashScopeQwenOcrProvider(BasePdfOcrProvider):
         }
 
         try:
-            timeout_s = max(10, int(settings.PDF_OCR_TIMEOUT_SECONDS))
-            resp = requests.post(self._url, headers=headers, json=payload, timeout=timeout_s)
+            resp = dashscope_client.post(ENDPOINT_OCR, headers=headers, json=payload)
             body = resp.json() if resp.content else {}
             if resp.status_code != 200:
                 code = body.get("code", "") if isinstance(body, dict) else ""
                 msg = body.get("message", "") if isinstance(body, dict) else ""
                 print(f"[PDF OCR] Page {page_number} failed: HTTP {resp.status_code} {code} {msg}")
-                return ""
+                raise PdfProviderError(f"OCR HTTP {resp.status_code}")
             return self._extract_text(body).strip()
+        except PdfProviderError:
+            raise
         except Exception as exc:
             print(f"[PDF OCR] Page {page_number} request failed: {exc}")
-            return ""
+            raise PdfProviderError(str(exc)) from exc
 
     def _extract_text(self, body: dict) -> str:
         return _extract_dashscope_message_text(body)
@@ -186,8 +209,6 @@ class DashScopeQwenVisionProvider(BasePdfVisionProvider):
     Uses Qwen-VL to describe diagrams/charts/figures semantically.
     """
 
-    _url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation"
-
     def __init__(self):
         self._model_name = settings.PDF_VISION_MODEL_NAME
         self._api_key = settings.DASHSCOPE_LLM_API_KEY or settings.DASHSCOPE_API_KEY or ""
@@ -225,8 +246,7 @@ class DashScopeQwenVisionProvider(BasePdfVisionProvider):
         }
 
         try:
-            timeout_s = max(8, int(settings.PDF_VISION_TIMEOUT_SECONDS))
-            resp = requests.post(self._url, headers=headers, json=payload, timeout=timeout_s)
+            resp = dashscope_client.post(ENDPOINT_VISION, headers=headers, json=payload)
             body = resp.json() if resp.content else {}
             if resp.status_code != 200:
                 code = body.get("code", "") if isinstance(body, dict) else ""
@@ -235,15 +255,19 @@ class DashScopeQwenVisionProvider(BasePdfVisionProvider):
                     f"[PDF Vision] Page {page_number} image {image_index} failed: "
                     f"HTTP {resp.status_code} {code} {msg}"
                 )
-                return ""
+                raise PdfProviderError(f"vision HTTP {resp.status_code}")
             return _extract_dashscope_message_text(body).strip()
+        except PdfProviderError:
+            raise
         except Exception as exc:
             print(f"[PDF Vision] Page {page_number} image {image_index} request failed: {exc}")
-            return ""
+            raise PdfProviderError(str(exc)) from exc
 
 
 class PdfDocumentParser(BaseDocumentParser):
     name = "pdf_hybrid"
+    # Bump when page extraction changes so cached parse results are not reused.
+    version = 1
 
     def __init__(
         self,
@@ -254,54 +278,87 @@ class PdfDocumentParser(BaseDocumentParser):
         self._vision_provider = vision_provider
 
     def parse(self, file_path: str, filename: str) -> Tuple[List[LlamaDocument], ParseStats]:
+        stats = ParseStats(parser=self.name)
+        docs = list(self.iter_pages(file_path, filename, stats))
+        return docs, stats
+
+    def cache_fingerprint(self) -> Optional[dict]:
+        ocr_enabled = bool(self._ocr_provider and self._ocr_provider.enabled())
+        vision_enabled = bool(self._vision_provider and self._vision_provider.enabled())
+        return {
+            "parser": self.name,
+            "version": self.version,
+            "text_page_min_chars": settings.PDF_TEXT_PAGE_MIN_CHARS,
+            "ocr": {
+                "model": settings.PDF_OCR_MODEL_NAME,
+                "max_pages": settings.PDF_OCR_MAX_PAGES,
+                "scan_page_max_chars": settings.PDF_SCAN_PAGE_MAX_CHARS,
+                "scan_image_ratio": settings.PDF_SCAN_IMAGE_RATIO_THRESHOLD,
+            } if ocr_enabled else None,
+            "vision": {
+                "model": settings.PDF_VISION_MODEL_NAME,
+                "max_pages": settings.PDF_VISION_MAX_PAGES,
+                "max_images_per_page": settings.PDF_VISION_MAX_IMAGES_PER_PAGE,
+                "min_image_ratio": settings.PDF_VISION_MIN_IMAGE_RATIO,
+                "include_text_pages": settings.PDF_VISION_INCLUDE_TEXT_PAGES,
+            } if vision_enabled else None,
+        }
+
+    def iter_pages(self, file_path: str, filename: str, stats: ParseStats) -> Iterator[LlamaDocument]:
+        """
+        Yield one document per readable page as soon as its text (and OCR / vision output)
+        is ready, so chunking and embedding can start before the last page is parsed.
+        """
         if fitz is None:
             raise RuntimeError("PyMuPDF is required for PDF parsing. Please install PyMuPDF.")
 
         pdf = fitz.open(file_path)
-        docs: List[LlamaDocument] = []
-        stats = ParseStats(parser=self.name, total_pages=pdf.page_count)
-
-        for page_index in range(pdf.page_count):
-            page = pdf.load_page(page_index)
-            page_number = page_index + 1
-            raw_text = self._extract_page_text(page)
-            page_images, image_ratio = self._collect_page_images(page)
-            vector_ratio, vector_drawings = self._estimate_vector_graphics(page)
-            visual_ratio = max(image_ratio, vector_ratio)
-            used_ocr = False
-            text = raw_text
-
-            if not self._looks_like_text_page(raw_text) and self._should_try_ocr(raw_text, visual_ratio, page_number):
-                rendered = self._render_page_png(page)
-                text = self._ocr_provider.extract_text(rendered, page_number).strip() if rendered else ""
-                used_ocr = bool(text)
-
-            vision_insights = self._extract_vision_insights(
-                page=page,
-                page_number=page_number,
-                page_images=page_images,
-                image_ratio=image_ratio,
-                vector_ratio=vector_ratio,
-                vector_drawings=vector_drawings,
-                used_ocr=used_ocr,
-            )
-            if vision_insights:
-                stats.vision_pages += 1
-                stats.vision_images += len(vision_insights)
-                vision_text = self._format_vision_insights(vision_insights)
-                text = f"{text.strip()}\n\n{vision_text}".strip() if text.strip() else vision_text
-
-            if not text.strip():
-                stats.skipped_pages += 1
-                continue
+        stats.total_pages = pdf.page_count
+        produced = 0
 
-            if used_ocr:
-                stats.ocr_pages += 1
-            else:
-                stats.text_pages += 1
+        try:
+            for page_index in range(pdf.page_count):
+                page = pdf.load_page(page_index)
+                page_number = page_index + 1
+                raw_text = self._extract_page_text(page)
+                page_images, image_ratio = self._collect_page_images(page)
+                vector_ratio, vector_drawings = self._estimate_vector_graphics(page)
+                visual_ratio = max(image_ratio, vector_ratio)
+                used_ocr = False
+                text = raw_text
+
+                if not self._looks_like_text_page(raw_text) and self._should_try_ocr(raw_text, visual_ratio, page_number):
+                    rendered = self._render_page_png(page)
+                    text = self._call_provider(stats, self._ocr_provider.extract_text, rendered, page_number) if rendered else ""
+                    used_ocr = bool(text)
+
+                vision_insights = self._extract_vision_insights(
+                    stats=stats,
+                    page=page,
+                    page_number=page_number,
+                    page_images=page_images,
+                    image_ratio=image_ratio,
+                    vector_ratio=vector_ratio,
+                    vector_drawings=vector_drawings,
+                    used_ocr=used_ocr,
+                )
+                if vision_insights:
+                    stats.vision_pages += 1
+                    stats.vision_images += len(vision_insights)
+                    vision_text = self._format_vision_insights(vision_insights)
+                    text = f"{text.strip()}\n\n{vision_text}".strip() if text.strip() else vision_text
+
+                if not text.strip():
+                    stats.skipped_pages += 1
+                    continue
+
+                if used_ocr:
+                    stats.ocr_pages += 1
+                else:
+                    stats.text_pages += 1
 
-            docs.append(
-                LlamaDocument(
+                produced += 1
+                yield LlamaDocument(
                     text=text,
                     metadata={
                         "page_number": page_number,
@@ -313,13 +370,12 @@ class PdfDocumentParser(BaseDocumentParser):
                         "vector_ratio": round(vector_ratio, 4),
                     },
                 )
-            )
+        finally:
+            pdf.close()
 
-        if not docs:
+        if not produced:
             raise RuntimeError("No readable text extracted from PDF.")
 
-        return docs, stats
-
     def _looks_like_text_page(self, text: str) -> bool:
         min_chars = max(1, int(settings.PDF_TEXT_PAGE_MIN_CHARS))
         return len(text.strip()) >= min_chars
@@ -342,8 +398,18 @@ class PdfDocumentParser(BaseDocumentParser):
             return True
         return bool(settings.PDF_VISION_INCLUDE_TEXT_PAGES)
 
+    @staticmethod
+    def _call_provider(stats: ParseStats, call, *args) -> str:
+        """A failed OCR / vision call degrades the page to what was extracted locally."""
+        try:
+            return call(*args).strip()
+        except PdfProviderError:
+            stats.failed_provider_calls += 1
+            return ""
+
     def _extract_vision_insights(
         self,
+        stats: ParseStats,
         page,
         page_number: int,
         page_images: List[ParsedPageImage],
@@ -374,7 +440,7 @@ class PdfDocumentParser(BaseDocumentParser):
 
         insights: List[str] = []
         for idx, image in enumerate(candidates[:max_images], start=1):
-            desc = self._vision_provider.describe_image(image.png_bytes, page_number, idx).strip()
+            desc = self._call_provider(stats, self._vision_provider.describe_image, image.png_bytes, page_number, idx)
             if desc:
                 insights.append(desc)
         return insights
@@ -514,14 +580,71 @@ class DocumentParserRegistry:
             vision_provider=DashScopeQwenVisionProvider(),
         )
 
-    def parse(self, file_path: str, filename: str) -> Tuple[List[LlamaDocument], ParseStats]:
+    def _select(self, filename: str) -> BaseDocumentParser:
         ext = Path(filename or "").suffix.lower()
         if ext == ".pdf":
-            return self._pdf_parser.parse(file_path=file_path, filename=filename)
+            return self._pdf_parser
         if ext in {".txt", ".md"}:
-            return self._text_parser.parse(file_path=file_path, filename=filename)
+            return self._text_parser
         raise RuntimeError(f"Unsupported file extension for parser registry: {ext or 'unknown'}")
 
+    def iter_pages(
+        self, file_path: str, filename: str, content_hash: Optional[str] = None
+    ) -> Tuple[Iterator[LlamaDocument], ParseStats]:
+        """
+        Lazy counterpart of `parse()`: the returned stats are complete once the iterator is exhausted.
+        With `content_hash` (the CAS artifact hash), a previous parse under the same parser settings
+        is replayed from the parse cache instead of re-running extraction, OCR and vision calls.
+        """
+        parser = self._select(filename)
+        stats = ParseStats(parser=parser.name)
+        fingerprint = parser.cache_fingerprint() if content_hash else None
+        if fingerprint is None:
+            return parser.iter_pages(file_path=file_path, filename=filename, stats=stats), stats
+
+        cached = parse_result_cache.load(content_hash, fingerprint, stats)
+        if cached is not None:
+            print(f"[ParseCache] Reusing parsed pages for {content_hash[:12]}")
+            return self._replay_or_parse(parser, file_path, filename, content_hash, fingerprint, cached, stats), stats
+        pages = parser.iter_pages(file_path=file_path, filename=filename, stats=stats)
+        return parse_result_cache.record(content_hash, fingerprint, pages, stats), stats
+
+    @staticmethod
+    def _replay_or_parse(
+        parser: BaseDocumentParser,
+        file_path: str,
+        filename: str,
+        content_hash: str,
+        fingerprint: dict,
+        cached: Iterator[LlamaDocument],
+        stats: ParseStats,
+    ) -> Iterator[LlamaDocument]:
+        # Pages are deterministic for a fingerprint: when the entry breaks off, parse the file again
+        # (re-recording it) and skip the pages the consumer already received from the cache.
+        replayed = 0
+        try:
+            for doc in cached:
+                replayed += 1
+                yield doc
+            return
+        except ParseCacheEntryBroken:
+            pass
+        stats.cache_hit = False
+        pages = parse_result_cache.record(
+            content_hash, fingerprint, parser.iter_pages(file_path=file_path, filename=filename, stats=stats), stats
+        )
+        for index, doc in enumerate(pages):
+            if index >= replayed:
+                yield doc
+
+    def parse(self, file_path: str, filename: str) -> Tuple[List[LlamaDocument], ParseStats]:
+        return self._select(filename).parse(file_path=file_path, filename=filename)
+
+    def config_fingerprint(self, filename: str) -> dict:
+        """Parser identity plus the settings that shape its output for `filename`."""
+        parser = self._select(filename)
+        return parser.cache_fingerprint() or {"parser": parser.name}
+
     @staticmethod
     def is_supported(filename: str) -> bool:
         ext = Path(filename or "").suffix.lower()
@@ -0,0 +1,74 @@
+import math
+from dataclasses import dataclass
+from typing import List, Sequence
+
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        0x4E00 <= code <= 0x9FFF
+        or 0x3400 <= code <= 0x4DBF
+        or 0x3000 <= code <= 0x303F
+        or 0xFF00 <= code <= 0xFFEF
+        or 0x3040 <= code <= 0x30FF
+        or 0xAC00 <= code <= 0xD7AF
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate without a tokenizer: CJK characters count as one token each,
+    everything else as one token per four characters. Errs on the high side for CJK.
+    """
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    return max(1, cjk + math.ceil((len(text) - cjk) / 4))
+
+
+@dataclass
+class PackingStats:
+    texts: int
+    tokens: int
+    requests: int
+    fixed_count_requests: int
+
+    @property
+    def requests_saved(self) -> int:
+        return self.fixed_count_requests - self.requests
+
+
+def pack_batches(token_counts: Sequence[int], max_tokens: int, max_items: int) -> List[List[int]]:
+    """
+    Group text positions into request batches of at most `max_items` texts and `max_tokens`
+    estimated tokens (first-fit decreasing: longest texts placed first). A text larger than
+    the token budget gets a batch of its own. Positions inside each batch are ascending.
+    """
+    max_items = max(1, int(max_items))
+    max_tokens = max(1, int(max_tokens))
+    order = sorted(range(len(token_counts)), key=lambda i: token_counts[i], reverse=True)
+    batches: List[List[int]] = []
+    loads: List[int] = []
+    for position in order:
+        tokens = token_counts[position]
+        for b, batch in enumerate(batches):
+            if len(batch) < max_items and loads[b] + tokens <= max_tokens:
+                batch.append(position)
+                loads[b] += tokens
+                break
+        else:
+            batches.append([position])
+            loads.append(tokens)
+    for batch in batches:
+        batch.sort()
+    # Dispatch in document order so progress roughly follows the file.
+    batches.sort(key=lambda batch: batch[0])
+    return batches
+
+
+def packing_stats(token_counts: Sequence[int], batches: Sequence[Sequence[int]], fixed_batch_size: int) -> PackingStats:
+    texts = len(token_counts)
+    return PackingStats(
+        texts=texts,
+        tokens=int(sum(token_counts)),
+        requests=len(batches),
+        fixed_count_requests=math.ceil(texts / max(1, int(fixed_batch_size))),
+    )
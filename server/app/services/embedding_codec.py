@@ -0,0 +1,70 @@
+import pickle
+import struct
+from typing import Sequence
+
+import numpy as np
+
+# Compact chunk_cache blob: 8-byte header + little-endian vector.
+#   magic(2) = b"IE", version(u8) = 1, dtype(u8) = 1 float32 | 2 float16, dim(u32)
+# Legacy rows hold pickle.dumps(list_of_floats); pickle streams start with b"\x80", never b"IE".
+EMBEDDING_MAGIC = b"IE"
+EMBEDDING_CODEC_VERSION = 1
+_HEADER = struct.Struct("<2sBBI")
+_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+_DTYPE_CODES = {"float32": 1, "float16": 2}
+
+
+def is_compact_embedding(blob: bytes) -> bool:
+    return len(blob) >= _HEADER.size and blob[:2] == EMBEDDING_MAGIC
+
+
+def encode_embedding(vector: Sequence[float], dtype: str = "float32") -> bytes:
+    if dtype not in _DTYPE_CODES:
+        raise ValueError(f"Unsupported embedding cache dtype: {dtype}")
+    code = _DTYPE_CODES[dtype]
+    array = np.asarray(vector, dtype=_DTYPES[code]).reshape(-1)
+    return _HEADER.pack(EMBEDDING_MAGIC, EMBEDDING_CODEC_VERSION, code, array.shape[0]) + array.tobytes()
+
+
+def decode_compact_embedding(blob: bytes) -> np.ndarray:
+    """
+    Decode one compact blob into a float32 vector; anything else raises ValueError.
+    Use this for blobs from shared stores (Redis): they never held pickles, and unpickling
+    what another client wrote there would execute it.
+    """
+    if not is_compact_embedding(blob):
+        raise ValueError("Not a compact embedding blob")
+    _, version, code, dim = _HEADER.unpack_from(blob)
+    if version != EMBEDDING_CODEC_VERSION or code not in _DTYPES:
+        raise ValueError(f"Unsupported embedding blob (version={version}, dtype={code})")
+    if len(blob) != _HEADER.size + dim * _DTYPES[code].itemsize:
+        raise ValueError("Truncated embedding blob")
+    vector = np.frombuffer(blob, dtype=_DTYPES[code], count=dim, offset=_HEADER.size)
+    return vector.astype(np.float32)
+
+
+def decode_embedding(blob: bytes) -> np.ndarray:
+    """Decode one chunk_cache blob (compact, or a legacy pickle row from SQL) into a float32 vector."""
+    if not is_compact_embedding(blob):
+        return np.asarray(pickle.loads(blob), dtype=np.float32)
+    return decode_compact_embedding(blob)
+
+
+def decode_embeddings(blobs: Sequence[bytes]) -> np.ndarray:
+    """
+    Decode many blobs into one (n, dim) float32 matrix. Compact blobs sharing a dtype and
+    dimension are decoded with a single frombuffer over their joined payloads.
+    """
+    if not blobs:
+        return np.zeros((0, 0), dtype=np.float32)
+    first = blobs[0]
+    if is_compact_embedding(first):
+        header = first[:_HEADER.size]
+        _, version, code, dim = _HEADER.unpack(header)
+        size = _HEADER.size + dim * _DTYPES.get(code, np.dtype("<f4")).itemsize
+        if version == EMBEDDING_CODEC_VERSION and code in _DTYPES and all(
+            len(blob) == size and blob[:_HEADER.size] == header for blob in blobs
+        ):
+            payload = b"".join(memoryview(blob)[_HEADER.size:] for blob in blobs)
+            return np.frombuffer(payload, dtype=_DTYPES[code]).reshape(len(blobs), dim).astype(np.float32)
+    return np.vstack([decode_embedding(blob) for blob in blobs])
@@ -0,0 +1,148 @@
+import asyncio
+import math
+import time
+from typing import Callable, Optional
+
+import httpx
+import redis.asyncio as redis
+
+from app.core.config import settings
+
+AIMD_KEY_PREFIX = "embed:aimd:"
+_CONGESTION_STATUS_CODES = (429, 503)
+
+
+def is_congestion_error(exc: BaseException) -> bool:
+    """Throttling or timeouts: the provider is telling us to slow down."""
+    if isinstance(exc, (httpx.TimeoutException, asyncio.TimeoutError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in _CONGESTION_STATUS_CODES
+    return False
+
+
+class RedisControllerStateStore:
+    """Operating points shared by all worker processes, one Redis hash per embedding model."""
+
+    async def load(self, key: str) -> Optional[dict]:
+        client = redis.from_url(settings.REDIS_URL, decode_responses=True, socket_connect_timeout=1)
+        try:
+            return await client.hgetall(key) or None
+        finally:
+            await client.aclose()
+
+    async def save(self, key: str, state: dict) -> None:
+        client = redis.from_url(settings.REDIS_URL, decode_responses=True, socket_connect_timeout=1)
+        try:
+            await client.hset(key, mapping={k: str(v) for k, v in state.items()})
+        finally:
+            await client.aclose()
+
+
+class InFlightLimiter:
+    """Async slot limiter whose capacity is re-read on every acquire, so it follows the controller."""
+
+    def __init__(self, limit: Callable[[], int]):
+        self._limit = limit
+        self._active = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._active < max(1, self._limit()))
+            self._active += 1
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+
+class AdaptiveEmbeddingController:
+    """
+    AIMD controller for embedding batch size and in-flight request count.
+
+    Each healthy round (as many fast successes as there are requests in flight) adds one
+    to both the batch size and the in-flight count, up to EMBED_BATCH_MAX_ITEMS and
+    EMBED_MAX_IN_FLIGHT. A 429/503 or timeout halves both, at most once per
+    EMBED_AIMD_TARGET_LATENCY_MS so a burst of concurrent failures counts as one signal.
+    Slow successes and other errors hold the current point. The operating point is loaded
+    from Redis on first use in a process and saved back after each run.
+    """
+
+    def __init__(self, model_name: str, state_store=None):
+        self.key = f"{AIMD_KEY_PREFIX}{model_name}"
+        self._store = state_store if state_store is not None else RedisControllerStateStore()
+        self.batch_items = max(1, math.ceil(self._max_items() / 2))
+        self.in_flight = max(1, math.ceil(self._max_in_flight() / 2))
+        self._healthy = 0
+        self._last_decrease = float("-inf")
+        self._loaded = False
+        self.successes = 0
+        self.congestion_events = 0
+        self.errors = 0
+
+    @staticmethod
+    def _max_items() -> int:
+        return max(1, int(settings.EMBED_BATCH_MAX_ITEMS))
+
+    @staticmethod
+    def _max_in_flight() -> int:
+        return max(1, int(settings.EMBED_MAX_IN_FLIGHT))
+
+    def _clamp(self) -> None:
+        self.batch_items = min(max(1, int(self.batch_items)), self._max_items())
+        self.in_flight = min(max(1, int(self.in_flight)), self._max_in_flight())
+
+    def snapshot(self) -> dict:
+        return {"batch_items": self.batch_items, "in_flight": self.in_flight, "updated_at": int(time.time())}
+
+    async def ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            state = await self._store.load(self.key)
+        except Exception as exc:
+            print(f"[Embedding] Could not load AIMD state {self.key}: {exc}")
+            state = None
+        if state:
+            self.batch_items = int(state.get("batch_items", self.batch_items))
+            self.in_flight = int(state.get("in_flight", self.in_flight))
+        self._clamp()
+
+    async def save(self) -> None:
+        try:
+            await self._store.save(self.key, self.snapshot())
+        except Exception as exc:
+            print(f"[Embedding] Could not save AIMD state {self.key}: {exc}")
+
+    def record_success(self, latency_s: float) -> None:
+        self.successes += 1
+        if latency_s * 1000.0 > settings.EMBED_AIMD_TARGET_LATENCY_MS:
+            self._healthy = 0
+            return
+        self._healthy += 1
+        if self._healthy >= self.in_flight:
+            self._healthy = 0
+            self.batch_items += 1
+            self.in_flight += 1
+            self._clamp()
+
+    def record_failure(self, exc: BaseException) -> None:
+        self._healthy = 0
+        if not is_congestion_error(exc):
+            self.errors += 1
+            return
+        self.congestion_events += 1
+        now = time.monotonic()
+        if (now - self._last_decrease) * 1000.0 < settings.EMBED_AIMD_TARGET_LATENCY_MS:
+            return
+        self._last_decrease = now
+        self.batch_items = self.batch_items // 2
+        self.in_flight = self.in_flight // 2
+        self._clamp()
+        print(f"[Embedding] Backing off after {type(exc).__name__}: batch={self.batch_items}, in_flight={self.in_flight}")
+
+    def limiter(self) -> InFlightLimiter:
+        return InFlightLimiter(lambda: self.in_flight)
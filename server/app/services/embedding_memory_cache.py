@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+# Rough per-entry cost beyond the vector itself: key tuple and strings, ndarray header, OrderedDict node.
+_ENTRY_OVERHEAD_BYTES = 256
+
+
+class EmbeddingLRUCache:
+    """
+    In-process LRU of embedding vectors keyed by (model_name, text_hash), bounded by bytes.
+    Sits in front of the chunk_cache table so text embedded moments ago by the same worker
+    (licences, headers, repeated slide footers) skips the SQLite round trip.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, int(max_bytes))
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._evicted_bytes = 0
+
+    @staticmethod
+    def _entry_bytes(vector: np.ndarray) -> int:
+        return int(vector.nbytes) + _ENTRY_OVERHEAD_BYTES
+
+    def get_many(self, model_name: str, text_hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for text_hash in text_hashes:
+                key = (model_name, text_hash)
+                vector = self._entries.get(key)
+                if vector is None:
+                    self._misses += 1
+                    continue
+                self._entries.move_to_end(key)
+                self._hits += 1
+                found[text_hash] = vector
+        return found
+
+    def put_many(self, model_name: str, items: Iterable[Tuple[str, Sequence[float]]]) -> None:
+        if self.max_bytes <= 0:
+            return
+        with self._lock:
+            for text_hash, vector in items:
+                # Own a compact float32 copy; a row view would pin its whole source matrix.
+                array = np.array(vector, dtype=np.float32)
+                size = self._entry_bytes(array)
+                if size > self.max_bytes:
+                    continue
+                key = (model_name, text_hash)
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._bytes -= self._entry_bytes(previous)
+                self._entries[key] = array
+                self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                evicted_size = self._entry_bytes(evicted)
+                self._bytes -= evicted_size
+                self._evictions += 1
+                self._evicted_bytes += evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "evicted_bytes": self._evicted_bytes,
+            }
+
+
+embedding_memory_cache = EmbeddingLRUCache(max_bytes=settings.EMBED_MEMORY_CACHE_MAX_MB * 1024 * 1024)
@@ -0,0 +1,122 @@
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from app.core.config import settings
+from app.services.embedding_codec import decode_compact_embedding, encode_embedding
+from app.services.redis_clients import shared_redis_client
+
+REDIS_EMBED_KEY_PREFIX = "emb:"
+_KEYS_PER_MGET = 1000
+_MEMORY_CHECK_INTERVAL_SECONDS = 30.0
+
+
+class RedisEmbeddingCache:
+    """
+    Optional embedding cache tier in Redis, shared by workers on every host.
+
+    Values are compact codec blobs under `emb:{model}:{text_hash}` with a TTL. A whole
+    batch of hashes is served by one pipelined round trip (MGET per 1000 keys); writes are
+    pipelined SET ... EX (MSET cannot carry a TTL). Writes pause while Redis reports
+    used_memory above EMBED_REDIS_CACHE_MAX_MB, so the cache never pushes Celery's broker
+    into its eviction policy. Redis errors are logged and treated as misses.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable = shared_redis_client,
+        key_prefix: str = REDIS_EMBED_KEY_PREFIX,
+        ttl_seconds: Optional[int] = None,
+    ):
+        self._client_factory = client_factory
+        self.key_prefix = key_prefix
+        self._ttl_seconds = ttl_seconds
+        self._memory_checked_at = float("-inf")
+        self._over_memory_cap = False
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._skipped_writes = 0
+        self._errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.EMBED_REDIS_CACHE_ENABLED)
+
+    def key(self, model_name: str, text_hash: str) -> str:
+        return f"{self.key_prefix}{model_name}:{text_hash}"
+
+    async def get_many(self, model_name: str, text_hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        if not self.enabled or not text_hashes:
+            return {}
+        client = self._client_factory()
+        try:
+            pipe = client.pipeline(transaction=False)
+            for begin in range(0, len(text_hashes), _KEYS_PER_MGET):
+                pipe.mget([self.key(model_name, h) for h in text_hashes[begin:begin + _KEYS_PER_MGET]])
+            values: List[Optional[bytes]] = [v for chunk in await pipe.execute() for v in chunk]
+        except Exception as exc:
+            self._errors += 1
+            print(f"[EmbedCache] Redis lookup failed, falling back to database: {exc}")
+            return {}
+
+        found: Dict[str, np.ndarray] = {}
+        for text_hash, blob in zip(text_hashes, values):
+            if blob is None:
+                continue
+            try:
+                found[text_hash] = decode_compact_embedding(blob)
+            except ValueError:
+                # Foreign or damaged value: a miss, never unpickled.
+                continue
+        self._hits += len(found)
+        self._misses += len(text_hashes) - len(found)
+        return found
+
+    async def _memory_cap_reached(self, client) -> bool:
+        cap_mb = int(settings.EMBED_REDIS_CACHE_MAX_MB)
+        if cap_mb <= 0:
+            return False
+        now = time.monotonic()
+        if now - self._memory_checked_at >= _MEMORY_CHECK_INTERVAL_SECONDS:
+            self._memory_checked_at = now
+            info = await client.info("memory")
+            self._over_memory_cap = int(info.get("used_memory", 0)) >= cap_mb * 1024 * 1024
+        return self._over_memory_cap
+
+    async def put_many(self, model_name: str, items: Iterable[Tuple[str, Sequence[float]]]) -> None:
+        if not self.enabled:
+            return
+        items = list(items)
+        if not items:
+            return
+        ttl = self._ttl_seconds if self._ttl_seconds is not None else settings.EMBED_REDIS_CACHE_TTL_SECONDS
+        ttl = max(1, int(ttl))
+        client = self._client_factory()
+        try:
+            if await self._memory_cap_reached(client):
+                self._skipped_writes += len(items)
+                return
+            pipe = client.pipeline(transaction=False)
+            for text_hash, vector in items:
+                pipe.set(self.key(model_name, text_hash), encode_embedding(vector, settings.EMBED_CACHE_DTYPE), ex=ttl)
+            await pipe.execute()
+            self._writes += len(items)
+        except Exception as exc:
+            self._errors += 1
+            print(f"[EmbedCache] Redis write failed: {exc}")
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "enabled": self.enabled,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+            "writes": self._writes,
+            "skipped_writes": self._skipped_writes,
+            "errors": self._errors,
+        }
+
+
+redis_embedding_cache = RedisEmbeddingCache()
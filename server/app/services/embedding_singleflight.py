@@ -0,0 +1,107 @@
+import asyncio
+import time
+import uuid
+from typing import Callable, List, Sequence, Tuple
+
+from app.core.config import settings
+from app.services.redis_clients import shared_redis_client
+
+INFLIGHT_KEY_PREFIX = "emb:inflight:"
+# Compare-and-delete so a task never releases a claim that expired and was re-taken by someone else.
+_RELEASE_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('DEL', key)
+    end
+end
+return 1
+"""
+_KEYS_PER_CALL = 500
+
+
+def _redis_client():
+    return shared_redis_client(decode_responses=True)
+
+
+class EmbeddingSingleFlight:
+    """
+    Registry of embeddings currently being computed, shared by all worker processes.
+
+    `claim()` does a pipelined `SET emb:inflight:{model}:{hash} <token> NX EX` per missing hash:
+    hashes we set are ours to embed, the rest are already being embedded by another ingestion.
+    The owner releases its claims once the vectors are committed to chunk_cache; waiters poll
+    until the claims disappear and then read the vectors from the cache. Claims expire after
+    EMBED_SINGLEFLIGHT_CLAIM_TTL_SECONDS so a crashed owner cannot block others. When Redis is
+    unreachable every hash is treated as ours, i.e. no deduplication.
+    """
+
+    def __init__(self, client_factory: Callable = _redis_client):
+        self._client_factory = client_factory
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.EMBED_SINGLEFLIGHT_ENABLED)
+
+    @staticmethod
+    def key(model_name: str, text_hash: str) -> str:
+        return f"{INFLIGHT_KEY_PREFIX}{model_name}:{text_hash}"
+
+    async def claim(self, model_name: str, text_hashes: Sequence[str]) -> Tuple[List[str], List[str], str]:
+        """Returns (owned, waiting, token)."""
+        token = uuid.uuid4().hex
+        text_hashes = list(text_hashes)
+        if not self.enabled or not text_hashes:
+            return text_hashes, [], token
+        ttl = max(1, int(settings.EMBED_SINGLEFLIGHT_CLAIM_TTL_SECONDS))
+        client = self._client_factory()
+        try:
+            pipe = client.pipeline(transaction=False)
+            for text_hash in text_hashes:
+                pipe.set(self.key(model_name, text_hash), token, nx=True, ex=ttl)
+            results = await pipe.execute()
+        except Exception as exc:
+            print(f"[Embedding] Single-flight claim failed, embedding without deduplication: {exc}")
+            return text_hashes, [], token
+        owned = [h for h, ok in zip(text_hashes, results) if ok]
+        waiting = [h for h, ok in zip(text_hashes, results) if not ok]
+        return owned, waiting, token
+
+    async def release(self, model_name: str, text_hashes: Sequence[str], token: str) -> None:
+        if not self.enabled or not text_hashes:
+            return
+        client = self._client_factory()
+        try:
+            for begin in range(0, len(text_hashes), _KEYS_PER_CALL):
+                keys = [self.key(model_name, h) for h in text_hashes[begin:begin + _KEYS_PER_CALL]]
+                await client.eval(_RELEASE_SCRIPT, len(keys), *keys, token)
+        except Exception as exc:
+            # Claims expire on their own; waiters just wait a little longer.
+            print(f"[Embedding] Single-flight release failed: {exc}")
+
+    async def wait(self, model_name: str, text_hashes: Sequence[str]) -> Tuple[List[str], List[str]]:
+        """
+        Poll until other tasks release their claims. Returns (settled, timed_out): settled hashes
+        should now be in chunk_cache (unless their owner failed); timed_out ones are still claimed.
+        """
+        pending = list(text_hashes)
+        settled: List[str] = []
+        deadline = time.monotonic() + max(0.0, float(settings.EMBED_SINGLEFLIGHT_WAIT_SECONDS))
+        interval = max(0.01, settings.EMBED_SINGLEFLIGHT_POLL_MS / 1000.0)
+        client = self._client_factory()
+        try:
+            while pending:
+                pipe = client.pipeline(transaction=False)
+                for text_hash in pending:
+                    pipe.exists(self.key(model_name, text_hash))
+                still_claimed = await pipe.execute()
+                settled.extend(h for h, claimed in zip(pending, still_claimed) if not claimed)
+                pending = [h for h, claimed in zip(pending, still_claimed) if claimed]
+                if not pending or time.monotonic() >= deadline:
+                    break
+                await asyncio.sleep(interval)
+        except Exception as exc:
+            print(f"[Embedding] Single-flight wait failed: {exc}")
+        return settled, pending
+
+
+embedding_single_flight = EmbeddingSingleFlight()
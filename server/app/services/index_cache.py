@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.services.vector_store import load_notebook_index
+
+INDEX_VERSION_FILENAME = "index.version"
+
+
+def get_notebook_index_path(notebook_id: str) -> str:
+    return os.path.join(settings.VECTOR_STORE_DIR, notebook_id)
+
+
+def bump_index_version(index_path: str) -> str:
+    """
+    Write a fresh version stamp into the notebook index folder.
+    Every process holding a cached copy of the index sees the new stamp on its next lookup.
+    """
+    os.makedirs(index_path, exist_ok=True)
+    stamp = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    target = os.path.join(index_path, INDEX_VERSION_FILENAME)
+    tmp = f"{target}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(stamp)
+    os.replace(tmp, target)
+    return stamp
+
+
+def read_index_version(index_path: str) -> Optional[str]:
+    """
+    Return the current version stamp, or None when the folder holds no index.
+    Indexes persisted before stamps existed fall back to the newest file mtime.
+    """
+    try:
+        with open(os.path.join(index_path, INDEX_VERSION_FILENAME), "r", encoding="utf-8") as f:
+            stamp = f.read().strip()
+        if stamp:
+            return stamp
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return None
+
+    try:
+        entries = [e for e in os.scandir(index_path) if e.is_file()]
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if not entries:
+        return None
+    newest = max(e.stat().st_mtime_ns for e in entries)
+    return f"mtime-{newest}-{len(entries)}"
+
+
+class NotebookIndexCache:
+    """
+    Bounded LRU of loaded notebook indexes keyed by notebook_id.
+    Entries are validated against the on-disk version stamp on every lookup, and concurrent
+    lookups for the same notebook share a single load (single-flight).
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        loader: Callable[[str], Any] = load_notebook_index,
+        path_resolver: Callable[[str], str] = get_notebook_index_path,
+    ):
+        self.max_entries = max(1, int(max_entries))
+        self._loader = loader
+        self._path_resolver = path_resolver
+        self._entries: "OrderedDict[str, Tuple[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._hits = 0
+        self._misses = 0
+        self._loads = 0
+        self._load_failures = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._load_time_ms_total = 0.0
+        self._last_load_ms = 0.0
+
+    def _get_valid_entry(self, notebook_id: str, version: str):
+        entry = self._entries.get(notebook_id)
+        if entry is None:
+            return None
+        if entry[0] != version:
+            del self._entries[notebook_id]
+            self._invalidations += 1
+            return None
+        self._entries.move_to_end(notebook_id)
+        return entry[1]
+
+    def get(self, notebook_id: str):
+        """Return the loaded index for a notebook, or None when it has no index on disk."""
+        index_path = self._path_resolver(notebook_id)
+        version = read_index_version(index_path)
+        if version is None:
+            self.invalidate(notebook_id)
+            return None
+
+        with self._lock:
+            index = self._get_valid_entry(notebook_id, version)
+            if index is not None:
+                self._hits += 1
+                return index
+            load_lock = self._load_locks.setdefault(notebook_id, threading.Lock())
+
+        with load_lock:
+            # Another thread may have finished loading while we waited on the lock.
+            with self._lock:
+                index = self._get_valid_entry(notebook_id, version)
+                if index is not None:
+                    self._hits += 1
+                    return index
+                self._misses += 1
+
+            started_at = time.perf_counter()
+            try:
+                index = self._loader(index_path)
+            except Exception:
+                with self._lock:
+                    self._load_failures += 1
+                raise
+            elapsed_ms = (time.perf_counter() - started_at) * 1000.0
+
+            with self._lock:
+                self._loads += 1
+                self._load_time_ms_total += elapsed_ms
+                self._last_load_ms = elapsed_ms
+                self._entries[notebook_id] = (version, index)
+                self._entries.move_to_end(notebook_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._evictions += 1
+            return index
+
+    def invalidate(self, notebook_id: str) -> None:
+        with self._lock:
+            if self._entries.pop(notebook_id, None) is not None:
+                self._invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "loads": self._loads,
+                "load_failures": self._load_failures,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "load_time_ms_total": round(self._load_time_ms_total, 2),
+                "load_time_ms_avg": round(self._load_time_ms_total / self._loads, 2) if self._loads else 0.0,
+                "last_load_ms": round(self._last_load_ms, 2),
+            }
+
+
+notebook_index_cache = NotebookIndexCache(max_entries=settings.INDEX_CACHE_MAX_NOTEBOOKS)
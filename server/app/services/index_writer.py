@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, ContextManager, List, Optional, Sequence
+
+import numpy as np
+import redis
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+from app.core.config import settings
+from app.services.index_cache import bump_index_version, get_notebook_index_path
+from app.services.vector_store import (
+    NotebookVectorStore,
+    decode_row_line,
+    encode_row_line,
+    open_vector_file,
+    write_vector_file,
+)
+
+STAGING_DIRNAME = "staging"
+COMMITTED_SUFFIX = ".committed"
+# Markers whose owner never came back to collect them (crashed worker) are dropped after this.
+COMMIT_MARKER_MAX_AGE_SECONDS = 24 * 3600
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _prune_commit_markers(staging_dir: str) -> None:
+    cutoff = time.time() - COMMIT_MARKER_MAX_AGE_SECONDS
+    for entry in os.scandir(staging_dir):
+        if entry.name.endswith(COMMITTED_SUFFIX) and entry.stat().st_mtime < cutoff:
+            _remove_file(entry.path)
+
+
+_lock_client: Optional[redis.Redis] = None
+
+
+def _redis_lock_client() -> redis.Redis:
+    # One connection pool per worker process, shared by every lock it takes.
+    global _lock_client
+    if _lock_client is None:
+        _lock_client = redis.Redis.from_url(settings.REDIS_URL)
+    return _lock_client
+
+
+class _RenewingLock:
+    """
+    Holds a Redis lock and resets its TTL every `interval` seconds until released, so a commit
+    that outlasts the timeout (a large IVF retrain, a slow disk) keeps exclusive access. The TTL
+    still bounds how long a crashed holder blocks the notebook.
+    """
+
+    def __init__(self, lock, interval: float):
+        self._lock = lock
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        if not self._lock.acquire():
+            raise redis.exceptions.LockError(
+                "Unable to acquire lock within the time specified", lock_name=self._lock.name
+            )
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._renew, name="idxlock-renew", daemon=True)
+        self._thread.start()
+        return self
+
+    def _renew(self) -> None:
+        while not self._stop.wait(self._interval):
+            try:
+                self._lock.reacquire()
+            except redis.exceptions.LockError as exc:
+                print(f"[IndexWriter] Lost write lock {self._lock.name}: {exc}")
+                return
+            except redis.exceptions.RedisError as exc:
+                # Transient; the next tick retries while the current TTL still holds.
+                print(f"[IndexWriter] Failed to renew write lock {self._lock.name}: {exc}")
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._lock.release()
+
+
+def _redis_lock_factory(notebook_id: str) -> ContextManager:
+    timeout = max(1, int(settings.INDEX_WRITE_LOCK_TIMEOUT_SECONDS))
+    # Waiting up to twice the hold timeout covers one full commit by another writer plus our own turn.
+    lock = _redis_lock_client().lock(f"idxlock:{notebook_id}", timeout=timeout, blocking_timeout=timeout * 2)
+    return _RenewingLock(lock, interval=timeout / 3.0)
+
+
+class NotebookIndexWriter:
+    """
+    Serializes index writes per notebook across worker processes and coalesces commits.
+
+    Ingestion tasks stage their embedded nodes next to the notebook index, wait a short window,
+    then take the notebook's Redis lock. Whoever holds the lock commits every batch staged so
+    far in one load + insert + persist and leaves a `.committed` marker per batch; tasks whose
+    batch was already committed by another writer collect their marker and return without
+    touching the index. Parsing and embedding stay fully parallel.
+    """
+
+    def __init__(
+        self,
+        lock_factory: Callable[[str], ContextManager] = _redis_lock_factory,
+        path_resolver: Callable[[str], str] = get_notebook_index_path,
+    ):
+        self._lock_factory = lock_factory
+        self._path_resolver = path_resolver
+
+    @contextmanager
+    def lock(self, notebook_id: str):
+        """Exclusive write access to one notebook index (ingest commits, deletes, compaction)."""
+        lock = self._lock_factory(notebook_id)
+        started_at = time.perf_counter()
+        with lock:
+            waited_ms = (time.perf_counter() - started_at) * 1000.0
+            if waited_ms >= 1000.0:
+                print(f"[IndexWriter] Waited {waited_ms:.0f}ms for notebook {notebook_id} write lock")
+            yield
+
+    def _staging_dir(self, notebook_id: str) -> str:
+        return os.path.join(self._path_resolver(notebook_id), STAGING_DIRNAME)
+
+    def stage_nodes(self, notebook_id: str, batch_id: str, nodes: Sequence[BaseNode]) -> str:
+        """
+        Write embedded nodes as a staged batch (same .vec/.rows layout as index segments).
+        The .vec file is written last, so a batch is visible to writers only once complete.
+        """
+        staging_dir = self._staging_dir(notebook_id)
+        os.makedirs(staging_dir, exist_ok=True)
+        base = os.path.join(staging_dir, batch_id)
+        # A marker left by an earlier attempt of this batch must not vouch for the new one.
+        _remove_file(base + COMMITTED_SUFFIX)
+        dim = len(nodes[0].get_embedding()) if nodes else 0
+        vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32).reshape(len(nodes), dim)
+        lines = [
+            encode_row_line(node.node_id, node_to_metadata_dict(node, remove_text=False, flat_metadata=False))
+            for node in nodes
+        ]
+        tmp = f"{base}.rows.tmp"
+        with open(tmp, "wb") as f:
+            f.writelines(lines)
+        os.replace(tmp, f"{base}.rows")
+        write_vector_file(f"{base}.vec", vectors, settings.EMBED_MODEL_NAME)
+        return f"{base}.vec"
+
+    def discard_staged(self, notebook_id: str, batch_id: str) -> None:
+        base = os.path.join(self._staging_dir(notebook_id), batch_id)
+        for suffix in (".vec", ".rows", COMMITTED_SUFFIX):
+            _remove_file(base + suffix)
+
+    def _staged_batches(self, notebook_id: str) -> List[str]:
+        staging_dir = self._staging_dir(notebook_id)
+        try:
+            names = os.listdir(staging_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-len(".vec")] for name in names if name.endswith(".vec"))
+
+    def _commit_staged(self, notebook_id: str, batch_ids: List[str]) -> NotebookVectorStore:
+        index_path = self._path_resolver(notebook_id)
+        staging_dir = self._staging_dir(notebook_id)
+        store = NotebookVectorStore.from_persist_dir(index_path)
+        for batch_id in batch_ids:
+            base = os.path.join(staging_dir, batch_id)
+            _, vectors = open_vector_file(f"{base}.vec")
+            with open(f"{base}.rows", "rb") as f:
+                records = [decode_row_line(line) for line in f if line.strip()]
+            store.add_rows([r[0] for r in records], np.array(vectors), [r[1] for r in records])
+            del vectors
+        store.persist()
+        bump_index_version(index_path)
+        _prune_commit_markers(staging_dir)
+        for batch_id in batch_ids:
+            base = os.path.join(staging_dir, batch_id)
+            # The marker goes first: a staged batch is never gone without a record of its commit.
+            open(base + COMMITTED_SUFFIX, "wb").close()
+            _remove_file(base + ".vec")
+            _remove_file(base + ".rows")
+        return store
+
+    def convert_legacy(self, notebook_id: str) -> bool:
+        """
+        Rewrite a legacy llama_index folder as segments under the notebook lock.
+        Returns True when a conversion was performed.
+        """
+        index_path = self._path_resolver(notebook_id)
+        with self.lock(notebook_id):
+            store = NotebookVectorStore.from_persist_dir(index_path)
+            if not store.is_legacy:
+                return False
+            store.persist()
+            bump_index_version(index_path)
+        return True
+
+    def commit_nodes(
+        self,
+        notebook_id: str,
+        batch_id: str,
+        nodes: Sequence[BaseNode],
+        window_ms: Optional[int] = None,
+    ) -> dict:
+        """
+        Stage `nodes` and make sure they are committed to the notebook index before returning.
+        Returns commit details; `store` is the committed store when this call did the commit.
+        """
+        staged_path = self.stage_nodes(notebook_id, batch_id, nodes)
+        window_ms = settings.INDEX_COMMIT_WINDOW_MS if window_ms is None else window_ms
+        if window_ms > 0:
+            # Let other documents finishing at the same time stage theirs and share this commit.
+            time.sleep(window_ms / 1000.0)
+
+        marker_path = os.path.join(self._staging_dir(notebook_id), batch_id + COMMITTED_SUFFIX)
+        with self.lock(notebook_id):
+            if not os.path.exists(staged_path):
+                if not os.path.exists(marker_path):
+                    # Removed without being committed, e.g. the notebook index was deleted meanwhile.
+                    raise RuntimeError(f"Staged batch {batch_id} of notebook {notebook_id} vanished before commit")
+                _remove_file(marker_path)
+                return {"committed_by_other": True, "batches": 0, "nodes": len(nodes), "store": None}
+            batch_ids = self._staged_batches(notebook_id)
+            started_at = time.perf_counter()
+            try:
+                store = self._commit_staged(notebook_id, batch_ids)
+            except Exception:
+                # Our document is about to be marked failed; no later writer may commit its nodes.
+                self.discard_staged(notebook_id, batch_id)
+                raise
+            _remove_file(marker_path)
+            elapsed_ms = (time.perf_counter() - started_at) * 1000.0
+
+        print(
+            f"[IndexWriter] Committed {len(batch_ids)} staged batch(es) to notebook {notebook_id} "
+            f"in {elapsed_ms:.0f}ms ({store.live_count} nodes)"
+        )
+        return {"committed_by_other": False, "batches": len(batch_ids), "nodes": len(nodes), "store": store}
+
+
+notebook_index_writer = NotebookIndexWriter()
@@ -0,0 +1,156 @@
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+from app.core.config import settings
+from app.services.vector_store import decode_row_line, encode_row_line, open_vector_file, write_vector_file
+
+CHECKPOINT_FORMAT_VERSION = 1
+STAGE_CHUNKED = "chunked"
+STAGE_EMBEDDED = "embedded"
+
+_STATE_FILENAME = "state.json"
+_ROWS_FILENAME = "nodes.rows"
+_VECTORS_FILENAME = "nodes.vec"
+
+
+@dataclass
+class IngestCheckpoint:
+    stage: str
+    nodes: List[BaseNode]
+    detail: dict = field(default_factory=dict)
+
+
+class IngestCheckpointStore:
+    """
+    Stage outputs of one document's ingestion, kept so a Celery retry resumes instead of
+    starting over.
+
+    `{dir}/{doc_id}/` holds the chunk list (`nodes.rows`, same row encoding as index segments),
+    the vectors once embedding finished (`nodes.vec`) and `state.json`, which is written last and
+    names the completed stage. A checkpoint only applies to the same artifact under the same index
+    fingerprint and expires after `INGEST_CHECKPOINT_TTL_HOURS`. Parsed pages are not stored here:
+    chunking consumes them as they stream, and the parse cache already keeps them per artifact.
+    """
+
+    def __init__(self, base_dir: Optional[str] = None):
+        self._base_dir = base_dir
+
+    @property
+    def base_dir(self) -> str:
+        return self._base_dir or settings.INGEST_CHECKPOINT_DIR
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.INGEST_CHECKPOINT_ENABLED)
+
+    def _dir(self, doc_id: str) -> str:
+        return os.path.join(self.base_dir, doc_id)
+
+    def load(self, doc_id: str, file_hash: str, fingerprint: str) -> Optional[IngestCheckpoint]:
+        if not self.enabled:
+            return None
+        state_path = os.path.join(self._dir(doc_id), _STATE_FILENAME)
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            print(f"[Checkpoint] Ignoring unreadable checkpoint of {doc_id}: {exc}")
+            self.clear(doc_id)
+            return None
+
+        max_age = max(0.0, float(settings.INGEST_CHECKPOINT_TTL_HOURS)) * 3600.0
+        if (
+            state.get("v") != CHECKPOINT_FORMAT_VERSION
+            or state.get("file_hash") != file_hash
+            or state.get("fingerprint") != fingerprint
+            or time.time() - float(state.get("saved_at", 0)) > max_age
+        ):
+            self.clear(doc_id)
+            return None
+
+        try:
+            nodes = self._read_nodes(doc_id, with_vectors=state["stage"] == STAGE_EMBEDDED)
+        except (OSError, ValueError, KeyError) as exc:
+            print(f"[Checkpoint] Ignoring damaged checkpoint of {doc_id}: {exc}")
+            self.clear(doc_id)
+            return None
+        return IngestCheckpoint(stage=state["stage"], nodes=nodes, detail=state.get("detail") or {})
+
+    def _read_nodes(self, doc_id: str, with_vectors: bool) -> List[BaseNode]:
+        base = self._dir(doc_id)
+        with open(os.path.join(base, _ROWS_FILENAME), "rb") as f:
+            nodes = [metadata_dict_to_node(decode_row_line(line)[1]) for line in f if line.strip()]
+        if with_vectors:
+            _, vectors = open_vector_file(os.path.join(base, _VECTORS_FILENAME))
+            if len(vectors) != len(nodes):
+                raise ValueError("vector count does not match the chunk list")
+            for node, vector in zip(nodes, vectors):
+                node.embedding = vector.tolist()
+            del vectors
+        return nodes
+
+    def save(
+        self,
+        doc_id: str,
+        file_hash: str,
+        fingerprint: str,
+        stage: str,
+        nodes: Sequence[BaseNode],
+        detail: Optional[dict] = None,
+    ) -> None:
+        """Record `stage` as completed. Failures are logged only: a checkpoint is an optimization."""
+        if not self.enabled:
+            return
+        base = self._dir(doc_id)
+        try:
+            os.makedirs(base, exist_ok=True)
+            # The state goes first so a crash mid-write leaves no checkpoint rather than a mismatched one.
+            self._remove(os.path.join(base, _STATE_FILENAME))
+            tmp = os.path.join(base, f"{_ROWS_FILENAME}.tmp")
+            with open(tmp, "wb") as f:
+                f.writelines(
+                    encode_row_line(node.node_id, node_to_metadata_dict(node, remove_text=False, flat_metadata=False))
+                    for node in nodes
+                )
+            os.replace(tmp, os.path.join(base, _ROWS_FILENAME))
+            if stage == STAGE_EMBEDDED:
+                dim = len(nodes[0].get_embedding()) if nodes else 0
+                vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32).reshape(len(nodes), dim)
+                write_vector_file(os.path.join(base, _VECTORS_FILENAME), vectors, settings.EMBED_MODEL_NAME)
+            state = {
+                "v": CHECKPOINT_FORMAT_VERSION,
+                "stage": stage,
+                "file_hash": file_hash,
+                "fingerprint": fingerprint,
+                "saved_at": time.time(),
+                "detail": detail or {},
+            }
+            tmp = os.path.join(base, f"{_STATE_FILENAME}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp, os.path.join(base, _STATE_FILENAME))
+        except (OSError, ValueError) as exc:
+            print(f"[Checkpoint] Failed to save {stage} checkpoint of {doc_id}: {exc}")
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self, doc_id: str) -> None:
+        shutil.rmtree(self._dir(doc_id), ignore_errors=True)
+
+
+ingest_checkpoints = IngestCheckpointStore()
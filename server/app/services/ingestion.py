@@ -1,24 +1,30 @@
+import asyncio
+import contextlib
 import os
 import json
+import shutil
 import redis.asyncio as redis
 from sqlalchemy import select
 
-from llama_index.core import (
-    VectorStoreIndex,
-    StorageContext,
-    load_index_from_storage,
-    Settings
-)
+from llama_index.core import Settings
 from llama_index.core.node_parser import SentenceSplitter
 
 from app.core.config import settings
 from app.db.session import AsyncSessionLocal
-from app.models.document import Document, DocStatus
+from app.models.document import DEFAULT_DOCUMENT_EMOJI, Document, DocStatus
 from app.models.artifact import Artifact
 from app.services.storage import storage_service
 from app.services.smart_embedding import SmartEmbeddingManager
+from app.services.chunk_cache_gc import claim_gc_slot
 from app.services.classifier import classifier_service
+from app.services.dashscope_client import dashscope_client
 from app.services.document_parser import DocumentParserRegistry
+from app.services.index_cache import bump_index_version, notebook_index_cache
+from app.services.index_writer import notebook_index_writer
+from app.services.ingest_checkpoint import STAGE_CHUNKED, STAGE_EMBEDDED, ingest_checkpoints
+from app.services.ingestion_stream import BackgroundClassification, StreamingChunkEmbedder, aiter_in_thread
+from app.services.node_cloning import clone_source_nodes, index_fingerprint
+from app.services.vector_store import MANIFEST_FILENAME, NotebookVectorStore
 
 class IngestionService:
     def __init__(self):
@@ -75,9 +81,12 @@ class IngestionService:
 
             # Update Status -> PROCESSING
             doc_record.status = DocStatus.PROCESSING
+            doc_record.index_fingerprint = None
             await db.commit()
             await self._set_progress(r, doc_id, 0.06, "loading", "读取文件中")
             parse_detail = None
+            # Picking the emoji is an LLM round trip; it runs alongside chunking / embedding.
+            classification = BackgroundClassification(classifier_service.classify_text)
 
             try:
                 # 2. Fetch Artifact (Physical File)
@@ -90,105 +99,77 @@ class IngestionService:
                 
                 await self._set_progress(r, doc_id, 0.12, "loading", "文件已加载")
 
-                file_path = storage_service.get_file(artifact.hash)
-                await self._set_progress(r, doc_id, 0.18, "parsing", "解析文档中")
-
-                # 3. Load & Parse (text/pdf parser is selected by filename extension)
-                llama_docs, parse_stats = self.document_parser.parse(
-                    file_path=file_path,
-                    filename=doc_record.filename,
-                )
-                
-                # Classify
-                await self._set_progress(r, doc_id, 0.22, "classifying", "文档分类中")
-                full_text = "\n".join([d.text for d in llama_docs[:5]]) # First 5 pages/chunks
-                doc_record.emoji = await classifier_service.classify_text(full_text)
-                await db.commit()
-                await self._set_progress(
-                    r,
-                    doc_id,
-                    0.30,
-                    "parsed",
-                    "解析完成",
-                    parse_stats.to_detail(),
-                )
-                parse_detail = parse_stats.to_detail()
-
-                # Attach Metadata
-                for d in llama_docs:
-                    d.metadata["source_file_id"] = doc_id
-                    d.metadata["notebook_id"] = doc_record.notebook_id
-                    d.metadata["filename"] = doc_record.filename
-
-                    # CRITICAL: Exclude dynamic metadata from Embedding
-                    for key in (
-                        "source_file_id",
-                        "notebook_id",
-                        "filename",
-                        "page_number",
-                        "source_parser",
-                        "ocr_used",
-                        "vision_used",
-                        "vision_images",
-                        "image_ratio",
-                        "vector_ratio",
-                    ):
-                        if key not in d.excluded_embed_metadata_keys:
-                            d.excluded_embed_metadata_keys.append(key)
-                    for key in ("source_file_id", "notebook_id"):
-                        if key not in d.excluded_llm_metadata_keys:
-                            d.excluded_llm_metadata_keys.append(key)
-
-                # 4. Chunking
-                nodes = self.splitter.get_nodes_from_documents(llama_docs)
-                total_nodes = len(nodes)
-                await self._set_progress(
-                    r, doc_id, 0.38, "chunking", "切分 Chunk 完成", {"total_chunks": total_nodes}
+                fingerprint = index_fingerprint(
+                    self.splitter, self.document_parser.config_fingerprint(doc_record.filename)
                 )
-                
-                # 5. Smart Embedding (Deduplication + API)
-                async def _update_embed_prog(processed, total_needed):
-                    ratio = (processed / total_needed) if total_needed else 1.0
-                    progress = 0.40 + (0.45 * ratio)  # 0.40 -> 0.85
+                # A retry of this task resumes from the last stage the previous attempt completed.
+                checkpoint = await asyncio.to_thread(ingest_checkpoints.load, doc_id, artifact.hash, fingerprint)
+                resumed_from = checkpoint.stage if checkpoint is not None else None
+                if checkpoint is not None:
+                    print(f"[Ingestion] Resuming {doc_id} from {checkpoint.stage} checkpoint ({len(checkpoint.nodes)} chunks)")
                     await self._set_progress(
-                        r,
-                        doc_id,
-                        progress,
-                        "embedding",
-                        f"计算向量中 ({processed}/{total_needed})",
-                        {"embedded_chunks": processed, "total_chunks": total_needed},
+                        r, doc_id, 0.18, "resuming", f"从检查点恢复 ({checkpoint.stage})", {"resumed_from": checkpoint.stage}
                     )
+                    # The previous attempt may have failed before its classification finished.
+                    if doc_record.emoji in (None, DEFAULT_DOCUMENT_EMOJI):
+                        classification.start("\n".join(n.get_content() for n in checkpoint.nodes[:5]))
+
+                if checkpoint is not None and checkpoint.stage == STAGE_EMBEDDED:
+                    nodes, parse_detail = checkpoint.nodes, checkpoint.detail
+                    await self._set_progress(
+                        r, doc_id, 0.86, "embedding_done", "向量计算完成", {"resumed_from": STAGE_EMBEDDED}
+                    )
+                elif checkpoint is not None:
+                    parse_detail = checkpoint.detail
+                    nodes = await self._embed_checkpointed(
+                        r, doc_record, artifact, fingerprint, checkpoint.nodes, parse_detail
+                    )
+                else:
+                    cloned = await self._clone_from_sibling(db, r, doc_record, fingerprint)
+                    if cloned is not None:
+                        nodes, parse_detail = cloned
+                    else:
+                        nodes, parse_detail = await self._parse_chunk_embed(
+                            r, doc_record, artifact, fingerprint, classification
+                        )
 
-                await self.embedding_manager.batch_embed_nodes(nodes, progress_callback=_update_embed_prog)
-                await self._set_progress(r, doc_id, 0.86, "embedding_done", "向量计算完成")
-                
                 # 6. Indexing (Persistence)
-                # We lock the index by notebook_id (file-based lock implicit in OS)
-                index_path = self._get_index_path(doc_record.notebook_id)
-                
-                # Check if index exists
-                try:
-                    storage_context = StorageContext.from_defaults(persist_dir=index_path)
-                    index = load_index_from_storage(storage_context)
-                    index.insert_nodes(nodes)
-                except (FileNotFoundError, ValueError):
-                    # Create new index
-                    storage_context = StorageContext.from_defaults()
-                    index = VectorStoreIndex(nodes, storage_context=storage_context)
-                
-                # Persist
+                # Nodes are staged and committed under the notebook's write lock; documents that
+                # finish within the commit window share one segment append.
+                self._get_index_path(doc_record.notebook_id)
                 await self._set_progress(r, doc_id, 0.92, "indexing", "写入索引中")
-                index.storage_context.persist(persist_dir=index_path)
+                commit = await asyncio.to_thread(
+                    notebook_index_writer.commit_nodes, doc_record.notebook_id, doc_id, nodes
+                )
+                if commit["store"] is not None:
+                    self._schedule_compaction(doc_record.notebook_id, commit["store"])
 
                 # 7. Finalize
+                # READY never waits for the classifier; a late emoji is stored after the progress is done.
+                doc_record.emoji = classification.result() or doc_record.emoji
                 doc_record.status = DocStatus.READY
+                # Pages degraded by failed OCR / vision calls must not be cloned into other notebooks.
+                degraded = bool((parse_detail or {}).get("failed_provider_calls"))
+                doc_record.index_fingerprint = None if degraded else fingerprint
                 await db.commit()
+                await asyncio.to_thread(ingest_checkpoints.clear, doc_id)
+                if resumed_from:
+                    parse_detail = {**(parse_detail or {}), "resumed_from": resumed_from}
                 await self._set_progress(r, doc_id, 1.0, "done", "处理完成", detail=parse_detail)
                 await r.expire(f"prog:{doc_id}", 3600) # Clean up later
+                await self._schedule_cache_gc(r)
                 print(f"Ingestion successful for {doc_id}")
+                print(f"[DashScope] HTTP connections: {dashscope_client.summary()}")
+                if classification.pending:
+                    await self._store_late_emoji(db, doc_record, classification)
 
             except Exception as e:
                 print(f"Ingestion Failed: {e}")
+                # A batch left staged (e.g. lock wait failed) must not be committed later by another writer.
+                notebook_index_writer.discard_staged(doc_record.notebook_id, doc_id)
+                # Keep a finished classification for the retry; drop one still in flight.
+                doc_record.emoji = classification.result() or doc_record.emoji
+                classification.cancel()
                 doc_record.status = DocStatus.FAILED
                 doc_record.error_msg = str(e)
                 await db.commit()
@@ -197,35 +178,321 @@ class IngestionService:
             finally:
                 await r.close()
 
+    async def _store_late_emoji(self, db, doc_record: Document, classification: BackgroundClassification) -> None:
+        emoji = await classification.wait()
+        if not emoji:
+            return
+        try:
+            doc_record.emoji = emoji
+            await db.commit()
+        except Exception as e:
+            print(f"[Ingestion] Failed to store emoji for {doc_record.id}: {e}")
+
+    async def _clone_from_sibling(self, db, r, doc_record: Document, fingerprint: str):
+        """
+        Reuse the nodes of the same artifact already READY in another notebook under the same
+        parser / chunking / embedding config. Returns (nodes, detail) or None to run the full pipeline.
+        """
+        stmt = (
+            select(Document)
+            .where(
+                Document.file_hash == doc_record.file_hash,
+                Document.index_fingerprint == fingerprint,
+                Document.status == DocStatus.READY,
+                Document.id != doc_record.id,
+            )
+            .order_by(Document.updated_at.desc())
+        )
+        siblings = (await db.execute(stmt)).scalars().all()
+        for sibling in siblings:
+            try:
+                nodes = await asyncio.to_thread(
+                    clone_source_nodes,
+                    sibling.notebook_id,
+                    sibling.id,
+                    doc_record.notebook_id,
+                    doc_record.id,
+                    doc_record.filename,
+                )
+            except Exception as e:
+                print(f"[Ingestion] Cannot clone nodes from {sibling.id}: {e}")
+                continue
+            if not nodes:
+                continue
+
+            doc_record.emoji = sibling.emoji
+            await db.commit()
+            detail = {"cloned_from": sibling.id, "cloned_notebook": sibling.notebook_id, "total_chunks": len(nodes)}
+            print(f"[Ingestion] Cloned {len(nodes)} nodes for {doc_record.id} from notebook {sibling.notebook_id}")
+            await self._set_progress(r, doc_record.id, 0.86, "embedding_done", "已复用其他笔记本中的索引", detail)
+            return nodes, detail
+        return None
+
+    async def _embed_checkpointed(
+        self, r, doc_record: Document, artifact: Artifact, fingerprint: str, nodes, parse_detail
+    ):
+        """
+        Embed a chunk list restored from a checkpoint (mostly cache hits for the batches done before).
+        `parse_detail` is carried into the embedded checkpoint so a second resume still reports it.
+        """
+        doc_id = doc_record.id
+
+        async def _update_embed_prog(processed, total_chunks):
+            ratio = (processed / total_chunks) if total_chunks else 1.0
+            await self._set_progress(
+                r,
+                doc_id,
+                0.30 + 0.55 * ratio,
+                "embedding",
+                f"计算向量中 ({processed}/{total_chunks})",
+                {"embedded_chunks": processed, "total_chunks": total_chunks, "resumed_from": STAGE_CHUNKED},
+            )
+
+        embed_stats = await self.embedding_manager.batch_embed_nodes(nodes, progress_callback=_update_embed_prog)
+        await asyncio.to_thread(
+            ingest_checkpoints.save, doc_id, artifact.hash, fingerprint, STAGE_EMBEDDED, nodes, parse_detail
+        )
+        await self._set_progress(
+            r,
+            doc_id,
+            0.86,
+            "embedding_done",
+            "向量计算完成",
+            {"embedding_cache": embed_stats, "resumed_from": STAGE_CHUNKED},
+        )
+        return nodes
+
+    async def _parse_chunk_embed(
+        self,
+        r,
+        doc_record: Document,
+        artifact: Artifact,
+        fingerprint: str,
+        classification: BackgroundClassification,
+    ):
+        """Full pipeline for a new artifact: returns the embedded nodes and the parse detail."""
+        doc_id = doc_record.id
+        file_path = storage_service.get_file(artifact.hash)
+        await self._set_progress(r, doc_id, 0.18, "parsing", "解析文档中")
+
+        # 3-5. Parse -> chunk -> embed as a stream: pages are parsed in a worker thread and
+        # handed over through a bounded queue, chunked one page at a time, and embedding
+        # batches are dispatched while later pages (and their OCR / vision calls) are still running.
+        # Opening a parse cache entry touches the disk; keep it off the event loop.
+        page_iter, parse_stats = await asyncio.to_thread(
+            self.document_parser.iter_pages,
+            file_path=file_path,
+            filename=doc_record.filename,
+            content_hash=artifact.hash,
+        )
+        progress_floor = 0.18
+
+        async def _report(stage: str, message: str, detail: dict, progress: float):
+            nonlocal progress_floor
+            progress_floor = max(progress_floor, min(progress, 0.85))
+            await self._set_progress(r, doc_id, progress_floor, stage, message, detail)
+
+        async def _update_embed_prog(processed, total_chunks):
+            pages_ratio = (pages_seen / parse_stats.total_pages) if parse_stats.total_pages else 0.0
+            ratio = (processed / total_chunks) if total_chunks else 1.0
+            await _report(
+                "embedding",
+                f"计算向量中 ({processed}/{total_chunks})",
+                {"embedded_chunks": processed, "total_chunks": total_chunks},
+                0.30 + 0.55 * min(pages_ratio, ratio),  # 0.30 -> 0.85
+            )
+
+        embedder = StreamingChunkEmbedder(
+            splitter=self.splitter,
+            embed_nodes=self.embedding_manager.batch_embed_nodes,
+            batch_nodes=settings.INGEST_EMBED_BATCH_NODES,
+            max_pending=settings.INGEST_EMBED_MAX_PENDING_BATCHES,
+            on_progress=_update_embed_prog,
+        )
+        classify_pages: list[str] = []
+        pages_seen = 0
+
+        try:
+            async with contextlib.aclosing(
+                aiter_in_thread(lambda: page_iter, settings.INGEST_PAGE_QUEUE_SIZE)
+            ) as pages:
+                async for d in pages:
+                    pages_seen += 1
+                    self._attach_metadata(d, doc_id, doc_record)
+
+                    # Classify on the first 5 pages, without waiting for the answer
+                    if not classification.started:
+                        classify_pages.append(d.text)
+                        if len(classify_pages) >= 5:
+                            classification.start("\n".join(classify_pages))
+
+                    await embedder.add_document(d)
+                    total_pages = parse_stats.total_pages or pages_seen
+                    await _report(
+                        "parsing",
+                        f"解析文档中 ({pages_seen}/{total_pages})",
+                        {"parsed_pages": pages_seen, "total_pages": total_pages, "total_chunks": len(embedder.nodes)},
+                        0.18 + 0.12 * (pages_seen / total_pages),
+                    )
+
+            if not classification.started:
+                classification.start("\n".join(classify_pages))
+
+            parse_detail = parse_stats.to_detail()
+            await asyncio.to_thread(
+                ingest_checkpoints.save, doc_id, artifact.hash, fingerprint, STAGE_CHUNKED, embedder.nodes, parse_detail
+            )
+            await self._set_progress(
+                r,
+                doc_id,
+                progress_floor,
+                "chunking",
+                "切分 Chunk 完成",
+                {**parse_detail, "total_chunks": len(embedder.nodes)},
+            )
+            embed_stats = await embedder.finish()
+        except BaseException:
+            await embedder.aclose()
+            raise
+
+        await asyncio.to_thread(
+            ingest_checkpoints.save, doc_id, artifact.hash, fingerprint, STAGE_EMBEDDED, embedder.nodes, parse_detail
+        )
+        await self._set_progress(
+            r, doc_id, 0.86, "embedding_done", "向量计算完成", {"embedding_cache": embed_stats}
+        )
+        return embedder.nodes, parse_detail
+
+    @staticmethod
+    def _attach_metadata(d, doc_id: str, doc_record: Document) -> None:
+        d.metadata["source_file_id"] = doc_id
+        d.metadata["notebook_id"] = doc_record.notebook_id
+        d.metadata["filename"] = doc_record.filename
+
+        # CRITICAL: Exclude dynamic metadata from Embedding
+        for key in (
+            "source_file_id",
+            "notebook_id",
+            "filename",
+            "page_number",
+            "source_parser",
+            "ocr_used",
+            "vision_used",
+            "vision_images",
+            "image_ratio",
+            "vector_ratio",
+        ):
+            if key not in d.excluded_embed_metadata_keys:
+                d.excluded_embed_metadata_keys.append(key)
+        for key in ("source_file_id", "notebook_id"):
+            if key not in d.excluded_llm_metadata_keys:
+                d.excluded_llm_metadata_keys.append(key)
+
+    def _schedule_compaction(self, notebook_id: str, store: NotebookVectorStore) -> None:
+        if not store.needs_compaction():
+            return
+        try:
+            from app.worker.tasks import compact_notebook_index_task
+
+            compact_notebook_index_task.delay(notebook_id)
+        except Exception as e:
+            print(f"[Ingestion] Failed to schedule index compaction for {notebook_id}: {e}")
+
+    async def _schedule_cache_gc(self, r) -> None:
+        try:
+            if not await claim_gc_slot(r):
+                return
+            from app.worker.tasks import gc_chunk_cache_task
+
+            gc_chunk_cache_task.delay()
+        except Exception as e:
+            print(f"[Ingestion] Failed to schedule chunk cache GC: {e}")
+
+    def _has_index(self, index_path: str) -> bool:
+        return os.path.exists(os.path.join(index_path, MANIFEST_FILENAME)) or os.path.exists(
+            os.path.join(index_path, "docstore.json")
+        )
+
     async def delete_document(self, notebook_id: str, doc_id: str):
         """
         Removes all nodes associated with a doc_id from the notebook's vector index.
         """
+        await self.delete_documents(notebook_id, [doc_id])
+
+    async def delete_documents(self, notebook_id: str, doc_ids: list[str], compact: bool = False) -> int:
+        """
+        Remove the nodes of several documents with one index load and one persist.
+        Node rows are looked up through the index's source postings (source_file_id -> rows)
+        and tombstoned in a single batch. With `compact=True` the index is rewritten once
+        right away instead of leaving it to the background compaction task.
+        Returns the number of nodes removed.
+        """
         index_path = self._get_index_path(notebook_id)
-        if not os.path.exists(os.path.join(index_path, "docstore.json")):
-            return
+        if not doc_ids or not self._has_index(index_path):
+            return 0
+
+        def _delete() -> int:
+            with notebook_index_writer.lock(notebook_id):
+                store = NotebookVectorStore.from_persist_dir(index_path)
+                removed = store.delete_sources(doc_ids)
+                if not removed:
+                    print(f"[Ingestion] No nodes found in index for docs {doc_ids}")
+                    return 0
+
+                print(f"[Ingestion] Deleting {removed} nodes for {len(doc_ids)} doc(s) in notebook {notebook_id}")
+                if compact:
+                    store.compact()
+                else:
+                    store.persist()
+                bump_index_version(index_path)
+            if not compact:
+                self._schedule_compaction(notebook_id, store)
+            return removed
 
         try:
-            storage_context = StorageContext.from_defaults(persist_dir=index_path)
-            index = load_index_from_storage(storage_context)
-            
-            docstore = index.docstore
-            all_docs = docstore.docs
-            nodes_to_delete = []
-            
-            for node_id, node in all_docs.items():
-                metadata = node.metadata
-                if metadata.get("source_file_id") == doc_id or metadata.get("doc_id") == doc_id:
-                    nodes_to_delete.append(node_id)
-            
-            if nodes_to_delete:
-                print(f"[Ingestion] Deleting {len(nodes_to_delete)} nodes for doc {doc_id}")
-                for node_id in nodes_to_delete:
-                    index.delete_nodes([node_id], delete_from_docstore=True)
-                index.storage_context.persist(persist_dir=index_path)
-            else:
-                print(f"[Ingestion] No nodes found in index for doc {doc_id}")
+            return await asyncio.to_thread(_delete)
         except Exception as e:
             print(f"[Ingestion] Failed to delete nodes from index: {e}")
+            return 0
+
+    def delete_notebook_index(self, notebook_id: str) -> bool:
+        """
+        Drop a notebook's whole vector index. Returns True when an index existed.
+        """
+        index_path = os.path.join(settings.VECTOR_STORE_DIR, notebook_id)
+        if not os.path.isdir(index_path):
+            return False
+
+        # Release this process's mapped segments before removing the files.
+        notebook_index_cache.invalidate(notebook_id)
+        with notebook_index_writer.lock(notebook_id):
+            try:
+                shutil.rmtree(index_path)
+            except OSError as e:
+                # Another process may still map segment files (Windows); empty the index instead.
+                print(f"[Ingestion] Could not remove index folder for notebook {notebook_id}: {e}")
+                store = NotebookVectorStore.from_persist_dir(index_path)
+                store.clear()
+                store.compact()
+                bump_index_version(index_path)
+        print(f"[Ingestion] Removed vector index for notebook {notebook_id}")
+        return True
+
+    def compact_index(self, notebook_id: str) -> bool:
+        """
+        Fold all segments of a notebook index into one and drop tombstones.
+        Returns True when a compaction was performed.
+        """
+        index_path = self._get_index_path(notebook_id)
+        if not os.path.exists(os.path.join(index_path, MANIFEST_FILENAME)):
+            return False
+        with notebook_index_writer.lock(notebook_id):
+            store = NotebookVectorStore.from_persist_dir(index_path)
+            if not store.needs_compaction():
+                return False
+            store.compact()
+            bump_index_version(index_path)
+        print(f"[Ingestion] Compacted index for notebook {notebook_id} ({store.live_count} nodes)")
+        return True
 
 ingestion_service = IngestionService()
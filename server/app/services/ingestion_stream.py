@@ -0,0 +1,207 @@
+import asyncio
+import threading
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List, Optional, TypeVar
+
+from llama_index.core.node_parser import NodeParser
+from llama_index.core.schema import BaseNode, Document
+
+T = TypeVar("T")
+_END = object()
+
+# Counters summed across embedding batches; cache snapshots are taken from the last batch.
+_SUMMED_EMBED_STATS = (
+    "unique_chunks",
+    "memory_hits",
+    "redis_hits",
+    "db_hits",
+    "api_embedded",
+    "singleflight_waited",
+    "singleflight_reused",
+)
+
+
+async def aiter_in_thread(make_iterator: Callable[[], Iterator[T]], maxsize: int) -> AsyncIterator[T]:
+    """
+    Drive a blocking iterator (e.g. a PDF page generator doing OCR calls) in a worker thread and
+    yield its items on the event loop. The hand-off queue holds at most `maxsize` items; when it
+    is full the producer thread blocks, so a slow consumer throttles parsing instead of buffering
+    the whole document. Producer exceptions are re-raised here.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, int(maxsize)))
+    stop = threading.Event()
+
+    def _put(item, exc=None) -> None:
+        asyncio.run_coroutine_threadsafe(queue.put((item, exc)), loop).result()
+
+    def _produce() -> None:
+        iterator = make_iterator()
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    return
+                _put(item)
+            _put(_END)
+        except BaseException as exc:
+            if not stop.is_set():
+                _put(_END, exc)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    producer = asyncio.ensure_future(asyncio.to_thread(_produce))
+    try:
+        while True:
+            item, exc = await queue.get()
+            if item is _END:
+                if exc is not None:
+                    raise exc
+                break
+            yield item
+    finally:
+        stop.set()
+        # Unblock a producer waiting on a full queue, then let it observe `stop`.
+        while not producer.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0.01)
+        await producer
+
+
+def merge_embed_stats(batches: List[dict]) -> dict:
+    merged = {key: 0 for key in _SUMMED_EMBED_STATS}
+    for stats in batches:
+        for key in _SUMMED_EMBED_STATS:
+            merged[key] += int(stats.get(key, 0) or 0)
+    unique = merged["unique_chunks"]
+    merged["memory_hit_ratio"] = round(merged["memory_hits"] / unique, 4) if unique else 0.0
+    merged["embed_batches"] = len(batches)
+    for key in ("memory_cache", "redis_cache"):
+        if batches and key in batches[-1]:
+            merged[key] = batches[-1][key]
+    return merged
+
+
+class StreamingChunkEmbedder:
+    """
+    Chunk documents as they arrive and embed them in batches while later pages are still parsing.
+
+    Each document is split on its own (SentenceSplitter never joins text across documents, so the
+    chunks match splitting the whole list at once). Every `batch_nodes` chunks an embedding batch
+    is started in the background; at most `max_pending` batches run at a time and `add_document()`
+    waits for a free slot, which back-pressures the page queue feeding it.
+    """
+
+    def __init__(
+        self,
+        splitter: NodeParser,
+        embed_nodes: Callable[[List[BaseNode]], Awaitable[dict]],
+        batch_nodes: int,
+        max_pending: int,
+        on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+    ):
+        self._splitter = splitter
+        self._embed_nodes = embed_nodes
+        self._batch_nodes = max(1, int(batch_nodes))
+        self._slots = asyncio.Semaphore(max(1, int(max_pending)))
+        self._on_progress = on_progress
+        self._buffer: List[BaseNode] = []
+        self._tasks: List[asyncio.Task] = []
+        self._batch_stats: List[dict] = []
+        self._error: Optional[BaseException] = None
+        self.nodes: List[BaseNode] = []
+        self.embedded = 0
+
+    async def add_document(self, document: Document) -> int:
+        """Chunk one document and dispatch full batches. Returns the number of chunks it produced."""
+        nodes = self._splitter.get_nodes_from_documents([document])
+        self.nodes.extend(nodes)
+        self._buffer.extend(nodes)
+        while len(self._buffer) >= self._batch_nodes:
+            batch, self._buffer = self._buffer[:self._batch_nodes], self._buffer[self._batch_nodes:]
+            await self._dispatch(batch)
+        return len(nodes)
+
+    async def _dispatch(self, batch: List[BaseNode]) -> None:
+        await self._slots.acquire()
+        if self._error is not None:
+            self._slots.release()
+            raise self._error
+        self._tasks.append(asyncio.create_task(self._run(batch)))
+
+    async def _run(self, batch: List[BaseNode]) -> None:
+        try:
+            self._batch_stats.append(await self._embed_nodes(batch))
+            self.embedded += len(batch)
+            if self._on_progress:
+                await self._on_progress(self.embedded, len(self.nodes))
+        except Exception as exc:
+            # Surfaced by the next dispatch or by finish(); keeping it here avoids an unretrieved task exception.
+            if self._error is None:
+                self._error = exc
+        finally:
+            self._slots.release()
+
+    async def finish(self) -> dict:
+        """Embed the remaining partial batch, wait for every batch and return merged cache stats."""
+        if self._buffer:
+            batch, self._buffer = self._buffer, []
+            await self._dispatch(batch)
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+        if self._error is not None:
+            raise self._error
+        return merge_embed_stats(self._batch_stats)
+
+    async def aclose(self) -> None:
+        """Cancel outstanding batches after a failure elsewhere in the pipeline."""
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class BackgroundClassification:
+    """
+    A document classification (LLM round trip for the emoji) running next to chunking and
+    embedding. The pipeline reads `result()` when it commits anyway and only awaits a call that
+    is still running after the document is READY.
+    """
+
+    def __init__(self, classify: Callable[[str], Awaitable[str]]):
+        self._classify = classify
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def started(self) -> bool:
+        return self._task is not None
+
+    @property
+    def pending(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, text: str) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._classify(text))
+
+    def result(self) -> Optional[str]:
+        """The emoji if classification already finished successfully, else None."""
+        if self._task is None or not self._task.done() or self._task.cancelled():
+            return None
+        if self._task.exception() is not None:
+            return None
+        return self._task.result()
+
+    async def wait(self) -> Optional[str]:
+        if self._task is None:
+            return None
+        try:
+            return await self._task
+        except Exception as exc:
+            print(f"[Ingestion] Classification failed: {exc}")
+            return None
+
+    def cancel(self) -> None:
+        if self.pending:
+            self._task.cancel()
@@ -0,0 +1,69 @@
+import os
+import uuid
+from typing import List, Optional
+
+from llama_index.core.node_parser import NodeParser
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+from app.core.config import settings
+from app.services.index_cache import get_notebook_index_path
+from app.services.index_writer import NotebookIndexWriter, notebook_index_writer
+from app.services.parse_cache import fingerprint_key
+from app.services.vector_store import MANIFEST_FILENAME, NotebookVectorStore
+
+
+def index_fingerprint(splitter: NodeParser, parser_fingerprint: dict) -> str:
+    """
+    Everything that decides which rows a document contributes to an index: parser settings,
+    chunking and embedding model. Two documents of the same artifact with equal fingerprints
+    have interchangeable nodes and vectors.
+    """
+    return fingerprint_key({
+        "parser": parser_fingerprint,
+        "splitter": type(splitter).__name__,
+        "chunk_size": getattr(splitter, "chunk_size", None),
+        "chunk_overlap": getattr(splitter, "chunk_overlap", None),
+        "embed_model": settings.EMBED_MODEL_NAME,
+    })
+
+
+def clone_source_nodes(
+    source_notebook_id: str,
+    source_doc_id: str,
+    target_notebook_id: str,
+    target_doc_id: str,
+    filename: str,
+    writer: NotebookIndexWriter = notebook_index_writer,
+) -> Optional[List[BaseNode]]:
+    """
+    Copy a document's embedded nodes out of another notebook's index, re-owned by `target_doc_id`.
+
+    Node ids are derived from the target doc id and the source node id, so prev/next links between
+    chunks survive and a retried clone produces the same ids. Returns None when the source notebook
+    has no (current-format) index or holds no live rows for the document.
+    """
+    index_path = get_notebook_index_path(source_notebook_id)
+    if not os.path.exists(os.path.join(index_path, MANIFEST_FILENAME)):
+        return None
+
+    # Held only while reading, so a concurrent compaction cannot drop segments under us.
+    with writer.lock(source_notebook_id):
+        store = NotebookVectorStore.from_persist_dir(index_path)
+        rows = store.rows_for_sources([source_doc_id], ["source_file_id"])
+        if not len(rows):
+            return None
+        records = list(store.iter_rows(rows))
+
+    nodes = [metadata_dict_to_node(meta) for _, _, meta in records]
+    new_ids = {node.node_id: str(uuid.uuid5(uuid.NAMESPACE_URL, f"{target_doc_id}:{node.node_id}")) for node in nodes}
+    for node, (_, vector, _) in zip(nodes, records):
+        node.id_ = new_ids[node.node_id]
+        node.metadata["source_file_id"] = target_doc_id
+        node.metadata["notebook_id"] = target_notebook_id
+        node.metadata["filename"] = filename
+        for relation in node.relationships.values():
+            if not isinstance(relation, list) and relation.node_id in new_ids:
+                relation.node_id = new_ids[relation.node_id]
+        node.embedding = vector.tolist()
+    return nodes
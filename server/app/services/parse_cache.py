@@ -0,0 +1,168 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from dataclasses import asdict
+from typing import Iterator, Optional
+
+from llama_index.core import Document as LlamaDocument
+
+from app.core.config import settings
+
+PARSE_CACHE_FORMAT_VERSION = 1
+
+
+def fingerprint_key(fingerprint: dict) -> str:
+    payload = json.dumps(fingerprint, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class ParseCacheEntryBroken(RuntimeError):
+    """A cached parse could not be replayed to its trailer; the entry has been deleted."""
+
+
+class ParseResultCache:
+    """
+    Parsed pages persisted per (artifact hash, parser configuration fingerprint).
+
+    Layout mirrors the CAS sharding: `{dir}/ab/cd/{artifact_hash}/{fingerprint}.jsonl.gz`, a gzip
+    JSON-lines file with a header line (format version, parser, total pages), one line per page
+    (text + page metadata) and a trailer line with the final ParseStats. Files are written to a
+    temp name while the pages stream through and renamed only after the parser finished, so a
+    half-parsed document is never served. Parses where an OCR / vision call failed are not kept:
+    their pages are degraded and a later ingest should retry the calls. An entry without its
+    trailer is deleted when the replay reaches its end.
+    """
+
+    def __init__(self, base_dir: Optional[str] = None):
+        self._base_dir = base_dir
+
+    @property
+    def base_dir(self) -> str:
+        return self._base_dir or settings.PARSE_CACHE_DIR
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.PARSE_CACHE_ENABLED)
+
+    def _artifact_dir(self, content_hash: str) -> str:
+        if len(content_hash) < 4:
+            return os.path.join(self.base_dir, content_hash)
+        return os.path.join(self.base_dir, content_hash[:2], content_hash[2:4], content_hash)
+
+    def path(self, content_hash: str, fingerprint: dict) -> str:
+        return os.path.join(self._artifact_dir(content_hash), f"{fingerprint_key(fingerprint)}.jsonl.gz")
+
+    def load(self, content_hash: str, fingerprint: dict, stats) -> Optional[Iterator[LlamaDocument]]:
+        """
+        Iterator over cached pages (filling `stats` as it goes), or None on a miss. Only the header
+        is read here; pages are decoded as they are consumed, in a single pass over the file. An
+        entry that turns out to be damaged or truncated is deleted and the iterator raises
+        ParseCacheEntryBroken after the pages it could still read.
+        """
+        if not self.enabled:
+            return None
+        path = self.path(content_hash, fingerprint)
+        if not os.path.exists(path):
+            return None
+        f = None
+        try:
+            f = gzip.open(path, "rt", encoding="utf-8")
+            header = json.loads(f.readline())
+        except (OSError, ValueError, EOFError) as exc:
+            if f is not None:
+                f.close()
+            print(f"[ParseCache] Dropping unreadable entry {path}: {exc}")
+            self._discard(path)
+            return None
+        if header.get("v") != PARSE_CACHE_FORMAT_VERSION:
+            f.close()
+            return None
+        stats.total_pages = int(header.get("total_pages", 0))
+        stats.cache_hit = True
+        return self._replay(f, path, stats)
+
+    @staticmethod
+    def _discard(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _replay(self, f, path: str, stats) -> Iterator[LlamaDocument]:
+        completed = False
+        try:
+            with f:
+                for line in f:
+                    record = json.loads(line)
+                    if "stats" in record:
+                        for field, value in record["stats"].items():
+                            if hasattr(stats, field) and field != "cache_hit":
+                                setattr(stats, field, value)
+                        completed = True
+                        break
+                    yield LlamaDocument(text=record["text"], metadata=record["metadata"])
+        except (OSError, ValueError, EOFError) as exc:
+            print(f"[ParseCache] Dropping unreadable entry {path}: {exc}")
+            self._discard(path)
+            raise ParseCacheEntryBroken(f"Parse cache entry is unreadable: {path}: {exc}") from exc
+        if not completed:
+            print(f"[ParseCache] Dropping truncated entry {path}")
+            self._discard(path)
+            raise ParseCacheEntryBroken(f"Parse cache entry is truncated: {path}")
+
+    def record(self, content_hash: str, fingerprint: dict, pages: Iterator[LlamaDocument], stats) -> Iterator[LlamaDocument]:
+        """Pass `pages` through unchanged while writing them to the cache."""
+        if not self.enabled:
+            yield from pages
+            return
+        path = self.path(content_hash, fingerprint)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            out = gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6)
+        except OSError as exc:
+            print(f"[ParseCache] Not caching {content_hash}: {exc}")
+            yield from pages
+            return
+
+        completed = False
+        try:
+            with out:
+                header_written = False
+                for doc in pages:
+                    if not header_written:
+                        # Parsers set total_pages before their first page.
+                        out.write(json.dumps(self._header(stats)) + "\n")
+                        header_written = True
+                    # Written before the consumer attaches notebook metadata to the same object.
+                    out.write(json.dumps({"text": doc.text, "metadata": doc.metadata}, ensure_ascii=False) + "\n")
+                    yield doc
+                if not header_written:
+                    out.write(json.dumps(self._header(stats)) + "\n")
+                trailer = {k: v for k, v in asdict(stats).items() if k != "cache_hit"}
+                out.write(json.dumps({"stats": trailer}) + "\n")
+            if stats.failed_provider_calls:
+                print(
+                    f"[ParseCache] Not caching {content_hash}: "
+                    f"{stats.failed_provider_calls} OCR / vision call(s) failed"
+                )
+                return
+            os.replace(tmp_path, path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def _header(stats) -> dict:
+        return {"v": PARSE_CACHE_FORMAT_VERSION, "parser": stats.parser, "total_pages": stats.total_pages}
+
+    def delete(self, content_hash: str) -> None:
+        """Drop every cached parse of an artifact (all fingerprints)."""
+        shutil.rmtree(self._artifact_dir(content_hash), ignore_errors=True)
+
+
+parse_result_cache = ParseResultCache()
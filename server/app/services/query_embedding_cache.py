@@ -0,0 +1,90 @@
+import hashlib
+import time
+import unicodedata
+from typing import List
+
+from llama_index.core.embeddings import BaseEmbedding
+
+from app.core.config import settings
+from app.services.embedding_memory_cache import EmbeddingLRUCache
+from app.services.embedding_redis_cache import RedisEmbeddingCache
+
+REDIS_QUERY_KEY_PREFIX = "qemb:"
+
+
+def normalize_query(text: str) -> str:
+    """Width/compatibility forms folded, whitespace collapsed, case folded: `  What is RAG？` == `what is rag?`."""
+    return " ".join(unicodedata.normalize("NFKC", text or "").split()).casefold()
+
+
+def query_hash(text: str) -> str:
+    return hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+
+
+class QueryEmbeddingCache:
+    """
+    Chat question embeddings keyed by (model_name, sha256 of the normalized question).
+
+    Lookup order: in-process byte-bounded LRU -> Redis (only when EMBED_REDIS_CACHE_ENABLED,
+    under `qemb:` with EMBED_QUERY_CACHE_TTL_SECONDS) -> the embedding API. Repeated and
+    retried questions then start retrieval without the DashScope round trip.
+    """
+
+    def __init__(self, memory_cache: EmbeddingLRUCache, redis_cache: RedisEmbeddingCache):
+        self.memory_cache = memory_cache
+        self.redis_cache = redis_cache
+        self._memory_hits = 0
+        self._redis_hits = 0
+        self._misses = 0
+        self._embed_seconds = 0.0
+
+    async def get_or_embed(self, embed_model: BaseEmbedding, question: str) -> List[float]:
+        text = " ".join((question or "").split())
+        if not settings.EMBED_QUERY_CACHE_ENABLED:
+            return await embed_model.aget_query_embedding(text)
+
+        model_name = getattr(embed_model, "model_name", None) or settings.EMBED_MODEL_NAME
+        key = query_hash(text)
+
+        found = self.memory_cache.get_many(model_name, [key])
+        if key in found:
+            self._memory_hits += 1
+            return found[key].tolist()
+
+        found = await self.redis_cache.get_many(model_name, [key])
+        if key in found:
+            self._redis_hits += 1
+            self.memory_cache.put_many(model_name, found.items())
+            return found[key].tolist()
+
+        started = time.monotonic()
+        vector = await embed_model.aget_query_embedding(text)
+        self._embed_seconds += time.monotonic() - started
+        self._misses += 1
+        self.memory_cache.put_many(model_name, [(key, vector)])
+        await self.redis_cache.put_many(model_name, [(key, vector)])
+        return vector
+
+    def stats(self) -> dict:
+        hits = self._memory_hits + self._redis_hits
+        lookups = hits + self._misses
+        return {
+            "enabled": bool(settings.EMBED_QUERY_CACHE_ENABLED),
+            "lookups": lookups,
+            "memory_hits": self._memory_hits,
+            "redis_hits": self._redis_hits,
+            "misses": self._misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "avg_embed_ms": round(self._embed_seconds * 1000.0 / self._misses, 1) if self._misses else 0.0,
+            "memory_cache": self.memory_cache.stats(),
+            "redis_cache": self.redis_cache.stats() if self.redis_cache.enabled else None,
+        }
+
+
+query_embedding_cache = QueryEmbeddingCache(
+    memory_cache=EmbeddingLRUCache(max_bytes=settings.EMBED_QUERY_CACHE_MAX_MB * 1024 * 1024),
+    redis_cache=RedisEmbeddingCache(
+        key_prefix=REDIS_QUERY_KEY_PREFIX,
+        ttl_seconds=settings.EMBED_QUERY_CACHE_TTL_SECONDS,
+    ),
+)
@@ -0,0 +1,53 @@
+import asyncio
+import os
+import threading
+from typing import Dict, Tuple
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+
+_lock = threading.Lock()
+_pid = os.getpid()
+# (id(loop), decode_responses) -> (loop, client)
+_clients: Dict[Tuple[int, bool], Tuple[asyncio.AbstractEventLoop, redis.Redis]] = {}
+
+
+def shared_redis_client(decode_responses: bool = False) -> redis.Redis:
+    """
+    The process's pooled redis.asyncio client for the running event loop, created on first use.
+
+    Callers must not close it. An asyncio connection is bound to the loop that opened it, so a
+    worker that runs every task under its own asyncio.run() gets one client per live loop; entries
+    for loops that have since closed are dropped here.
+    """
+    global _pid
+    loop = asyncio.get_running_loop()
+    with _lock:
+        if os.getpid() != _pid:
+            # Pooled sockets must not be shared with a forked child (prefork worker pools).
+            _pid = os.getpid()
+            _clients.clear()
+        for key, (owner, _) in list(_clients.items()):
+            if owner.is_closed():
+                del _clients[key]
+        key = (id(loop), decode_responses)
+        entry = _clients.get(key)
+        if entry is None or entry[0] is not loop:
+            client = redis.from_url(settings.REDIS_URL, decode_responses=decode_responses, socket_connect_timeout=1)
+            entry = (loop, client)
+            _clients[key] = entry
+        return entry[1]
+
+
+async def close_redis_clients() -> None:
+    """Close the shared clients of the running loop; call before the loop shuts down."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        keys = [key for key, (owner, _) in _clients.items() if owner is loop]
+        clients = [_clients.pop(key)[1] for key in keys]
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as exc:
+            print(f"[Redis] Failed to close shared client: {exc}", flush=True)
@@ -1,9 +1,7 @@
-import hashlib
-import pickle
 import asyncio
-import os
-from typing import List, Dict
-import requests
+import hashlib
+import time
+from typing import Dict, List, Optional
 from sqlalchemy import select
 from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
 
@@ -12,11 +10,26 @@ from llama_index.core.schema import TextNode
 from app.models.chunk_cache import ChunkCache
 from app.db.session import AsyncSessionLocal
 from app.core.config import settings
+from app.services.chunk_cache_gc import chunk_cache_access_tracker
+from app.services.dashscope_client import ENDPOINT_EMBEDDING, dashscope_client
+from app.services.dashscope_http_embedding import parse_embedding_vectors
+from app.services.embedding_batcher import estimate_tokens, pack_batches, packing_stats
+from app.services.embedding_codec import decode_embeddings, encode_embedding
+from app.services.embedding_controller import AdaptiveEmbeddingController
+from app.services.embedding_memory_cache import embedding_memory_cache
+from app.services.embedding_redis_cache import redis_embedding_cache
+from app.services.embedding_singleflight import embedding_single_flight
 
 class SmartEmbeddingManager:
     def __init__(self, embed_model: BaseEmbedding):
         self.embed_model = embed_model
         self.model_name = settings.EMBED_MODEL_NAME
+        self.last_packing_stats = None
+        self.controller = AdaptiveEmbeddingController(self.model_name)
+        self.memory_cache = embedding_memory_cache
+        self.redis_cache = redis_embedding_cache
+        self.access_tracker = chunk_cache_access_tracker
+        self.single_flight = embedding_single_flight
 
     def _resolve_embed_api_key(self) -> str:
         """Prefer dedicated embedding key, then fallback to shared key."""
@@ -43,92 +56,222 @@ class SmartEmbeddingManager:
         for i in range(0, len(items), batch_size):
             yield items[i:i + batch_size]
 
-    @staticmethod
-    def _is_force_no_proxy() -> bool:
-        val = os.environ.get("DASHSCOPE_FORCE_NO_PROXY", "")
-        return val.lower() in ("1", "true", "yes", "on")
+    def _embed_request_args(self, texts: List[str]) -> dict:
+        api_key = self._resolve_embed_api_key()
+        if not api_key:
+            raise ValueError("Missing DashScope embedding API key: set DASHSCOPE_EMBED_API_KEY or DASHSCOPE_API_KEY.")
+        return {
+            "headers": {
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            },
+            "json": {
+                "model": settings.EMBED_MODEL_NAME,
+                "input": {"texts": texts},
+            },
+        }
 
-    def _embed_text_batch_via_http(self, texts: List[str]) -> List[List[float]]:
+    async def _aembed_text_batch_via_http(self, texts: List[str]) -> List[List[float]]:
         """
-        Call DashScope embedding endpoint once per batch.
+        Call DashScope embedding endpoint once per batch on the shared keep-alive client.
         This avoids the SDK's per-text concurrent calls that can be unstable in some proxy/TUN paths.
         """
-        api_key = self._resolve_embed_api_key()
-        if not api_key:
-            raise ValueError("Missing DashScope embedding API key: set DASHSCOPE_EMBED_API_KEY or DASHSCOPE_API_KEY.")
+        response = await dashscope_client.apost(ENDPOINT_EMBEDDING, **self._embed_request_args(texts))
+        response.raise_for_status()
+        # Keep server-returned order by text_index.
+        return parse_embedding_vectors(response.json())
 
-        url = "https://dashscope.aliyuncs.com/api/v1/services/embeddings/text-embedding/text-embedding"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "model": settings.EMBED_MODEL_NAME,
-            "input": {"texts": texts},
-        }
+    def _plan_batches(self, texts: List[str], max_items: Optional[int] = None) -> List[List[int]]:
+        """
+        Positions of `texts` grouped into requests. With EMBED_BATCH_MAX_TOKENS > 0 texts are
+        packed by estimated token length up to `max_items` (default EMBED_BATCH_MAX_ITEMS) per
+        request; otherwise fixed batches of `max_items` (default EMBED_BATCH_SIZE).
+        """
+        positions = list(range(len(texts)))
+        if settings.EMBED_BATCH_MAX_TOKENS <= 0:
+            return list(self._iter_batches(positions, max_items or settings.EMBED_BATCH_SIZE))
 
-        def _post():
-            kwargs = {"headers": headers, "json": payload, "timeout": 30}
-            if self._is_force_no_proxy():
-                kwargs["proxies"] = {"http": None, "https": None}
-            return requests.post(url, **kwargs)
+        token_counts = [estimate_tokens(text) for text in texts]
+        batches = pack_batches(
+            token_counts, settings.EMBED_BATCH_MAX_TOKENS, max_items or settings.EMBED_BATCH_MAX_ITEMS
+        )
+        stats = packing_stats(token_counts, batches, settings.EMBED_BATCH_SIZE)
+        self.last_packing_stats = stats
+        print(
+            f"[Embedding] Packed {stats.texts} texts (~{stats.tokens} tokens) into {stats.requests} requests; "
+            f"fixed-count batching would send {stats.fixed_count_requests} (saved {stats.requests_saved})"
+        )
+        return batches
 
-        try:
-            response = _post()
-        except Exception as e:
-            # One fallback: temporarily bypass proxy for DashScope host.
-            text = str(e)
-            if "dashscope.aliyuncs.com" not in text:
-                raise
-            old_no_proxy = os.environ.get("NO_PROXY")
-            old_no_proxy_lower = os.environ.get("no_proxy")
+    async def _embed_missing_texts(self, texts: List[str], progress_callback=None) -> List[List[float]]:
+        """
+        Embed `texts` in planned batches with a bounded number of requests in flight: the AIMD
+        controller's operating point when EMBED_AIMD_ENABLED, else EMBED_MAX_IN_FLIGHT.
+        Returns vectors in input order; progress is reported as batches complete, never going backwards.
+        """
+        controller = self.controller if settings.EMBED_AIMD_ENABLED else None
+
+        # Retry per batch to reduce TLS/proxy instability.
+        @retry(
+            stop=stop_after_attempt(3),
+            wait=wait_fixed(1),
+            retry=retry_if_exception_type(Exception)
+        )
+        async def _call_api_with_retry(batch):
+            started_at = time.perf_counter()
             try:
-                base = old_no_proxy or ""
-                parts = [p.strip() for p in base.split(",") if p.strip()]
-                for host in ("aliyuncs.com", "dashscope.aliyuncs.com"):
-                    if host not in parts:
-                        parts.append(host)
-                merged = ",".join(parts)
-                os.environ["NO_PROXY"] = merged
-                os.environ["no_proxy"] = merged
-                response = _post()
-            finally:
-                if old_no_proxy is None:
-                    os.environ.pop("NO_PROXY", None)
-                else:
-                    os.environ["NO_PROXY"] = old_no_proxy
-                if old_no_proxy_lower is None:
-                    os.environ.pop("no_proxy", None)
-                else:
-                    os.environ["no_proxy"] = old_no_proxy_lower
+                batch_vectors = await self._aembed_text_batch_via_http(batch)
+            except Exception as exc:
+                if controller is not None:
+                    controller.record_failure(exc)
+                raise
+            if controller is not None:
+                controller.record_success(time.perf_counter() - started_at)
+            return batch_vectors
 
-        response.raise_for_status()
-        body = response.json()
+        if controller is not None:
+            await controller.ensure_loaded()
+            batches = self._plan_batches(texts, controller.batch_items)
+            semaphore = controller.limiter()
+        else:
+            batches = self._plan_batches(texts)
+            semaphore = asyncio.Semaphore(max(1, settings.EMBED_MAX_IN_FLIGHT))
+        vectors: List[List[float]] = [None] * len(texts)
+        progress_lock = asyncio.Lock()
+        processed = 0
 
-        embeddings = (
-            body.get("output", {}).get("embeddings", [])
-            if isinstance(body, dict)
-            else []
-        )
-        if not embeddings:
-            raise ValueError(f"DashScope embedding response missing embeddings: {body}")
+        async def _run(positions: List[int]):
+            nonlocal processed
+            async with semaphore:
+                batch_vectors = await _call_api_with_retry([texts[i] for i in positions])
+            for position, vector in zip(positions, batch_vectors):
+                vectors[position] = vector
+            async with progress_lock:
+                processed += len(positions)
+                if progress_callback:
+                    await progress_callback(processed, len(texts))
 
-        # Keep server-returned order by text_index.
-        embeddings_sorted = sorted(
-            embeddings,
-            key=lambda item: item.get("text_index", 0),
-        )
-        vectors = [item.get("embedding") for item in embeddings_sorted]
-        if any(v is None for v in vectors):
-            raise ValueError(f"DashScope embedding response has empty vector: {body}")
+        tasks = [asyncio.create_task(_run(positions)) for positions in batches]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            if controller is not None:
+                await controller.save()
+                print(
+                    f"[Embedding] AIMD operating point: batch={controller.batch_items}, "
+                    f"in_flight={controller.in_flight}"
+                )
         return vectors
 
-    async def batch_embed_nodes(self, nodes: List[TextNode], progress_callback=None):
+    async def _lookup_cached_blobs(self, db, hashes: List[str]) -> Dict[str, bytes]:
+        """
+        Cached embedding blobs for `hashes` under this model. The IN list is split into chunks of
+        EMBED_CACHE_LOOKUP_CHUNK to stay under SQLite's bound-parameter limit; all chunks run on
+        the session's single connection and are served by the (text_hash, model_name) primary key.
+        """
+        found: Dict[str, bytes] = {}
+        chunk_size = max(1, settings.EMBED_CACHE_LOOKUP_CHUNK)
+        for begin in range(0, len(hashes), chunk_size):
+            stmt = select(ChunkCache.text_hash, ChunkCache.embedding).where(
+                ChunkCache.model_name == self.model_name,
+                ChunkCache.text_hash.in_(hashes[begin:begin + chunk_size]),
+            )
+            for text_hash, blob in (await db.execute(stmt)).all():
+                found[text_hash] = blob
+        return found
+
+    @staticmethod
+    async def _store_cached_blobs(db, rows: List[dict]) -> None:
+        """
+        Bulk INSERT ... ON CONFLICT DO NOTHING: another worker may have cached the same text
+        meanwhile, which must not abort the whole commit.
+        """
+        if not rows:
+            return
+        if db.bind.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(ChunkCache).on_conflict_do_nothing(index_elements=["text_hash", "model_name"])
+        await db.execute(stmt, rows)
+
+    @staticmethod
+    def _offset_progress(progress_callback, offset: int, total: int):
+        if progress_callback is None:
+            return None
+
+        async def _report(processed: int, _count: int):
+            await progress_callback(offset + processed, total)
+
+        return _report
+
+    async def _embed_and_store(self, node_map: Dict[str, List[TextNode]], hashes: List[str], progress_callback=None) -> None:
+        """Embed `hashes` via the API, fill their nodes and write the vectors to every cache tier."""
+        if not hashes:
+            return
+        print(f"Cache Miss: Computing embeddings for {len(hashes)} unique chunks...")
+        # Use one node's content as representative for the hash
+        texts_to_embed = [node_map[h][0].get_content(metadata_mode="embed") for h in hashes]
+
+        try:
+            embeddings = await self._embed_missing_texts(texts_to_embed, progress_callback)
+        except Exception as e:
+            print(f"Embedding API Fatal Error after retries: {e}")
+            raise e
+
+        # Save new embeddings to Cache
+        new_cache_rows = []
+        now = int(time.time())
+        for h, emb in zip(hashes, embeddings):
+            # Assign to nodes
+            for node in node_map[h]:
+                node.embedding = emb
+            new_cache_rows.append({
+                "text_hash": h,
+                "model_name": self.model_name,
+                "embedding": encode_embedding(emb, settings.EMBED_CACHE_DTYPE),
+                "last_accessed_at": now,
+            })
+
+        async with AsyncSessionLocal() as db:
+            await self._store_cached_blobs(db, new_cache_rows)
+            await db.commit()
+        self.memory_cache.put_many(self.model_name, zip(hashes, embeddings))
+        await self.redis_cache.put_many(self.model_name, zip(hashes, embeddings))
+
+    async def _await_inflight(self, node_map: Dict[str, List[TextNode]], hashes: List[str]) -> List[str]:
+        """
+        Wait for other tasks' claims on `hashes`, then fill nodes from chunk_cache.
+        Returns the hashes still without a vector (owner failed or timed out) for us to embed.
+        """
+        print(f"[Embedding] Waiting for {len(hashes)} chunks being embedded by another task...")
+        settled, timed_out = await self.single_flight.wait(self.model_name, hashes)
+        found: Dict[str, bytes] = {}
+        if settled:
+            async with AsyncSessionLocal() as db:
+                found = await self._lookup_cached_blobs(db, settled)
+        found_hashes = list(found.keys())
+        matrix = decode_embeddings([found[h] for h in found_hashes])
+        self.memory_cache.put_many(self.model_name, zip(found_hashes, matrix))
+        for h, embedding in zip(found_hashes, matrix.tolist()):
+            for node in node_map[h]:
+                node.embedding = embedding
+        return [h for h in settled if h not in found] + timed_out
+
+    async def batch_embed_nodes(self, nodes: List[TextNode], progress_callback=None) -> dict:
         """
         Main entry point: Takes nodes, fills their embeddings using Cache + API.
+        Lookup order: in-process LRU -> Redis (optional, shared) -> chunk_cache table -> DashScope,
+        with misses already being embedded by a concurrent ingestion awaited instead of recomputed.
+        Returns per-tier counts.
         """
         if not nodes:
-            return
+            return {}
 
         # 1. Prepare
         node_map: Dict[str, List[TextNode]] = {} # Hash -> [Nodes] (one hash can map to multiple identical nodes)
@@ -141,76 +284,83 @@ class SmartEmbeddingManager:
         all_hashes = list(node_map.keys())
         needed_hashes = set(all_hashes)
         
-        # 2. Check Cache (Async DB)
-        async with AsyncSessionLocal() as db:
-            # Batch query SQLite
-            # SQLite limit is usually 999 vars, so we might need to chunk this query if too huge
-            # For simplicity, assuming batch size < 500
-            stmt = select(ChunkCache).where(
-                ChunkCache.model_name == self.model_name,
-                ChunkCache.text_hash.in_(all_hashes),
-            )
-            result = await db.execute(stmt)
-            cached_entries = result.scalars().all()
+        # 2a. Check in-process LRU
+        memory_hits = self.memory_cache.get_many(self.model_name, all_hashes)
+        for h, vector in memory_hits.items():
+            embedding = vector.tolist()
+            for node in node_map[h]:
+                node.embedding = embedding
+            needed_hashes.discard(h)
+
+        # 2b. Check shared Redis tier (one pipelined round trip)
+        redis_hits = await self.redis_cache.get_many(self.model_name, [h for h in all_hashes if h in needed_hashes])
+        if redis_hits:
+            self.memory_cache.put_many(self.model_name, redis_hits.items())
+        for h, vector in redis_hits.items():
+            embedding = vector.tolist()
+            for node in node_map[h]:
+                node.embedding = embedding
+            needed_hashes.discard(h)
+
+        # 2c. Check Cache (Async DB)
+        cached_hashes: List[str] = []
+        if needed_hashes:
+            async with AsyncSessionLocal() as db:
+                cached_blobs = await self._lookup_cached_blobs(db, list(needed_hashes))
 
-            for entry in cached_entries:
-                embedding = pickle.loads(entry.embedding)
+            cached_hashes = list(cached_blobs.keys())
+            cached_matrix = decode_embeddings([cached_blobs[h] for h in cached_hashes])
+            self.memory_cache.put_many(self.model_name, zip(cached_hashes, cached_matrix))
+            # Read-through: promote local hits so other hosts find them in Redis.
+            await self.redis_cache.put_many(self.model_name, zip(cached_hashes, cached_matrix))
+            # One frombuffer over every hit and a single tolist(); TextNode validates embeddings as List[float].
+            for h, embedding in zip(cached_hashes, cached_matrix.tolist()):
                 # Assign to all nodes with this hash
-                for node in node_map[entry.text_hash]:
+                for node in node_map[h]:
                     node.embedding = embedding
-                
-                if entry.text_hash in needed_hashes:
-                    needed_hashes.remove(entry.text_hash)
+                needed_hashes.discard(h)
+
+        stats = {
+            "unique_chunks": len(all_hashes),
+            "memory_hits": len(memory_hits),
+            "redis_hits": len(redis_hits),
+            "db_hits": len(cached_hashes),
+            "api_embedded": len(needed_hashes),
+            "memory_hit_ratio": round(len(memory_hits) / len(all_hashes), 4),
+        }
+        # Hits from every tier keep their chunk_cache rows young for GC; written back in batches.
+        self.access_tracker.touch(self.model_name, [h for h in all_hashes if h not in needed_hashes])
+        self.access_tracker.record_lookups(len(all_hashes), len(all_hashes) - len(needed_hashes))
         
-        # 3. Process Misses (API Call)
+        # 3. Process Misses (API Call). Hashes another ingestion is already embedding are awaited, not re-paid.
         if needed_hashes:
-            print(f"Cache Miss: Computing embeddings for {len(needed_hashes)} unique chunks...")
-            texts_to_embed = []
-            hashes_to_embed = []
-            
-            # Use one node's content as representative for the hash
-            for h in needed_hashes:
-                representative_node = node_map[h][0]
-                texts_to_embed.append(representative_node.get_content(metadata_mode="embed"))
-                hashes_to_embed.append(h)
-            
-            # Call API in small batches with retry per batch to reduce TLS/proxy instability.
+            owned, waiting, token = await self.single_flight.claim(self.model_name, sorted(needed_hashes))
+            total = len(needed_hashes)
             try:
-                @retry(
-                    stop=stop_after_attempt(3),
-                    wait=wait_fixed(1),
-                    retry=retry_if_exception_type(Exception)
-                )
-                async def _call_api_with_retry(texts):
-                    return await asyncio.to_thread(self._embed_text_batch_via_http, texts)
-
-                embeddings = []
-                processed = 0
-                batch_size = settings.EMBED_BATCH_SIZE
-                for text_batch in self._iter_batches(texts_to_embed, batch_size):
-                    emb_batch = await _call_api_with_retry(text_batch)
-                    embeddings.extend(emb_batch)
-                    processed += len(text_batch)
-                    if progress_callback:
-                        await progress_callback(processed, len(needed_hashes))
-            except Exception as e:
-                print(f"Embedding API Fatal Error after retries: {e}")
-                raise e
-            
-            # 4. Save new embeddings to Cache
-            new_cache_entries = []
-            async with AsyncSessionLocal() as db:
-                for h, emb in zip(hashes_to_embed, embeddings):
-                    # Assign to nodes
-                    for node in node_map[h]:
-                        node.embedding = emb
-                    
-                    # Prepare DB record
-                    new_cache_entries.append(ChunkCache(
-                        text_hash=h,
-                        embedding=pickle.dumps(emb),
-                        model_name=self.model_name
-                    ))
-                
-                db.add_all(new_cache_entries)
-                await db.commit()
+                await self._embed_and_store(node_map, owned, self._offset_progress(progress_callback, 0, total))
+            finally:
+                await self.single_flight.release(self.model_name, owned, token)
+
+            leftovers: List[str] = []
+            if waiting:
+                leftovers = await self._await_inflight(node_map, waiting)
+                done = total - len(leftovers)
+                if progress_callback:
+                    await progress_callback(done, total)
+                await self._embed_and_store(node_map, leftovers, self._offset_progress(progress_callback, done, total))
+            stats["api_embedded"] = len(owned) + len(leftovers)
+            stats["singleflight_waited"] = len(waiting)
+            stats["singleflight_reused"] = len(waiting) - len(leftovers)
+
+        if self.access_tracker.flush_due():
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.access_tracker.flush(db)
+                    await db.commit()
+            except Exception as exc:
+                print(f"[EmbedCache] Could not refresh chunk_cache access times: {exc}")
+
+        stats["memory_cache"] = self.memory_cache.stats()
+        if self.redis_cache.enabled:
+            stats["redis_cache"] = self.redis_cache.stats()
+        return stats
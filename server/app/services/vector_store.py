@@ -0,0 +1,1032 @@
+import bisect
+import hashlib
+import json
+import os
+import struct
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core import StorageContext, VectorStoreIndex
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import (
+    build_metadata_filter_fn,
+    metadata_dict_to_node,
+    node_to_metadata_dict,
+)
+
+from app.core.config import settings
+from app.services.ann_index import (
+    ANN_FILENAME,
+    ANN_MODE_IVF,
+    IVFFlatIndex,
+    default_list_count,
+    training_sample_size,
+)
+
+STORE_FORMAT_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+SEGMENTS_DIRNAME = "segments"
+TOMBSTONES_FILENAME = "tombstones.log"
+LEGACY_INDEX_FILES = (
+    "docstore.json",
+    "index_store.json",
+    "default__vector_store.json",
+    "graph_store.json",
+    "image__vector_store.json",
+)
+
+# Vector file: 128-byte header followed by count * dim little-endian float32 values.
+VECTOR_FILE_MAGIC = b"INVEC\x00\x00\x00"
+VECTOR_FILE_VERSION = 1
+VECTOR_DTYPE_FLOAT32 = 1
+VECTOR_HEADER_SIZE = 128
+_VECTOR_HEADER = struct.Struct("<8sHHII64s")
+
+# Metadata fields with per-segment row postings; chat filters by these when the user picks sources.
+SOURCE_POSTING_FIELDS = ("source_file_id", "doc_id")
+
+_MIN_CAPACITY = 256
+# Score a gathered submatrix instead of every row when at most this share of rows is eligible.
+_GATHER_MAX_RATIO = 0.25
+
+
+def _segment_path(persist_dir: str, segment_id: int, suffix: str) -> str:
+    return os.path.join(persist_dir, SEGMENTS_DIRNAME, f"seg-{segment_id:08d}.{suffix}")
+
+
+def _write_atomic(path: str, data: str) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _write_atomic_bytes(path: str, chunks: Sequence[bytes]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp, path)
+
+
+def write_vector_file(path: str, vectors: np.ndarray, model_name: str) -> None:
+    vectors = np.ascontiguousarray(vectors, dtype="<f4")
+    count, dim = vectors.shape
+    header = _VECTOR_HEADER.pack(
+        VECTOR_FILE_MAGIC,
+        VECTOR_FILE_VERSION,
+        VECTOR_DTYPE_FLOAT32,
+        dim,
+        count,
+        (model_name or "").encode("utf-8")[:64],
+    )
+    _write_atomic_bytes(path, [header.ljust(VECTOR_HEADER_SIZE, b"\x00"), vectors.tobytes()])
+
+
+def read_vector_header(path: str) -> dict:
+    with open(path, "rb") as f:
+        raw = f.read(VECTOR_HEADER_SIZE)
+    if len(raw) < _VECTOR_HEADER.size:
+        raise ValueError(f"Vector file too short: {path}")
+    magic, version, dtype_code, dim, count, model = _VECTOR_HEADER.unpack_from(raw)
+    if magic != VECTOR_FILE_MAGIC or version != VECTOR_FILE_VERSION or dtype_code != VECTOR_DTYPE_FLOAT32:
+        raise ValueError(f"Unsupported vector file: {path}")
+    return {
+        "dim": int(dim),
+        "count": int(count),
+        "model": model.rstrip(b"\x00").decode("utf-8", "replace"),
+    }
+
+
+def open_vector_file(path: str) -> Tuple[dict, np.ndarray]:
+    """
+    Map a vector file read-only. Pages come from the OS page cache and are shared by every
+    process that maps the same file, so opening costs the same regardless of notebook size.
+    """
+    header = read_vector_header(path)
+    if header["count"] == 0:
+        return header, np.zeros((0, header["dim"]), dtype=np.float32)
+    vectors = np.memmap(
+        path,
+        dtype="<f4",
+        mode="r",
+        offset=VECTOR_HEADER_SIZE,
+        shape=(header["count"], header["dim"]),
+    )
+    return header, vectors
+
+
+def encode_row_line(node_id: str, metadata: dict) -> bytes:
+    return f"{node_id}\t{json.dumps(metadata, ensure_ascii=False)}\n".encode("utf-8")
+
+
+def decode_row_line(line: bytes) -> Tuple[str, dict]:
+    node_id, _, payload = line.rstrip(b"\n").partition(b"\t")
+    return node_id.decode("utf-8"), json.loads(payload)
+
+
+def node_id_hashes(node_ids: Sequence[str]) -> np.ndarray:
+    """64-bit hashes of node ids, as stored per segment for replace checks."""
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(nid.encode("utf-8"), digest_size=8).digest(), "little") for nid in node_ids),
+        dtype="<u8",
+        count=len(node_ids),
+    )
+
+
+def _source_values(metadata: dict):
+    for field in SOURCE_POSTING_FIELDS:
+        value = metadata.get(field)
+        if value:
+            yield field, str(value)
+
+
+def _rows_to_ranges(rows: np.ndarray) -> List[List[int]]:
+    """Compress ascending row numbers into [begin, end) ranges."""
+    if not len(rows):
+        return []
+    breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+    begins = np.concatenate([[0], breaks])
+    ends = np.concatenate([breaks, [len(rows)]])
+    return [[int(rows[b]), int(rows[e - 1]) + 1] for b, e in zip(begins, ends)]
+
+
+def _ranges_to_rows(ranges: List[List[int]], base: int = 0) -> np.ndarray:
+    if not ranges:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate([np.arange(base + begin, base + end, dtype=np.int64) for begin, end in ranges])
+
+
+@dataclass
+class _Segment:
+    id: int
+    start: int
+    count: int
+    vectors: np.ndarray
+    offsets: np.ndarray
+    rows: np.ndarray
+    # field -> value -> [begin, end) local row ranges
+    sources: Dict[str, Dict[str, List[List[int]]]]
+    # node id hash per local row (see node_id_hashes)
+    id_hashes: np.ndarray
+
+    def line(self, local_row: int) -> bytes:
+        return self.rows[int(self.offsets[local_row]):int(self.offsets[local_row + 1])].tobytes()
+
+
+class NotebookVectorStore(BasePydanticVectorStore):
+    """
+    Per-notebook vector store persisted as append-only, memory-mapped segments.
+
+    Layout under the notebook index folder:
+      - manifest.json: ordered list of live segments
+      - segments/seg-XXXXXXXX.vec: header (dim/count/model) + normalized float32 vectors
+      - segments/seg-XXXXXXXX.rows: "<node_id>\\t<node metadata json>" per row
+      - segments/seg-XXXXXXXX.off: uint64 byte offset of every row line (count + 1 entries)
+      - segments/seg-XXXXXXXX.src: source_file_id / doc_id -> local row ranges (postings)
+      - segments/seg-XXXXXXXX.ids: uint64 hash of every row's node id, for replace checks
+      - tombstones.log: "<segment_id> <row> <node_id>" lines marking deleted rows
+      - ann_ivf.npz: optional IVF centroids + per-row list assignments (VECTOR_ANN_MODE=ivf)
+
+    Each `persist()` writes only the rows added since the previous persist as a new segment
+    and appends tombstones for deleted rows, so the cost of a commit is proportional to the
+    change instead of the whole notebook. `compact()` folds everything back into one segment.
+
+    Loading maps the segment files instead of parsing them: scoring runs one matrix-vector
+    product per segment plus `argpartition` top-k, and node metadata is decoded only for the
+    rows a query actually returns.
+    """
+
+    stores_text: bool = True
+    is_embedding_query: bool = True
+    persist_dir: Optional[str] = None
+    model_name: Optional[str] = None
+
+    _segments: List[_Segment] = PrivateAttr(default_factory=list)
+    _persisted_rows: int = PrivateAttr(default=0)
+    _alive: np.ndarray = PrivateAttr(default_factory=lambda: np.zeros(0, dtype=bool))
+    _dim: Optional[int] = PrivateAttr(default=None)
+    _pending_vectors: Optional[np.ndarray] = PrivateAttr(default=None)
+    _pending_ids: List[str] = PrivateAttr(default_factory=list)
+    _pending_metadata: List[dict] = PrivateAttr(default_factory=list)
+    _pending_sources: Dict[str, Dict[str, List[int]]] = PrivateAttr(default_factory=dict)
+    _row_by_id: Optional[Dict[str, int]] = PrivateAttr(default=None)
+    _next_segment_id: int = PrivateAttr(default=1)
+    _pending_tombstones: List[Tuple[int, int, str]] = PrivateAttr(default_factory=list)
+    _dead_on_disk: int = PrivateAttr(default=0)
+    _ann: Optional[IVFFlatIndex] = PrivateAttr(default=None)
+    _legacy_source: bool = PrivateAttr(default=False)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NotebookVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def total_rows(self) -> int:
+        return self._persisted_rows + len(self._pending_ids)
+
+    @property
+    def live_count(self) -> int:
+        return int(self._alive[:self.total_rows].sum())
+
+    @property
+    def segment_count(self) -> int:
+        return len(self._segments)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._dim
+
+    @property
+    def is_legacy(self) -> bool:
+        """Loaded from a legacy llama_index folder that no writer has converted yet."""
+        return self._legacy_source
+
+    @property
+    def ann_index(self) -> Optional[IVFFlatIndex]:
+        return self._ann
+
+    def _resolved_model_name(self) -> str:
+        return self.model_name or settings.EMBED_MODEL_NAME
+
+    # ------------------------------------------------------------------ rows
+
+    def _grow_alive(self, rows_needed: int) -> None:
+        if rows_needed <= self._alive.shape[0]:
+            return
+        alive = np.zeros(max(_MIN_CAPACITY, rows_needed, self._alive.shape[0] * 2), dtype=bool)
+        alive[:self._alive.shape[0]] = self._alive
+        self._alive = alive
+
+    def _check_dim(self, dim: int) -> None:
+        if self._dim is None:
+            self._dim = int(dim)
+        elif self._dim != int(dim):
+            raise ValueError(f"Embedding dimension mismatch: store has {self._dim}, got {dim}")
+
+    @staticmethod
+    def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _append_pending(self, node_ids: List[str], embeddings: np.ndarray, metadata: List[dict]) -> None:
+        if not node_ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(node_ids):
+            raise ValueError("Embeddings must be a 2-D array with one row per node")
+        self._check_dim(vectors.shape[1])
+        replaced = self._existing_rows(node_ids)
+
+        count = len(self._pending_ids)
+        needed = count + len(node_ids)
+        if self._pending_vectors is None or self._pending_vectors.shape[0] < needed:
+            current = 0 if self._pending_vectors is None else self._pending_vectors.shape[0]
+            grown = np.zeros((max(_MIN_CAPACITY, needed, current * 2), self._dim), dtype=np.float32)
+            if count:
+                grown[:count] = self._pending_vectors[:count]
+            self._pending_vectors = grown
+        self._pending_vectors[count:needed] = self._normalize_rows(vectors)
+        if self._ann is not None:
+            self._ann.extend(self._pending_vectors[count:needed])
+
+        start = self.total_rows
+        for offset, meta in enumerate(metadata):
+            for field, value in _source_values(meta):
+                self._pending_sources.setdefault(field, {}).setdefault(value, []).append(count + offset)
+        self._pending_ids.extend(node_ids)
+        self._pending_metadata.extend(metadata)
+        self._grow_alive(self.total_rows)
+        self._alive[start:self.total_rows] = True
+        for row in replaced.values():
+            self._kill_row(row)
+        batch_rows: Dict[str, int] = {}
+        for offset, node_id in enumerate(node_ids):
+            if node_id in batch_rows:
+                self._kill_row(batch_rows[node_id])
+            batch_rows[node_id] = start + offset
+            if self._row_by_id is not None:
+                self._row_by_id[node_id] = start + offset
+
+    def _locate(self, row: int) -> Tuple[Optional[_Segment], int]:
+        if row >= self._persisted_rows:
+            return None, row - self._persisted_rows
+        idx = bisect.bisect_right([seg.start for seg in self._segments], row) - 1
+        seg = self._segments[idx]
+        return seg, row - seg.start
+
+    def _row_record(self, row: int) -> Tuple[str, dict]:
+        seg, local = self._locate(row)
+        if seg is None:
+            return self._pending_ids[local], self._pending_metadata[local]
+        return decode_row_line(seg.line(local))
+
+    def _metadata_at(self, row: int) -> dict:
+        return self._row_record(row)[1]
+
+    def _node_id_at(self, row: int) -> str:
+        seg, local = self._locate(row)
+        if seg is None:
+            return self._pending_ids[local]
+        return seg.line(local).split(b"\t", 1)[0].decode("utf-8")
+
+    def _ensure_row_index(self) -> Dict[str, int]:
+        """Build the node_id -> row map on first use; queries never need it."""
+        if self._row_by_id is not None:
+            return self._row_by_id
+        row_by_id: Dict[str, int] = {}
+        for seg in self._segments:
+            if seg.count == 0:
+                continue
+            lines = seg.rows[:int(seg.offsets[seg.count])].tobytes().split(b"\n")
+            for local in np.flatnonzero(self._alive[seg.start:seg.start + seg.count]):
+                row_by_id[lines[local].split(b"\t", 1)[0].decode("utf-8")] = seg.start + int(local)
+        for local, node_id in enumerate(self._pending_ids):
+            row = self._persisted_rows + local
+            if self._alive[row]:
+                row_by_id[node_id] = row
+        self._row_by_id = row_by_id
+        return row_by_id
+
+    def _existing_rows(self, node_ids: Sequence[str]) -> Dict[str, int]:
+        """
+        Live rows already holding any of `node_ids`. Without a built row index only the segments'
+        id hashes are scanned and just the hash hits are decoded, so appends never read all rows.
+        """
+        if self._row_by_id is not None:
+            return {nid: self._row_by_id[nid] for nid in node_ids if nid in self._row_by_id}
+        wanted = set(node_ids)
+        found: Dict[str, int] = {}
+        if self._segments:
+            hashes = node_id_hashes(list(wanted))
+            for seg in self._segments:
+                for local in np.flatnonzero(np.isin(seg.id_hashes, hashes)):
+                    row = seg.start + int(local)
+                    if self._alive[row]:
+                        node_id = self._node_id_at(row)
+                        if node_id in wanted:
+                            found[node_id] = row
+        for local, node_id in enumerate(self._pending_ids):
+            row = self._persisted_rows + local
+            if node_id in wanted and self._alive[row]:
+                found[node_id] = row
+        return found
+
+    def _kill_row(self, row: int) -> None:
+        if not self._alive[row]:
+            return
+        self._alive[row] = False
+        node_id = self._node_id_at(row)
+        if self._row_by_id is not None and self._row_by_id.get(node_id) == row:
+            del self._row_by_id[node_id]
+        seg, local = self._locate(row)
+        if seg is not None:
+            self._pending_tombstones.append((seg.id, local, node_id))
+
+    def _source_rows(self, field: str, value: str) -> np.ndarray:
+        """All rows (dead ones included) posted under `field == value`, ascending."""
+        parts = [_ranges_to_rows(seg.sources.get(field, {}).get(value, []), seg.start) for seg in self._segments]
+        pending = self._pending_sources.get(field, {}).get(value)
+        if pending:
+            parts.append(np.asarray(pending, dtype=np.int64) + self._persisted_rows)
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def _known_source_values(self, field: str) -> set:
+        values = set(self._pending_sources.get(field, {}))
+        for seg in self._segments:
+            values.update(seg.sources.get(field, {}))
+        return values
+
+    def rows_for_sources(self, values: Sequence[str], fields: Sequence[str] = SOURCE_POSTING_FIELDS) -> np.ndarray:
+        """Live rows whose source fields match any of `values`, straight from the postings."""
+        parts = [self._source_rows(field, str(value)) for field in fields for value in set(values)]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        rows = np.unique(np.concatenate(parts))
+        return rows[self._alive[rows]]
+
+    def node_ids_for_sources(self, values: Sequence[str], fields: Sequence[str] = SOURCE_POSTING_FIELDS) -> List[str]:
+        return [self._node_id_at(int(row)) for row in self.rows_for_sources(values, fields)]
+
+    @staticmethod
+    def _select_postings(rows: np.ndarray, source_rows: np.ndarray) -> np.ndarray:
+        """Positions within the ascending `rows` of those also in `source_rows`."""
+        positions = np.searchsorted(rows, source_rows)
+        inside = positions < len(rows)
+        positions = positions[inside]
+        return np.sort(positions[rows[positions] == source_rows[inside]])
+
+    def _postings_for_rows(self, rows: np.ndarray) -> Dict[str, Dict[str, List[List[int]]]]:
+        """Postings of a new segment made of the ascending global `rows`, in that order (compaction)."""
+        postings: Dict[str, Dict[str, List[List[int]]]] = {}
+        for field in SOURCE_POSTING_FIELDS:
+            for value in self._known_source_values(field):
+                local = self._select_postings(rows, self._source_rows(field, value))
+                if len(local):
+                    postings.setdefault(field, {})[value] = _rows_to_ranges(local)
+        return postings
+
+    def _pending_postings(self, pending_alive: np.ndarray) -> Dict[str, Dict[str, List[List[int]]]]:
+        """
+        Postings of the segment `persist()` writes from the ascending pending rows `pending_alive`.
+        Only the pending postings are read, so a commit costs the size of the change.
+        """
+        postings: Dict[str, Dict[str, List[List[int]]]] = {}
+        for field, values in self._pending_sources.items():
+            for value, pending_rows in values.items():
+                local = self._select_postings(pending_alive, np.asarray(pending_rows, dtype=np.int64))
+                if len(local):
+                    postings.setdefault(field, {})[value] = _rows_to_ranges(local)
+        return postings
+
+    def _gather_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Copy the vectors of ascending global `rows` out of the mapped segments and pending block."""
+        out = np.empty((len(rows), self._dim or 0), dtype=np.float32)
+        if not len(rows):
+            return out
+        starts = np.asarray([seg.start for seg in self._segments] + [self._persisted_rows], dtype=np.int64)
+        owner = np.searchsorted(starts, rows, side="right") - 1
+        for idx, seg in enumerate(self._segments):
+            picked = np.flatnonzero(owner == idx)
+            if len(picked):
+                out[picked] = seg.vectors[rows[picked] - seg.start]
+        picked = np.flatnonzero(rows >= self._persisted_rows)
+        if len(picked):
+            out[picked] = self._pending_vectors[rows[picked] - self._persisted_rows]
+        return out
+
+    def _iter_live_rows(self):
+        return (int(row) for row in np.flatnonzero(self._alive[:self.total_rows]))
+
+    def live_rows(self) -> np.ndarray:
+        """Ascending positions of all live rows."""
+        return np.flatnonzero(self._alive[:self.total_rows])
+
+    def iter_rows(
+        self, rows: Optional[np.ndarray] = None, batch_size: int = 1024
+    ) -> Iterator[Tuple[str, np.ndarray, dict]]:
+        """
+        Yield (node_id, vector, metadata) for `rows` (positions from `rows_for_sources` / `live_rows`;
+        all live rows by default), in ascending row order. Vectors are normalized copies, metadata is
+        the stored node dict. Only valid while the store is not modified.
+        """
+        rows = self.live_rows() if rows is None else np.sort(np.asarray(rows, dtype=np.int64))
+        for begin in range(0, len(rows), batch_size):
+            chunk = rows[begin:begin + batch_size]
+            vectors = self._gather_vectors(chunk)
+            for row, vector in zip(chunk.tolist(), vectors):
+                node_id, metadata = self._row_record(row)
+                yield node_id, vector, metadata
+
+    def _row_to_node(self, row: int) -> BaseNode:
+        node = metadata_dict_to_node(self._metadata_at(row))
+        node.embedding = None
+        return node
+
+    # ------------------------------------------------------------- llama API
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        self._append_pending(
+            [node.node_id for node in nodes],
+            np.asarray([node.get_embedding() for node in nodes], dtype=np.float32),
+            [node_to_metadata_dict(node, remove_text=False, flat_metadata=False) for node in nodes],
+        )
+        return [node.node_id for node in nodes]
+
+    def add_rows(self, node_ids: List[str], embeddings: np.ndarray, metadata: List[dict]) -> None:
+        """Add rows already in stored form (node metadata dicts as produced by `node_to_metadata_dict`)."""
+        self._append_pending(list(node_ids), embeddings, list(metadata))
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        for row in list(self._iter_live_rows()):
+            meta = self._metadata_at(row)
+            if meta.get("ref_doc_id") == ref_doc_id or meta.get("doc_id") == ref_doc_id:
+                self._kill_row(row)
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        filter_fn = build_metadata_filter_fn(self._metadata_at, filters)
+        if node_ids is not None:
+            row_by_id = self._ensure_row_index()
+            rows = [row_by_id[nid] for nid in set(node_ids) if nid in row_by_id]
+        else:
+            rows = list(self._iter_live_rows())
+        for row in rows:
+            if filters is None or filter_fn(row):
+                self._kill_row(row)
+
+    def delete_sources(self, values: Sequence[str], fields: Sequence[str] = SOURCE_POSTING_FIELDS) -> int:
+        """
+        Delete every live row posted under any of `values` in one batch.
+        Rows come from the source postings, so no metadata is decoded. Returns the number of rows deleted.
+        """
+        rows = self.rows_for_sources(values, fields)
+        if not len(rows):
+            return 0
+        self._alive[rows] = False
+        self._row_by_id = None
+        persisted = rows[rows < self._persisted_rows]
+        if len(persisted):
+            starts = np.asarray([seg.start for seg in self._segments], dtype=np.int64)
+            owner = np.searchsorted(starts, persisted, side="right") - 1
+            for row, idx in zip(persisted.tolist(), owner.tolist()):
+                seg = self._segments[idx]
+                local = row - seg.start
+                node_id = seg.line(local).split(b"\t", 1)[0].decode("utf-8")
+                self._pending_tombstones.append((seg.id, local, node_id))
+        return int(len(rows))
+
+    def clear(self) -> None:
+        for row in list(self._iter_live_rows()):
+            self._kill_row(row)
+
+    def get_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+    ) -> List[BaseNode]:
+        filter_fn = build_metadata_filter_fn(self._metadata_at, filters)
+        if node_ids is not None:
+            row_by_id = self._ensure_row_index()
+            rows = [row_by_id[nid] for nid in node_ids if nid in row_by_id]
+        else:
+            rows = list(self._iter_live_rows())
+        return [self._row_to_node(row) for row in rows if filters is None or filter_fn(row)]
+
+    def _candidate_mask(self, query: VectorStoreQuery) -> np.ndarray:
+        size = self.total_rows
+        mask = self._alive[:size].copy()
+        # VectorStoreIndex.from_vector_store passes an empty node id list; treat it as "no restriction".
+        if query.node_ids:
+            row_by_id = self._ensure_row_index()
+            allowed = np.zeros(size, dtype=bool)
+            allowed[[row_by_id[nid] for nid in query.node_ids if nid in row_by_id]] = True
+            mask &= allowed
+        if query.filters is not None:
+            posted_rows = self._rows_for_source_filters(query.filters)
+            if posted_rows is not None:
+                allowed = np.zeros(size, dtype=bool)
+                allowed[posted_rows] = True
+                mask &= allowed
+            else:
+                filter_fn = build_metadata_filter_fn(self._metadata_at, query.filters)
+                for row in np.flatnonzero(mask):
+                    if not filter_fn(int(row)):
+                        mask[row] = False
+        return mask
+
+    def _rows_for_source_filters(self, filters: MetadataFilters) -> Optional[np.ndarray]:
+        """
+        Resolve filters that only select sources (EQ / IN on posted fields, OR-ed together)
+        through the postings. Returns None for anything else so the generic filter path runs.
+        """
+        if len(filters.filters) > 1 and filters.condition != FilterCondition.OR:
+            return None
+        parts = []
+        for f in filters.filters:
+            if not isinstance(f, MetadataFilter) or f.key not in SOURCE_POSTING_FIELDS:
+                return None
+            if f.operator == FilterOperator.EQ:
+                values = [f.value]
+            elif f.operator == FilterOperator.IN and isinstance(f.value, list):
+                values = f.value
+            else:
+                return None
+            parts.append(self.rows_for_sources([str(v) for v in values], fields=(f.key,)))
+        if not parts:
+            return None
+        return np.unique(np.concatenate(parts))
+
+    def _score_rows(self, query_vector: np.ndarray) -> np.ndarray:
+        parts = [np.asarray(seg.vectors @ query_vector) for seg in self._segments if seg.count]
+        if self._pending_ids:
+            parts.append(self._pending_vectors[:len(self._pending_ids)] @ query_vector)
+        if not parts:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(parts)
+
+    def _ann_candidates(self, query_vector: np.ndarray, mask: np.ndarray, k: int, nprobe: Optional[int]) -> Optional[np.ndarray]:
+        """Rows to score through the IVF index, or None when exact search should run instead."""
+        if self._ann is None or self._ann.size != self.total_rows:
+            return None
+        if int(mask.sum()) < int(settings.VECTOR_ANN_MIN_CHUNKS):
+            return None
+        rows = self._ann.candidates(query_vector, nprobe or settings.VECTOR_ANN_NPROBE)
+        rows = rows[mask[rows]]
+        # Too few rows in the probed lists (e.g. a narrow filter): exact search keeps top-k complete.
+        if len(rows) < k:
+            return None
+        return rows
+
+    def _top_k(
+        self,
+        query_vector: np.ndarray,
+        mask: np.ndarray,
+        k: int,
+        exact: bool = False,
+        nprobe: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(max(1, int(k)), int(mask.sum()))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = None if exact else self._ann_candidates(query_vector, mask, k, nprobe)
+        if rows is None and int(mask.sum()) <= _GATHER_MAX_RATIO * mask.shape[0]:
+            # Narrow selections (e.g. a few sources) only score their own rows.
+            rows = np.flatnonzero(mask)
+        if rows is not None:
+            scores = self._gather_vectors(rows) @ query_vector
+        else:
+            scores = self._score_rows(query_vector)
+            scores[~mask] = -np.inf
+        if k < scores.shape[0]:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(scores.shape[0])
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return (top if rows is None else rows[top]), scores[top]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if self._dim is None or self.total_rows == 0 or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        query_vector = np.asarray(query.query_embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(query_vector))
+        if norm > 0:
+            query_vector = query_vector / norm
+
+        mask = self._candidate_mask(query)
+        if not mask.any():
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        top_rows, top_scores = self._top_k(
+            query_vector,
+            mask,
+            query.similarity_top_k,
+            exact=bool(kwargs.get("exact", False)),
+            nprobe=kwargs.get("nprobe"),
+        )
+        nodes = []
+        ids = []
+        for row in top_rows:
+            node_id, metadata = self._row_record(int(row))
+            node = metadata_dict_to_node(metadata)
+            node.embedding = None
+            nodes.append(node)
+            ids.append(node_id)
+        return VectorStoreQueryResult(nodes=nodes, similarities=[float(x) for x in top_scores], ids=ids)
+
+    # ----------------------------------------------------------- persistence
+
+    def _resolve_dir(self, persist_path: Optional[str]) -> str:
+        path = persist_path or self.persist_dir
+        if not path:
+            raise ValueError("NotebookVectorStore has no persist_dir")
+        self.persist_dir = path
+        return path
+
+    def _write_manifest(self, persist_dir: str) -> None:
+        manifest = {
+            "format_version": STORE_FORMAT_VERSION,
+            "dim": self._dim,
+            "model": self._resolved_model_name(),
+            "next_segment_id": self._next_segment_id,
+            "segments": [{"id": seg.id, "rows": seg.count} for seg in self._segments],
+            "dead_rows": self._dead_on_disk,
+        }
+        _write_atomic(os.path.join(persist_dir, MANIFEST_FILENAME), json.dumps(manifest))
+
+    def _open_segment(self, persist_dir: str, segment_id: int, start: int) -> _Segment:
+        header, vectors = open_vector_file(_segment_path(persist_dir, segment_id, "vec"))
+        if header["count"]:
+            self._check_dim(header["dim"])
+            model = self._resolved_model_name()
+            if header["model"] and header["model"] != model:
+                print(
+                    f"[VectorStore] Segment {segment_id} in {persist_dir} was embedded with "
+                    f"{header['model']}, current model is {model}"
+                )
+        offsets = np.fromfile(_segment_path(persist_dir, segment_id, "off"), dtype="<u8")
+        rows_path = _segment_path(persist_dir, segment_id, "rows")
+        if os.path.getsize(rows_path):
+            rows = np.memmap(rows_path, dtype=np.uint8, mode="r")
+        else:
+            rows = np.zeros(0, dtype=np.uint8)
+        with open(_segment_path(persist_dir, segment_id, "src"), "r", encoding="utf-8") as f:
+            sources = json.load(f)
+        return _Segment(
+            id=segment_id,
+            start=start,
+            count=header["count"],
+            vectors=vectors,
+            offsets=offsets,
+            rows=rows,
+            sources=sources,
+            id_hashes=np.fromfile(_segment_path(persist_dir, segment_id, "ids"), dtype="<u8"),
+        )
+
+    def _write_segment(
+        self,
+        persist_dir: str,
+        vectors: np.ndarray,
+        lines: List[bytes],
+        sources: Dict[str, Dict[str, List[List[int]]]],
+    ) -> _Segment:
+        segment_id = self._next_segment_id
+        self._next_segment_id += 1
+        os.makedirs(os.path.join(persist_dir, SEGMENTS_DIRNAME), exist_ok=True)
+
+        offsets = np.zeros(len(lines) + 1, dtype="<u8")
+        offsets[1:] = np.cumsum([len(line) for line in lines])
+        # The .vec file goes last: a segment is only referenced once the manifest names it.
+        _write_atomic_bytes(_segment_path(persist_dir, segment_id, "rows"), lines)
+        _write_atomic_bytes(_segment_path(persist_dir, segment_id, "off"), [offsets.tobytes()])
+        _write_atomic(_segment_path(persist_dir, segment_id, "src"), json.dumps(sources, ensure_ascii=False))
+        ids = node_id_hashes([line.split(b"\t", 1)[0].decode("utf-8") for line in lines])
+        _write_atomic_bytes(_segment_path(persist_dir, segment_id, "ids"), [ids.tobytes()])
+        write_vector_file(_segment_path(persist_dir, segment_id, "vec"), vectors, self._resolved_model_name())
+        return self._open_segment(persist_dir, segment_id, self._persisted_rows)
+
+    def _append_tombstones(self, persist_dir: str) -> None:
+        if not self._pending_tombstones:
+            return
+        with open(os.path.join(persist_dir, TOMBSTONES_FILENAME), "a", encoding="utf-8") as f:
+            for segment_id, local_row, node_id in self._pending_tombstones:
+                f.write(f"{segment_id} {local_row} {node_id}\n")
+        self._dead_on_disk += len(self._pending_tombstones)
+        self._pending_tombstones = []
+
+    def _reset_pending(self) -> None:
+        self._pending_ids = []
+        self._pending_metadata = []
+        self._pending_sources = {}
+        self._pending_vectors = None
+        self._row_by_id = None
+
+    def persist(self, persist_path: Optional[str] = None, fs: Any = None) -> None:
+        """Append pending rows as one new segment and pending deletions as tombstones."""
+        persist_dir = self._resolve_dir(persist_path)
+        os.makedirs(persist_dir, exist_ok=True)
+
+        pending_count = len(self._pending_ids)
+        pending_alive = np.flatnonzero(self._alive[self._persisted_rows:self.total_rows])
+        manifest_exists = os.path.exists(os.path.join(persist_dir, MANIFEST_FILENAME))
+        if not pending_count and not self._pending_tombstones and manifest_exists:
+            return
+
+        self._append_tombstones(persist_dir)
+        if pending_count:
+            start = self._persisted_rows
+            if len(pending_alive):
+                lines = [encode_row_line(self._pending_ids[i], self._pending_metadata[i]) for i in pending_alive]
+                sources = self._pending_postings(pending_alive)
+                self._segments.append(
+                    self._write_segment(persist_dir, self._pending_vectors[pending_alive], lines, sources)
+                )
+            # Pending rows are renumbered into the new segment; rows deleted before persisting are dropped.
+            if self._ann is not None:
+                self._ann.remap(np.concatenate([np.arange(start), start + pending_alive]))
+            self._alive[start:start + pending_count] = False
+            self._alive[start:start + len(pending_alive)] = True
+            self._persisted_rows += len(pending_alive)
+            self._reset_pending()
+
+        self._maintain_ann(persist_dir)
+        self._write_manifest(persist_dir)
+        self._drop_legacy_files(persist_dir)
+
+    def needs_compaction(self) -> bool:
+        if len(self._segments) > max(1, int(settings.VECTOR_COMPACT_MAX_SEGMENTS)):
+            return True
+        total_on_disk = sum(seg.count for seg in self._segments)
+        if total_on_disk <= 0:
+            return False
+        ratio = self._dead_on_disk / total_on_disk
+        return ratio >= float(settings.VECTOR_COMPACT_TOMBSTONE_RATIO)
+
+    def compact(self, persist_path: Optional[str] = None) -> None:
+        """Rewrite all live rows into a single segment and drop tombstones."""
+        persist_dir = self._resolve_dir(persist_path)
+        os.makedirs(persist_dir, exist_ok=True)
+
+        vector_parts: List[np.ndarray] = []
+        lines: List[bytes] = []
+        for seg in self._segments:
+            live_local = np.flatnonzero(self._alive[seg.start:seg.start + seg.count])
+            if not len(live_local):
+                continue
+            vector_parts.append(np.asarray(seg.vectors[live_local]))
+            # Row lines are copied byte-for-byte; metadata is never decoded during compaction.
+            lines.extend(seg.line(int(local)) for local in live_local)
+        pending_alive = np.flatnonzero(self._alive[self._persisted_rows:self.total_rows])
+        if len(pending_alive):
+            vector_parts.append(self._pending_vectors[pending_alive])
+            lines.extend(encode_row_line(self._pending_ids[i], self._pending_metadata[i]) for i in pending_alive)
+        live_rows = np.flatnonzero(self._alive[:self.total_rows])
+        sources = self._postings_for_rows(live_rows)
+        if self._ann is not None:
+            self._ann.remap(live_rows)
+
+        self._segments = []
+        self._persisted_rows = 0
+        self._pending_tombstones = []
+        self._reset_pending()
+        if lines:
+            seg = self._write_segment(persist_dir, np.concatenate(vector_parts), lines, sources)
+            self._segments = [seg]
+            self._persisted_rows = seg.count
+        self._alive = np.zeros(max(_MIN_CAPACITY, self._persisted_rows), dtype=bool)
+        self._alive[:self._persisted_rows] = True
+        self._dead_on_disk = 0
+        self._maintain_ann(persist_dir)
+        # Manifest first: until it is replaced, the old segments must keep their tombstones.
+        # Tombstones naming segments the new manifest does not list are ignored on load.
+        self._write_manifest(persist_dir)
+        _write_atomic(os.path.join(persist_dir, TOMBSTONES_FILENAME), "")
+        self._remove_unreferenced_segments(persist_dir)
+        self._drop_legacy_files(persist_dir)
+
+    def _train_ann(self) -> IVFFlatIndex:
+        live_rows = np.flatnonzero(self._alive[:self.total_rows])
+        nlist = default_list_count(len(live_rows))
+        rng = np.random.default_rng(len(live_rows))
+        sample_rows = np.sort(rng.choice(live_rows, training_sample_size(len(live_rows), nlist), replace=False))
+        ann = IVFFlatIndex.train(self._gather_vectors(sample_rows), nlist, trained_rows=len(live_rows))
+        # Dead rows are assigned too so list assignments stay aligned with store row numbers.
+        for seg in self._segments:
+            ann.extend(seg.vectors)
+        if self._pending_ids:
+            ann.extend(self._pending_vectors[:len(self._pending_ids)])
+        return ann
+
+    def build_ann_index(self) -> IVFFlatIndex:
+        """Train an in-memory IVF index over the current rows regardless of VECTOR_ANN_MODE."""
+        self._ann = self._train_ann()
+        return self._ann
+
+    def _maintain_ann(self, persist_dir: str) -> None:
+        """Build, retrain or drop the IVF index so it matches VECTOR_ANN_MODE and the notebook size."""
+        ann_path = os.path.join(persist_dir, ANN_FILENAME)
+        live = self.live_count
+        if settings.VECTOR_ANN_MODE != ANN_MODE_IVF or live < int(settings.VECTOR_ANN_MIN_CHUNKS):
+            self._ann = None
+            if os.path.exists(ann_path):
+                try:
+                    os.remove(ann_path)
+                except OSError:
+                    pass
+            return
+        # Lists trained on a much smaller notebook become too long; retrain once it has doubled.
+        if self._ann is None or self._ann.size != self.total_rows or live >= 2 * self._ann.trained_rows:
+            started_at = time.perf_counter()
+            self._ann = self._train_ann()
+            print(
+                f"[VectorStore] Trained IVF index for {persist_dir}: {live} rows, "
+                f"{self._ann.nlist} lists in {(time.perf_counter() - started_at) * 1000.0:.0f}ms"
+            )
+        self._ann.save(ann_path)
+
+    def _load_ann(self, persist_dir: str) -> None:
+        ann_path = os.path.join(persist_dir, ANN_FILENAME)
+        if settings.VECTOR_ANN_MODE != ANN_MODE_IVF or not os.path.exists(ann_path):
+            return
+        try:
+            ann = IVFFlatIndex.load(ann_path)
+        except Exception as e:
+            print(f"[VectorStore] Ignoring unreadable IVF index at {ann_path}: {e}")
+            return
+        if ann.size != self._persisted_rows:
+            # Written by an interrupted commit; exact search is used until the next persist retrains.
+            print(f"[VectorStore] Ignoring stale IVF index at {ann_path} ({ann.size} != {self._persisted_rows} rows)")
+            return
+        self._ann = ann
+
+    def _drop_legacy_files(self, persist_dir: str) -> None:
+        """Once the manifest holds a legacy store's rows, its llama_index JSON files are obsolete."""
+        if not self._legacy_source:
+            return
+        for name in LEGACY_INDEX_FILES:
+            try:
+                os.remove(os.path.join(persist_dir, name))
+            except OSError:
+                pass
+        self._legacy_source = False
+        print(f"[VectorStore] Converted legacy index at {persist_dir} ({self.live_count} nodes)")
+
+    def _remove_unreferenced_segments(self, persist_dir: str) -> None:
+        segments_dir = os.path.join(persist_dir, SEGMENTS_DIRNAME)
+        keep = {f"seg-{seg.id:08d}" for seg in self._segments}
+        try:
+            names = os.listdir(segments_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.split(".", 1)[0] in keep:
+                continue
+            try:
+                os.remove(os.path.join(segments_dir, name))
+            except OSError:
+                # Another process may still map the file (Windows); the next compaction retries.
+                pass
+
+    # --------------------------------------------------------------- loading
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, model_name: Optional[str] = None) -> "NotebookVectorStore":
+        """
+        Load a notebook store by mapping its segments. Loading never writes: readers (the API's
+        index cache) hold no writer lock. A legacy llama_index JSON store is read into memory
+        and converted by the next `persist()`, which only writers call under the notebook lock.
+        """
+        manifest_path = os.path.join(persist_dir, MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            store = cls(persist_dir=persist_dir, model_name=model_name)
+            if os.path.exists(os.path.join(persist_dir, "docstore.json")):
+                store._load_legacy(persist_dir)
+            return store
+
+        for attempt in range(2):
+            store = cls(persist_dir=persist_dir, model_name=model_name)
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            try:
+                store._load_segments(persist_dir, manifest)
+                return store
+            except FileNotFoundError:
+                # A compaction replaced the manifest and removed the segments we just read about.
+                if attempt:
+                    raise
+        return store
+
+    def _load_segments(self, persist_dir: str, manifest: dict) -> None:
+        self._next_segment_id = int(manifest.get("next_segment_id", 1))
+        self._dead_on_disk = int(manifest.get("dead_rows", 0))
+        if manifest.get("dim"):
+            self._dim = int(manifest["dim"])
+
+        start = 0
+        for entry in manifest.get("segments", []):
+            seg = self._open_segment(persist_dir, int(entry["id"]), start)
+            self._segments.append(seg)
+            start += seg.count
+        self._persisted_rows = start
+        self._alive = np.zeros(max(_MIN_CAPACITY, start), dtype=bool)
+        self._alive[:start] = True
+
+        seg_by_id = {seg.id: seg for seg in self._segments}
+        tombstones_path = os.path.join(persist_dir, TOMBSTONES_FILENAME)
+        if os.path.exists(tombstones_path):
+            with open(tombstones_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.split(" ", 2)
+                    if len(parts) != 3:
+                        continue
+                    seg = seg_by_id.get(int(parts[0]))
+                    local_row = int(parts[1])
+                    if seg is not None and 0 <= local_row < seg.count:
+                        self._alive[seg.start + local_row] = False
+        self._load_ann(persist_dir)
+
+    def _load_legacy(self, persist_dir: str) -> None:
+        storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
+        legacy_vectors = storage_context.vector_store
+        embedding_dict = getattr(getattr(legacy_vectors, "data", None), "embedding_dict", {}) or {}
+        docstore = storage_context.docstore
+
+        nodes = []
+        for node_id, embedding in embedding_dict.items():
+            node = docstore.get_node(node_id, raise_error=False)
+            if node is None:
+                continue
+            node.embedding = embedding
+            nodes.append(node)
+        self.add(nodes)
+        self._legacy_source = True
+        print(f"[VectorStore] Serving unconverted legacy index at {persist_dir} from memory ({len(nodes)} nodes)")
+
+
+def load_notebook_index(index_path: str) -> VectorStoreIndex:
+    store = NotebookVectorStore.from_persist_dir(index_path)
+    return VectorStoreIndex.from_vector_store(store)
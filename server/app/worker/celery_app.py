@@ -1,6 +1,5 @@
 from celery import Celery, Task
 from celery.signals import worker_process_init
-import asyncio
 
 from app.core.config import settings
 
@@ -44,9 +43,9 @@ class AsyncContextTask(Task):
     Celery doesn't natively support async/await well yet.
     """
     def run(self, *args, **kwargs):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        return loop.run_until_complete(self.run_async(*args, **kwargs))
+        from app.worker.event_loop import run_async
+
+        return run_async(self.run_async(*args, **kwargs))
 
     async def run_async(self, *args, **kwargs):
         raise NotImplementedError
@@ -0,0 +1,28 @@
+import asyncio
+from typing import Any, Coroutine, TypeVar
+
+from app.services.dashscope_client import dashscope_client
+from app.services.redis_clients import close_redis_clients
+
+T = TypeVar("T")
+
+
+async def _close_loop_clients() -> None:
+    try:
+        await dashscope_client.aclose()
+    except Exception as exc:
+        print(f"[Worker] Failed to close DashScope clients on loop shutdown: {exc}", flush=True)
+    await close_redis_clients()
+
+
+def run_async(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    asyncio.run() for Celery tasks: each task gets a fresh event loop, and the pooled clients
+    bound to that loop (DashScope HTTP, shared Redis) are closed before it shuts down, while
+    their sockets can still be closed cleanly.
+    """
+    with asyncio.Runner() as runner:
+        try:
+            return runner.run(coro)
+        finally:
+            runner.run(_close_loop_clients())
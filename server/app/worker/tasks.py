@@ -1,6 +1,6 @@
-import asyncio
 from app.services.ingestion import ingestion_service
 from app.worker.celery_app import celery_app
+from app.worker.event_loop import run_async
 from app.worker.retry_policy import is_non_retryable_error
 
 @celery_app.task(name="ingest_document", bind=True, max_retries=3)
@@ -12,7 +12,7 @@ def ingest_document_task(self, doc_id: str):
     print(f"[Task] Starting ingestion for doc_id: {doc_id}")
     try:
         # Always create/close a dedicated event loop in this sync Celery worker context.
-        asyncio.run(ingestion_service.run_pipeline(doc_id))
+        run_async(ingestion_service.run_pipeline(doc_id))
         
         return {"status": "success", "doc_id": doc_id}
     except Exception as e:
@@ -21,3 +21,22 @@ def ingest_document_task(self, doc_id: str):
             raise
         # Exponential backoff retry
         raise self.retry(exc=e, countdown=2 ** self.request.retries)
+
+
+@celery_app.task(name="compact_notebook_index")
+def compact_notebook_index_task(notebook_id: str):
+    """
+    Background compaction of a notebook's segmented vector index.
+    """
+    compacted = ingestion_service.compact_index(notebook_id)
+    return {"status": "compacted" if compacted else "skipped", "notebook_id": notebook_id}
+
+
+@celery_app.task(name="gc_chunk_cache")
+def gc_chunk_cache_task():
+    """
+    Evict stale chunk_cache rows (other models, expired, over the size budget).
+    """
+    from app.services.chunk_cache_gc import run_garbage_collection
+
+    return run_async(run_garbage_collection())
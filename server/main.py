@@ -16,12 +16,17 @@ settings.apply_network_settings()
 settings.init_llama_index()
 
 from app.api.endpoints import files, chat, system
+from app.services.dashscope_client import dashscope_client
+from app.services.redis_clients import close_redis_clients
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     yield
     # Shutdown
+    await dashscope_client.aclose()
+    dashscope_client.close()
+    await close_redis_clients()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
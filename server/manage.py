@@ -24,6 +24,17 @@ _SERVICE_COLORS = {
     "API": "\x1b[32m",
 }
 
+def _worker_pool_args() -> list[str]:
+    # Index commits are serialized per notebook by a Redis lock, so documents can be ingested
+    # in parallel with e.g. WORKER_POOL=threads WORKER_CONCURRENCY=4.
+    pool = os.getenv("WORKER_POOL", "solo").strip() or "solo"
+    args = ["-P", pool]
+    concurrency = os.getenv("WORKER_CONCURRENCY", "").strip()
+    if pool != "solo" and concurrency:
+        args += ["--concurrency", concurrency]
+    return args
+
+
 SERVICE_SPECS = {
     "redis": {
         "command": [str(REDIS_SERVER)],
@@ -42,8 +53,7 @@ SERVICE_SPECS = {
             "app.worker.celery_app",
             "worker",
             "--loglevel=INFO",
-            "-P",
-            "solo",
+            *_worker_pool_args(),
         ],
         "port": None,
     },
@@ -411,15 +421,51 @@ def cmd_health() -> int:
     return 0 if healthy else 1
 
 
+def cmd_cache_stats() -> int:
+    import asyncio
+
+    from app.db.session import AsyncSessionLocal
+    from app.services.chunk_cache_gc import cache_report
+
+    async def _report() -> dict:
+        async with AsyncSessionLocal() as db:
+            return await cache_report(db)
+
+    print(json.dumps(asyncio.run(_report()), ensure_ascii=False, indent=2))
+    return 0
+
+
+def cmd_cache_gc(dry_run: bool = False) -> int:
+    import asyncio
+
+    from app.services.chunk_cache_gc import run_garbage_collection
+
+    result = asyncio.run(run_garbage_collection(dry_run=dry_run))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+def cmd_migrate_indexes() -> int:
+    from app.core.config import settings
+    from app.services.index_writer import notebook_index_writer
+
+    base = Path(settings.VECTOR_STORE_DIR)
+    notebook_ids = sorted(p.name for p in base.iterdir() if p.is_dir()) if base.is_dir() else []
+    converted = [nb for nb in notebook_ids if notebook_index_writer.convert_legacy(nb)]
+    print(f"Converted {len(converted)} legacy index(es) of {len(notebook_ids)} notebook(s)")
+    return 0
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description="IntelliNote service manager")
     parser.add_argument(
         "command",
         nargs="?",
         default="run",
-        choices=("run", "up", "down", "status", "restart", "health"),
+        choices=("run", "up", "down", "status", "restart", "health", "cache-stats", "cache-gc", "migrate-indexes"),
         help="Service command",
     )
+    parser.add_argument("--dry-run", action="store_true", help="cache-gc: report what would be evicted")
     args = parser.parse_args()
 
     command_map = {
@@ -429,6 +475,9 @@ def main() -> int:
         "status": cmd_status,
         "restart": cmd_restart,
         "health": cmd_health,
+        "cache-stats": cmd_cache_stats,
+        "cache-gc": lambda: cmd_cache_gc(dry_run=args.dry_run),
+        "migrate-indexes": cmd_migrate_indexes,
     }
     return command_map[args.command]()
 
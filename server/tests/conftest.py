@@ -0,0 +1,107 @@
+import pytest
+
+
+class FakePipeline:
+    """Queues commands and applies them in one `execute()`, like a non-transactional redis pipeline."""
+
+    def __init__(self, server):
+        self._server = server
+        self._ops = []
+
+    def __getattr__(self, command):
+        def _queue(*args, **kwargs):
+            self._ops.append((command, args, kwargs))
+            return self
+
+        return _queue
+
+    async def execute(self):
+        self._server.round_trips += 1
+        ops, self._ops = self._ops, []
+        return [self._server.apply(command, *args, **kwargs) for command, args, kwargs in ops]
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the redis.asyncio commands the services use. Values live in `data`,
+    expirations (seconds, never enforced) in `ttls`; `round_trips` counts commands and pipeline
+    executions. `info()` reports `used_memory`, which tests set to simulate a full server.
+    """
+
+    def __init__(self, used_memory=0):
+        self.data = {}
+        self.ttls = {}
+        self.round_trips = 0
+        self.used_memory = used_memory
+
+    def apply(self, command, *args, **kwargs):
+        return getattr(self, f"_{command}")(*args, **kwargs)
+
+    def pipeline(self, transaction=False):
+        return FakePipeline(self)
+
+    def __getattr__(self, command):
+        if command.startswith("_") or not hasattr(type(self), f"_{command}"):
+            raise AttributeError(command)
+
+        async def _call(*args, **kwargs):
+            self.round_trips += 1
+            return self.apply(command, *args, **kwargs)
+
+        return _call
+
+    def _get(self, key):
+        return self.data.get(key)
+
+    def _mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def _set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        self.ttls[key] = ex
+        return True
+
+    def _exists(self, *keys):
+        return sum(key in self.data for key in keys)
+
+    def _delete(self, *keys):
+        removed = [key for key in keys if self.data.pop(key, None) is not None]
+        for key in removed:
+            self.ttls.pop(key, None)
+        return len(removed)
+
+    def _expire(self, key, seconds):
+        if key not in self.data:
+            return False
+        self.ttls[key] = seconds
+        return True
+
+    def _hincrby(self, key, field, amount=1):
+        bucket = self.data.setdefault(key, {})
+        bucket[field] = bucket.get(field, 0) + amount
+        return bucket[field]
+
+    def _hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def _eval(self, script, numkeys, *args):
+        # Only the owner-checked release the services run: delete each key still holding the token.
+        keys, token = args[:numkeys], args[numkeys]
+        owned = [key for key in keys if self.data.get(key) == token]
+        return self._delete(*owned)
+
+    def _info(self, section=None):
+        return {"used_memory": self.used_memory}
+
+    async def close(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
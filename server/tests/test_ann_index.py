@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from app.core.config import settings
+from app.services.ann_index import ANN_FILENAME, IVFFlatIndex
+from app.services.vector_store import NotebookVectorStore
+
+
+def _clustered_vectors(rows: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    return centers[labels] + 0.3 * rng.standard_normal((rows, dim)).astype(np.float32)
+
+
+def _nodes(vectors: np.ndarray, prefix: str = "n"):
+    return [
+        TextNode(id_=f"{prefix}{i}", text=f"chunk {i}", embedding=vectors[i].tolist())
+        for i in range(vectors.shape[0])
+    ]
+
+
+def _enable_ivf(monkeypatch, min_chunks=500):
+    monkeypatch.setattr(settings, "VECTOR_ANN_MODE", "ivf")
+    monkeypatch.setattr(settings, "VECTOR_ANN_MIN_CHUNKS", min_chunks)
+    monkeypatch.setattr(settings, "VECTOR_ANN_NPROBE", 8)
+
+
+def test_ivf_candidates_cover_probed_lists():
+    vectors = _clustered_vectors(400, 8, 4, seed=1)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = IVFFlatIndex.train(vectors, nlist=4)
+    index.extend(vectors)
+
+    assert index.size == 400
+    assert len(index.candidates(vectors[0], nprobe=4)) == 400
+    assert 0 < len(index.candidates(vectors[0], nprobe=1)) < 400
+
+
+def test_ivf_index_is_built_on_persist_and_matches_exact_search(tmp_path, monkeypatch):
+    _enable_ivf(monkeypatch)
+    path = str(tmp_path / "nb")
+    vectors = _clustered_vectors(2000, 16, 20, seed=2)
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.add(_nodes(vectors))
+    store.persist(path)
+
+    assert os.path.exists(os.path.join(path, ANN_FILENAME))
+    reloaded = NotebookVectorStore.from_persist_dir(path)
+    assert reloaded.ann_index is not None
+
+    recalls = []
+    for q in _clustered_vectors(20, 16, 20, seed=3):
+        query = VectorStoreQuery(query_embedding=q.tolist(), similarity_top_k=10)
+        approx = set(reloaded.query(query).ids)
+        exact = set(reloaded.query(query, exact=True).ids)
+        recalls.append(len(approx & exact) / len(exact))
+    assert np.mean(recalls) >= 0.9
+
+
+def test_ivf_index_follows_inserts_and_deletes(tmp_path, monkeypatch):
+    _enable_ivf(monkeypatch)
+    path = str(tmp_path / "nb")
+    vectors = _clustered_vectors(1000, 8, 10, seed=4)
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.add(_nodes(vectors))
+    store.persist(path)
+
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.add(_nodes(vectors[:50] * 1.01, prefix="extra"))
+    store.delete_nodes(["n0"])
+    store.persist()
+    assert store.ann_index.size == store.total_rows
+
+    reloaded = NotebookVectorStore.from_persist_dir(path)
+    result = reloaded.query(VectorStoreQuery(query_embedding=vectors[0].tolist(), similarity_top_k=3))
+    assert "n0" not in result.ids
+    assert "extra0" in result.ids
+
+    reloaded.compact()
+    assert reloaded.ann_index.size == reloaded.live_count == 1049
+
+
+def test_exact_mode_drops_ivf_index(tmp_path, monkeypatch):
+    _enable_ivf(monkeypatch)
+    path = str(tmp_path / "nb")
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.add(_nodes(_clustered_vectors(600, 8, 6, seed=6)))
+    store.persist(path)
+    assert os.path.exists(os.path.join(path, ANN_FILENAME))
+
+    monkeypatch.setattr(settings, "VECTOR_ANN_MODE", "exact")
+    store.compact()
+
+    assert store.ann_index is None
+    assert not os.path.exists(os.path.join(path, ANN_FILENAME))
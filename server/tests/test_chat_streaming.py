@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "dummy_key")
+os.environ.setdefault("DASHSCOPE_API_KEY", "dummy_key")
+
+import httpx
+import pytest
+
+from app.api.endpoints import chat
+from app.services.dashscope_client import DashScopeClient
+
+
+def _sse(*contents, finish=True):
+    lines = []
+    for i, text in enumerate(contents, start=1):
+        body = {"output": {"choices": [{"message": {"role": "assistant", "content": text}, "finish_reason": "null"}]}}
+        lines += [f"id:{i}", "event:result", ":HTTP_STATUS/200", f"data:{json.dumps(body, ensure_ascii=False)}", ""]
+    return "\n".join(lines).encode("utf-8")
+
+
+def _collect(agen):
+    async def _run():
+        return [item async for item in agen]
+
+    return asyncio.run(_run())
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    calls = []
+    responses = []
+
+    def _handler(request):
+        calls.append(request)
+        return responses.pop(0)
+
+    client = DashScopeClient(async_transport=httpx.MockTransport(_handler))
+    monkeypatch.setattr(chat, "dashscope_client", client)
+    monkeypatch.setattr(chat.settings, "DASHSCOPE_LLM_API_KEY", "test-key")
+    monkeypatch.delenv("DASHSCOPE_FORCE_NO_PROXY", raising=False)
+    return calls, responses
+
+
+def test_stream_forwards_incremental_tokens(transport):
+    calls, responses = transport
+    responses.append(httpx.Response(200, content=_sse("你好", "，世界")))
+
+    events = _collect(chat._stream_dashscope_chat([{"role": "user", "content": "hi"}]))
+
+    assert events == [("token", "你好"), ("token", "，世界")]
+    assert calls[0].headers["X-DashScope-SSE"] == "enable"
+    assert json.loads(calls[0].content)["parameters"]["incremental_output"] is True
+
+
+def test_stream_falls_back_to_next_attempt_before_first_token(transport):
+    calls, responses = transport
+    responses.append(httpx.Response(502, json={"code": "BadGateway", "message": "upstream"}))
+    responses.append(httpx.Response(200, content=_sse("ok")))
+
+    events = _collect(chat._stream_dashscope_chat([{"role": "user", "content": "hi"}]))
+
+    assert events == [("token", "ok")]
+    assert len(calls) == 2
+
+
+def test_forced_no_proxy_makes_a_single_direct_attempt(transport, monkeypatch):
+    calls, responses = transport
+    monkeypatch.setenv("DASHSCOPE_FORCE_NO_PROXY", "1")
+    responses.append(httpx.Response(502, json={"code": "BadGateway", "message": "upstream"}))
+
+    events = _collect(chat._stream_dashscope_chat([{"role": "user", "content": "hi"}]))
+
+    assert chat._dashscope_attempts() == [("direct", True)]
+    assert len(calls) == 1 and events[0][0] == "error"
+
+
+def test_stream_reports_error_event(transport):
+    calls, responses = transport
+    error = json.dumps({"code": "InvalidApiKey", "message": "Invalid API-key provided."})
+    for _ in range(len(chat._dashscope_attempts())):
+        responses.append(httpx.Response(200, content=f"id:1\nevent:error\ndata:{error}\n\n".encode()))
+
+    events = _collect(chat._stream_dashscope_chat([{"role": "user", "content": "hi"}]))
+
+    assert len(events) == 1 and events[0][0] == "error"
+    assert chat._classify_llm_error(events[0][1])[0] == "E_LLM_AUTH"
+
+
+def test_chat_query_sends_citations_before_fallback_answer(monkeypatch):
+    from unittest.mock import MagicMock
+
+    from fastapi.testclient import TestClient
+    from main import app
+
+    node = MagicMock()
+    node.score = 0.9
+    node.node.node_id = "chunk-1"
+    node.node.metadata = {"source_file_id": "src-1", "filename": "a.pdf"}
+    node.node.get_content.return_value = "Citation content."
+    index = MagicMock()
+    index.as_retriever.return_value.retrieve.return_value = [node]
+
+    async def _failing_stream(messages):
+        yield "error", "primary: HTTP 500"
+
+    monkeypatch.setattr(chat, "get_cached_index", lambda notebook_id: index)
+    monkeypatch.setattr(chat, "_stream_dashscope_chat", _failing_stream)
+
+    async def _cached_embedding(embed_model, question):
+        return [0.1, 0.2]
+
+    monkeypatch.setattr(chat.query_embedding_cache, "get_or_embed", _cached_embedding)
+
+    content = TestClient(app).post("/api/v1/chat/query", json={"notebook_id": "nb_1", "question": "Hi"}).text
+
+    events = [line[len("data: "):] for line in content.splitlines() if line.startswith("data: ")]
+    assert '"citations"' in events[0]
+    assert any('"token"' in e for e in events[1:])
+    assert events[-1] == "[DONE]"
@@ -0,0 +1,183 @@
+import asyncio
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.db.session import Base
+from app.models.chunk_cache import ChunkCache
+from app.services.chunk_cache_gc import ChunkCacheAccessTracker, collect_garbage
+from app.services.embedding_codec import encode_embedding
+
+NOW = 1_800_000_000
+DAY = 86400
+
+
+def _run(tmp_path, rows, work):
+    async def _main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'cache.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[ChunkCache.__table__])
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        try:
+            async with session_factory() as db:
+                db.add_all([ChunkCache(**row) for row in rows])
+                await db.commit()
+            async with session_factory() as db:
+                result = await work(db)
+                await db.commit()
+            async with session_factory() as db:
+                remaining = {
+                    (m, h): t for m, h, t in (await db.execute(
+                        select(ChunkCache.model_name, ChunkCache.text_hash, ChunkCache.last_accessed_at)
+                    )).all()
+                }
+            return result, remaining
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(_main())
+
+
+def _row(model, text_hash, accessed, dim=4):
+    return {
+        "text_hash": text_hash,
+        "model_name": model,
+        "embedding": encode_embedding([0.0] * dim),
+        "last_accessed_at": accessed,
+    }
+
+
+def _configure(monkeypatch, max_mb=0, max_age_days=0, drop_other=False):
+    monkeypatch.setattr(settings, "EMBED_MODEL_NAME", "current")
+    monkeypatch.setattr(settings, "EMBED_CACHE_MAX_MB", max_mb)
+    monkeypatch.setattr(settings, "EMBED_CACHE_MAX_AGE_DAYS", max_age_days)
+    monkeypatch.setattr(settings, "EMBED_CACHE_GC_DROP_OTHER_MODELS", drop_other)
+
+
+def test_gc_drops_other_models_and_expired_rows(tmp_path, monkeypatch):
+    _configure(monkeypatch, max_age_days=30, drop_other=True)
+    rows = [
+        _row("current", "fresh", NOW - DAY),
+        _row("current", "stale", NOW - 31 * DAY),
+        _row("retired", "fresh", NOW),
+    ]
+
+    result, remaining = _run(tmp_path, rows, lambda db: collect_garbage(db, now=NOW))
+
+    assert set(remaining) == {("current", "fresh")}
+    assert result["deleted_rows"] == 2
+    assert result["by_reason"]["other_models"]["rows"] == 1
+    assert result["by_reason"]["expired"]["rows"] == 1
+
+
+def test_gc_trims_least_recently_used_rows_to_budget(tmp_path, monkeypatch):
+    _configure(monkeypatch, max_mb=1)
+    # 64 KiB vectors (float32 * 16384) -> 20 rows is ~1.25 MiB, over a 1 MiB budget.
+    rows = [_row("current", f"h{i:02d}", NOW - i, dim=16384) for i in range(20)]
+
+    result, remaining = _run(tmp_path, rows, lambda db: collect_garbage(db, now=NOW))
+
+    evicted = {f"h{i:02d}" for i in range(20)} - {h for _, h in remaining}
+    # The oldest-accessed rows go first.
+    assert evicted == {f"h{i:02d}" for i in range(20 - len(evicted), 20)}
+    assert sum(len(r["embedding"]) for r in rows) - result["deleted_bytes"] <= 1024 * 1024
+    assert result["by_reason"]["over_budget"]["rows"] == len(evicted) == 5
+
+
+def test_gc_pages_past_ties_in_access_time(tmp_path, monkeypatch):
+    from app.services import chunk_cache_gc
+
+    _configure(monkeypatch, max_mb=1)
+    monkeypatch.setattr(chunk_cache_gc, "_GC_SCAN_ROWS", 3)
+    # Pairs of rows share an access time, and each text_hash exists under two models, so every
+    # page boundary falls inside a tie that the keyset has to step past without skipping rows.
+    rows = [
+        _row(model, f"h{i:02d}", NOW - i // 2, dim=16384)
+        for i in range(10)
+        for model in ("current", "other")
+    ]
+
+    result, remaining = _run(tmp_path, rows, lambda db: collect_garbage(db, now=NOW))
+
+    evicted = {(r["model_name"], r["text_hash"]) for r in rows} - set(remaining)
+    # Oldest access time first, then text_hash, then model_name: five rows bring it under budget.
+    expected = [("current", "h08"), ("other", "h08"), ("current", "h09"), ("other", "h09"), ("current", "h06")]
+    assert evicted == set(expected)
+    assert result["by_reason"]["over_budget"]["rows"] == len(evicted)
+
+
+def test_gc_dry_run_reports_without_deleting(tmp_path, monkeypatch):
+    _configure(monkeypatch, max_age_days=30, drop_other=True)
+    rows = [_row("current", "stale", NOW - 40 * DAY), _row("retired", "x", NOW)]
+
+    result, remaining = _run(tmp_path, rows, lambda db: collect_garbage(db, dry_run=True, now=NOW))
+
+    assert len(remaining) == 2
+    assert result["dry_run"] is True
+    assert result["deleted_rows"] == 2
+    assert result["deleted_bytes"] == sum(len(r["embedding"]) for r in rows)
+
+
+def test_access_tracker_batches_touches_and_skips_recent_rows(tmp_path, monkeypatch, fake_redis):
+    monkeypatch.setattr(settings, "EMBED_CACHE_TOUCH_GRANULARITY_SECONDS", 3600)
+    monkeypatch.setattr(settings, "EMBED_CACHE_TOUCH_FLUSH_ROWS", 2)
+    tracker = ChunkCacheAccessTracker(redis_factory=lambda: fake_redis)
+    rows = [_row("m", "old", 0), _row("m", "recent", NOW * 2), _row("m", "untouched", 0)]
+
+    tracker.touch("m", ["old", "recent"])
+    tracker.touch("m", ["old"])
+    tracker.record_lookups(lookups=5, hits=2)
+    assert tracker.pending == 2
+    assert tracker.flush_due()
+
+    updated, remaining = _run(tmp_path, rows, tracker.flush)
+
+    assert updated == 1
+    assert remaining[("m", "old")] > 0
+    assert remaining[("m", "recent")] == NOW * 2
+    assert remaining[("m", "untouched")] == 0
+    assert tracker.pending == 0
+    assert fake_redis.data["embed:cache:stats"] == {"lookups": 5, "hits": 2}
+
+
+def test_access_tracker_is_safe_across_worker_threads(fake_redis):
+    import threading
+
+    tracker = ChunkCacheAccessTracker(redis_factory=lambda: fake_redis)
+
+    def _ingest(worker):
+        for i in range(500):
+            tracker.touch("m", [f"w{worker}-{i}", "shared"])
+            tracker.record_lookups(lookups=2, hits=1)
+
+    threads = [threading.Thread(target=_ingest, args=(w,)) for w in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tracker.pending == 8 * 500 + 1
+
+    class _Db:
+        # Another thread touching while the flush is writing lands in the next batch.
+        async def execute(self, stmt):
+            tracker.touch("m", ["late"])
+            return type("Result", (), {"rowcount": 0})()
+
+    asyncio.run(tracker.flush(_Db()))
+    assert tracker.pending == 1
+    assert fake_redis.data["embed:cache:stats"] == {"lookups": 8000, "hits": 4000}
+
+
+def test_gc_dry_run_counts_rows_matching_several_reasons_once(tmp_path, monkeypatch):
+    _configure(monkeypatch, max_age_days=30, drop_other=True)
+    rows = [_row("retired", f"h{i}", NOW - 40 * DAY) for i in range(10)]
+    (tmp_path / "dry").mkdir()
+    (tmp_path / "real").mkdir()
+
+    dry, _ = _run(tmp_path / "dry", rows, lambda db: collect_garbage(db, dry_run=True, now=NOW))
+    real, remaining = _run(tmp_path / "real", rows, lambda db: collect_garbage(db, now=NOW))
+
+    assert remaining == {}
+    assert (dry["deleted_rows"], dry["deleted_bytes"]) == (real["deleted_rows"], real["deleted_bytes"])
+    assert dry["by_reason"]["other_models"]["rows"] == 10 and dry["by_reason"]["expired"]["rows"] == 0
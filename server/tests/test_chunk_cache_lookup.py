@@ -0,0 +1,72 @@
+import asyncio
+from unittest.mock import MagicMock
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.db.session import Base
+from app.models.chunk_cache import ChunkCache
+from app.services.embedding_codec import encode_embedding
+from app.services.smart_embedding import SmartEmbeddingManager
+
+
+def _run_with_session(tmp_path, work):
+    async def _main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'cache.db'}")
+        statements = []
+        event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[ChunkCache.__table__])
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        try:
+            return await work(session_factory), statements
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(_main())
+
+
+def test_lookup_is_chunked_under_parameter_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EMBED_CACHE_LOOKUP_CHUNK", 400)
+    manager = SmartEmbeddingManager(MagicMock())
+    manager.model_name = "m"
+    hashes = [f"h{i:05d}" for i in range(1500)]
+
+    async def _work(session_factory):
+        async with session_factory() as db:
+            await manager._store_cached_blobs(db, [
+                {"text_hash": h, "model_name": "m", "embedding": encode_embedding([float(i)])}
+                for i, h in enumerate(hashes[::2])
+            ])
+            await db.commit()
+        async with session_factory() as db:
+            return await manager._lookup_cached_blobs(db, hashes)
+
+    found, statements = _run_with_session(tmp_path, _work)
+
+    assert sorted(found) == hashes[::2]
+    lookups = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+    assert len(lookups) == 4
+
+
+def test_concurrent_cache_writes_do_not_conflict(tmp_path):
+    row = {"text_hash": "h1", "model_name": "m", "embedding": encode_embedding([1.0])}
+
+    async def _work(session_factory):
+        async with session_factory() as db:
+            await SmartEmbeddingManager._store_cached_blobs(db, [row])
+            await db.commit()
+        # A second worker caching the same text (plus a new one) must not raise IntegrityError.
+        other = {"text_hash": "h2", "model_name": "m", "embedding": encode_embedding([2.0])}
+        async with session_factory() as db:
+            await SmartEmbeddingManager._store_cached_blobs(db, [dict(row), other])
+            await db.commit()
+        async with session_factory() as db:
+            manager = SmartEmbeddingManager(MagicMock())
+            manager.model_name = "m"
+            return await manager._lookup_cached_blobs(db, ["h1", "h2"])
+
+    found, _ = _run_with_session(tmp_path, _work)
+
+    assert sorted(found) == ["h1", "h2"]
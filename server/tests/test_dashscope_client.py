@@ -0,0 +1,130 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.services import dashscope_client as dashscope_module
+from app.services.dashscope_client import ENDPOINT_EMBEDDING, DashScopeClient
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"ok": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_endpoint(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _JsonHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setitem(dashscope_module.ENDPOINT_URLS, ENDPOINT_EMBEDDING, f"http://127.0.0.1:{server.server_port}/")
+    yield
+    server.shutdown()
+    server.server_close()
+
+
+def test_sync_requests_reuse_one_connection(local_endpoint):
+    client = DashScopeClient()
+    try:
+        for _ in range(3):
+            assert client.post(ENDPOINT_EMBEDDING, headers={}, json={}, direct=True).json() == {"ok": True}
+    finally:
+        client.close()
+
+    stats = client.stats()["endpoints"][ENDPOINT_EMBEDDING]
+    assert stats["requests"] == 3
+    assert stats["new_connections"] == 1
+    assert stats["reused_connections"] == 2
+
+
+def test_async_requests_reuse_one_connection(local_endpoint):
+    client = DashScopeClient()
+
+    async def _run():
+        try:
+            for _ in range(3):
+                await client.apost(ENDPOINT_EMBEDDING, headers={}, json={}, direct=True)
+        finally:
+            await client.aclose()
+
+    asyncio.run(_run())
+
+    stats = client.stats()["endpoints"][ENDPOINT_EMBEDDING]
+    assert (stats["new_connections"], stats["reused_connections"]) == (1, 2)
+
+
+def test_proxy_transport_error_is_retried_direct():
+    attempts = []
+
+    def _handler(request):
+        attempts.append(request)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("proxy refused", request=request)
+        return httpx.Response(200, json={"ok": True})
+
+    client = DashScopeClient(transport=httpx.MockTransport(_handler))
+    response = client.post(ENDPOINT_EMBEDDING, headers={}, json={}, direct=False)
+
+    assert response.status_code == 200
+    stats = client.stats()["endpoints"][ENDPOINT_EMBEDDING]
+    assert stats["direct_fallbacks"] == 1
+    assert stats["failures"] == 1
+    assert sorted(client._clients) == [False, True]
+
+
+def test_async_endpoint_concurrency_is_limited(monkeypatch):
+    monkeypatch.setattr(settings, "DASHSCOPE_EMBED_MAX_CONCURRENCY", 2)
+    in_flight = []
+    peak = []
+
+    async def _handler(request):
+        in_flight.append(request)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.pop()
+        return httpx.Response(200, json={})
+
+    client = DashScopeClient(async_transport=httpx.MockTransport(_handler))
+
+    async def _run():
+        await asyncio.gather(*[client.apost(ENDPOINT_EMBEDDING, headers={}, json={}) for _ in range(6)])
+
+    asyncio.run(_run())
+
+    assert max(peak) == 2
+    assert client.stats()["endpoints"][ENDPOINT_EMBEDDING]["requests"] == 6
+
+
+def test_worker_loop_closes_its_async_clients_before_shutdown(local_endpoint, monkeypatch):
+    from app.worker import event_loop
+
+    client = DashScopeClient()
+    monkeypatch.setattr(event_loop, "dashscope_client", client)
+    pooled = []
+
+    async def _run():
+        await client.apost(ENDPOINT_EMBEDDING, headers={}, json={}, direct=True)
+        pooled.extend(client._loop_state().clients.values())
+
+    event_loop.run_async(_run())
+    assert len(pooled) == 1 and pooled[0].is_closed
+
+    event_loop.run_async(_run())
+    # The closed loop's state is evicted on the next call instead of accumulating.
+    assert client.stats()["async_loops"] == 1
+    assert len(pooled) == 2 and all(c.is_closed for c in pooled)
@@ -17,7 +17,7 @@ def test_request_embeddings_sorts_by_text_index():
         }
     }
 
-    with patch("app.services.dashscope_http_embedding.requests.post", return_value=mock_resp):
+    with patch("app.services.dashscope_http_embedding.dashscope_client.post", return_value=mock_resp):
         vectors = model._request_embeddings(["a", "b"])
 
     assert vectors == [[1.0, 1.0], [2.0, 2.0]]
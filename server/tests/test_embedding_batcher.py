@@ -0,0 +1,55 @@
+import asyncio
+from unittest.mock import MagicMock
+
+from app.core.config import settings
+from app.services.embedding_batcher import estimate_tokens, pack_batches, packing_stats
+from app.services.smart_embedding import SmartEmbeddingManager
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("向量检索") == 4
+    assert estimate_tokens("") == 1
+
+
+def test_pack_batches_respects_token_and_item_caps():
+    tokens = [900, 50, 400, 600, 30, 30, 2000, 100]
+    batches = pack_batches(tokens, max_tokens=1000, max_items=3)
+
+    assert sorted(p for batch in batches for p in batch) == list(range(len(tokens)))
+    for batch in batches:
+        assert len(batch) <= 3
+        assert batch == sorted(batch)
+        # Only a single oversized text may exceed the budget.
+        assert sum(tokens[p] for p in batch) <= 1000 or batch == [6]
+    assert len(batches) == 4
+
+
+def test_short_texts_share_requests_compared_to_fixed_batches():
+    tokens = [5] * 40
+    batches = pack_batches(tokens, max_tokens=8000, max_items=10)
+    stats = packing_stats(tokens, batches, fixed_batch_size=1)
+
+    assert stats.requests == 4
+    assert stats.fixed_count_requests == 40
+    assert stats.requests_saved == 36
+
+
+def test_packed_batches_are_reassembled_in_input_order(monkeypatch):
+    monkeypatch.setattr(settings, "EMBED_AIMD_ENABLED", False)
+    monkeypatch.setattr(settings, "EMBED_BATCH_MAX_TOKENS", 20)
+    monkeypatch.setattr(settings, "EMBED_BATCH_MAX_ITEMS", 4)
+    manager = SmartEmbeddingManager(MagicMock())
+    requests = []
+
+    async def _fake_embed(texts):
+        requests.append(texts)
+        return [[float(len(t))] for t in texts]
+
+    monkeypatch.setattr(manager, "_aembed_text_batch_via_http", _fake_embed)
+    texts = ["x" * n for n in (40, 4, 8, 60, 4, 4, 12)]
+
+    vectors = asyncio.run(manager._embed_missing_texts(texts))
+
+    assert vectors == [[float(len(t))] for t in texts]
+    assert len(requests) == manager.last_packing_stats.requests < len(texts)
@@ -0,0 +1,51 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from app.services.embedding_codec import decode_compact_embedding, decode_embedding, decode_embeddings, encode_embedding
+
+
+def test_float32_blob_is_compact_and_round_trips():
+    vector = [0.1 * i for i in range(1024)]
+
+    blob = encode_embedding(vector)
+
+    assert len(blob) == 8 + 1024 * 4
+    assert len(blob) * 2 < len(pickle.dumps(vector))
+    np.testing.assert_array_equal(decode_embedding(blob), np.asarray(vector, dtype=np.float32))
+
+
+def test_float16_blob_decodes_to_float32():
+    blob = encode_embedding([0.25, -1.5, 3.0], dtype="float16")
+
+    decoded = decode_embedding(blob)
+
+    assert len(blob) == 8 + 3 * 2
+    assert decoded.dtype == np.float32
+    assert decoded.tolist() == [0.25, -1.5, 3.0]
+
+
+def test_legacy_pickle_rows_still_decode():
+    assert decode_embedding(pickle.dumps([1.0, 2.0])).tolist() == [1.0, 2.0]
+
+
+def test_decode_embeddings_builds_one_matrix_from_mixed_rows():
+    blobs = [encode_embedding([1.0, 2.0]), encode_embedding([3.0, 4.0])]
+    assert decode_embeddings(blobs).tolist() == [[1.0, 2.0], [3.0, 4.0]]
+
+    mixed = blobs + [pickle.dumps([5.0, 6.0]), encode_embedding([7.0, 8.0], dtype="float16")]
+    assert decode_embeddings(mixed).tolist() == [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0], [7.0, 8.0]]
+
+
+def test_unknown_dtype_is_rejected():
+    with pytest.raises(ValueError):
+        encode_embedding([1.0], dtype="int8")
+
+
+def test_strict_decoder_never_unpickles():
+    with pytest.raises(ValueError):
+        decode_compact_embedding(pickle.dumps([0.1, 0.2]))
+    with pytest.raises(ValueError):
+        decode_compact_embedding(encode_embedding([0.1, 0.2])[:-1])
+    assert decode_compact_embedding(encode_embedding([0.5, 0.25])).tolist() == [0.5, 0.25]
@@ -0,0 +1,83 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import httpx
+
+from app.core.config import settings
+from app.services.embedding_controller import AdaptiveEmbeddingController, is_congestion_error
+from app.services.smart_embedding import SmartEmbeddingManager
+
+
+class _MemoryStore:
+    def __init__(self, state=None):
+        self.state = dict(state or {})
+
+    async def load(self, key):
+        return self.state.get(key)
+
+    async def save(self, key, state):
+        self.state[key] = {k: str(v) for k, v in state.items()}
+
+
+def _throttled():
+    request = httpx.Request("POST", "https://dashscope.test/embeddings")
+    return httpx.HTTPStatusError("429", request=request, response=httpx.Response(429, request=request))
+
+
+def _caps(monkeypatch, items=10, in_flight=8):
+    monkeypatch.setattr(settings, "EMBED_BATCH_MAX_ITEMS", items)
+    monkeypatch.setattr(settings, "EMBED_MAX_IN_FLIGHT", in_flight)
+    monkeypatch.setattr(settings, "EMBED_AIMD_TARGET_LATENCY_MS", 1000)
+
+
+def test_controller_grows_additively_and_halves_on_throttle(monkeypatch):
+    _caps(monkeypatch)
+    controller = AdaptiveEmbeddingController("m", state_store=_MemoryStore())
+    assert (controller.batch_items, controller.in_flight) == (5, 4)
+
+    for _ in range(4):
+        controller.record_success(0.1)
+    assert (controller.batch_items, controller.in_flight) == (6, 5)
+
+    controller.record_success(5.0)  # slow: holds the point
+    assert controller.in_flight == 5
+
+    controller.record_failure(_throttled())
+    controller.record_failure(_throttled())  # same congestion episode
+    assert (controller.batch_items, controller.in_flight) == (3, 2)
+
+    controller.record_failure(ValueError("bad payload"))
+    assert (controller.batch_items, controller.in_flight) == (3, 2)
+
+
+def test_congestion_errors_are_classified():
+    assert is_congestion_error(_throttled())
+    assert is_congestion_error(httpx.ReadTimeout("slow"))
+    assert not is_congestion_error(ValueError("x"))
+
+
+def test_operating_point_is_persisted_for_new_processes(monkeypatch):
+    _caps(monkeypatch)
+    monkeypatch.setattr(settings, "EMBED_AIMD_ENABLED", True)
+    monkeypatch.setattr(settings, "EMBED_BATCH_MAX_TOKENS", 8000)
+    store = _MemoryStore({"embed:aimd:m": {"batch_items": "2", "in_flight": "3"}})
+    manager = SmartEmbeddingManager(MagicMock())
+    manager.controller = AdaptiveEmbeddingController("m", state_store=store)
+    sizes = []
+
+    async def _fake_embed(texts):
+        sizes.append(len(texts))
+        return [[1.0] for _ in texts]
+
+    monkeypatch.setattr(manager, "_aembed_text_batch_via_http", _fake_embed)
+
+    vectors = asyncio.run(manager._embed_missing_texts(["t"] * 6))
+
+    assert len(vectors) == 6
+    # Warm start from the stored point: batches of 2 instead of the cold default of 5.
+    assert sizes == [2, 2, 2]
+    assert int(store.state["embed:aimd:m"]["in_flight"]) >= 3
+
+    fresh = AdaptiveEmbeddingController("m", state_store=store)
+    asyncio.run(fresh.ensure_loaded())
+    assert fresh.in_flight == int(store.state["embed:aimd:m"]["in_flight"])
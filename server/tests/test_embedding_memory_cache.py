@@ -0,0 +1,54 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import numpy as np
+from llama_index.core.schema import TextNode
+
+from app.services import smart_embedding
+from app.services.embedding_memory_cache import EmbeddingLRUCache
+from app.services.smart_embedding import SmartEmbeddingManager
+
+
+def _entry_size(dim):
+    return EmbeddingLRUCache._entry_bytes(np.zeros(dim, dtype=np.float32))
+
+
+def test_lru_is_bounded_by_bytes_and_evicts_least_recent():
+    cache = EmbeddingLRUCache(max_bytes=_entry_size(4) * 2)
+    cache.put_many("m", [("a", [1.0] * 4), ("b", [2.0] * 4)])
+    assert set(cache.get_many("m", ["a"])) == {"a"}  # "a" becomes most recent
+
+    cache.put_many("m", [("c", [3.0] * 4)])
+
+    assert set(cache.get_many("m", ["a", "b", "c"])) == {"a", "c"}
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3 and stats["misses"] == 1
+
+
+def test_keys_are_scoped_by_model():
+    cache = EmbeddingLRUCache(max_bytes=1 << 20)
+    cache.put_many("m1", [("h", [1.0])])
+    assert cache.get_many("m2", ["h"]) == {}
+
+
+def test_memory_hits_skip_the_database(monkeypatch):
+    manager = SmartEmbeddingManager(MagicMock())
+    manager.model_name = "m"
+    manager.memory_cache = EmbeddingLRUCache(max_bytes=1 << 20)
+    node = TextNode(id_="n1", text="repeated footer")
+    manager.memory_cache.put_many("m", [(manager._compute_hash(node.get_content(metadata_mode="embed")), [0.5, 0.25])])
+
+    def _no_db():
+        raise AssertionError("database should not be queried")
+
+    monkeypatch.setattr(smart_embedding, "AsyncSessionLocal", _no_db)
+
+    stats = asyncio.run(manager.batch_embed_nodes([node]))
+
+    assert node.embedding == [0.5, 0.25]
+    assert stats["memory_hits"] == 1 and stats["db_hits"] == 0 and stats["api_embedded"] == 0
+    assert stats["memory_hit_ratio"] == 1.0
+    assert stats["memory_cache"]["hits"] == 1
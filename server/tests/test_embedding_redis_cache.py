@@ -0,0 +1,118 @@
+import asyncio
+import pickle
+from unittest.mock import MagicMock
+
+import pytest
+from llama_index.core.schema import TextNode
+
+from app.core.config import settings
+from app.services import smart_embedding
+from app.services.embedding_codec import encode_embedding
+from app.services.embedding_memory_cache import EmbeddingLRUCache
+from app.services.embedding_redis_cache import RedisEmbeddingCache
+from app.services.smart_embedding import SmartEmbeddingManager
+
+
+class _Boom:
+    def __reduce__(self):
+        return (pytest.fail, ("Redis value was unpickled",))
+
+
+def _enable(monkeypatch):
+    monkeypatch.setattr(settings, "EMBED_REDIS_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "EMBED_REDIS_CACHE_TTL_SECONDS", 60)
+
+
+def test_batch_is_served_by_one_round_trip(monkeypatch, fake_redis):
+    _enable(monkeypatch)
+    server = fake_redis
+    cache = RedisEmbeddingCache(client_factory=lambda: server)
+    hashes = [f"h{i}" for i in range(2500)]
+
+    asyncio.run(cache.put_many("m", [(h, [float(i)]) for i, h in enumerate(hashes[:2000])]))
+    server.round_trips = 0
+    found = asyncio.run(cache.get_many("m", hashes))
+
+    assert server.round_trips == 1
+    assert len(found) == 2000 and found["h7"].tolist() == [7.0]
+    assert set(server.ttls.values()) == {60}
+    assert cache.stats()["hit_ratio"] == 0.8
+
+
+def test_non_compact_values_are_misses_and_never_unpickled(monkeypatch, fake_redis):
+    _enable(monkeypatch)
+    cache = RedisEmbeddingCache(client_factory=lambda: fake_redis)
+    fake_redis.data[cache.key("m", "evil")] = pickle.dumps(_Boom())
+    fake_redis.data[cache.key("m", "ok")] = encode_embedding([1.0, 2.0])
+
+    found = asyncio.run(cache.get_many("m", ["evil", "ok"]))
+
+    assert list(found) == ["ok"] and found["ok"].tolist() == [1.0, 2.0]
+    assert cache.stats()["misses"] == 1
+
+
+def test_writes_pause_above_memory_cap(monkeypatch, fake_redis):
+    _enable(monkeypatch)
+    monkeypatch.setattr(settings, "EMBED_REDIS_CACHE_MAX_MB", 1)
+    server = fake_redis
+    server.used_memory = 2 * 1024 * 1024
+    cache = RedisEmbeddingCache(client_factory=lambda: server)
+
+    asyncio.run(cache.put_many("m", [("h", [1.0])]))
+
+    assert server.data == {}
+    assert cache.stats()["skipped_writes"] == 1
+
+
+def test_disabled_tier_never_connects(monkeypatch):
+    monkeypatch.setattr(settings, "EMBED_REDIS_CACHE_ENABLED", False)
+    cache = RedisEmbeddingCache(client_factory=lambda: (_ for _ in ()).throw(AssertionError("connected")))
+
+    assert asyncio.run(cache.get_many("m", ["h"])) == {}
+    asyncio.run(cache.put_many("m", [("h", [1.0])]))
+
+
+def test_redis_hits_fill_nodes_before_the_database(monkeypatch, fake_redis):
+    _enable(monkeypatch)
+    server = fake_redis
+    manager = SmartEmbeddingManager(MagicMock())
+    manager.model_name = "m"
+    manager.memory_cache = EmbeddingLRUCache(max_bytes=1 << 20)
+    manager.redis_cache = RedisEmbeddingCache(client_factory=lambda: server)
+    node = TextNode(id_="n1", text="shared across hosts")
+    text_hash = manager._compute_hash(node.get_content(metadata_mode="embed"))
+    asyncio.run(manager.redis_cache.put_many("m", [(text_hash, [0.5, 0.5])]))
+
+    def _no_db():
+        raise AssertionError("database should not be queried")
+
+    monkeypatch.setattr(smart_embedding, "AsyncSessionLocal", _no_db)
+
+    stats = asyncio.run(manager.batch_embed_nodes([node]))
+
+    assert node.embedding == [0.5, 0.5]
+    assert stats["redis_hits"] == 1
+    # Promoted into the in-process tier for the next document.
+    assert text_hash in manager.memory_cache.get_many("m", [text_hash])
+
+
+def test_shared_client_is_reused_within_a_loop_and_replaced_across_loops():
+    from app.services.redis_clients import close_redis_clients, shared_redis_client
+
+    async def _twice():
+        first, second = shared_redis_client(), shared_redis_client()
+        text = shared_redis_client(decode_responses=True)
+        return first, second, text
+
+    first, second, text = asyncio.run(_twice())
+    assert first is second
+    assert text is not first
+
+    async def _next_loop():
+        client = shared_redis_client()
+        await close_redis_clients()
+        return client, shared_redis_client()
+
+    client, after_close = asyncio.run(_next_loop())
+    assert client is not first
+    assert after_close is not client
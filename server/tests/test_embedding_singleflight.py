@@ -0,0 +1,104 @@
+import asyncio
+from unittest.mock import MagicMock
+
+from llama_index.core.schema import TextNode
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.db.session import Base
+from app.models.chunk_cache import ChunkCache
+from app.services import smart_embedding
+from app.services.embedding_memory_cache import EmbeddingLRUCache
+from app.services.embedding_singleflight import EmbeddingSingleFlight
+from app.services.smart_embedding import SmartEmbeddingManager
+
+
+def _enable(monkeypatch):
+    monkeypatch.setattr(settings, "EMBED_SINGLEFLIGHT_ENABLED", True)
+    monkeypatch.setattr(settings, "EMBED_SINGLEFLIGHT_POLL_MS", 10)
+    monkeypatch.setattr(settings, "EMBED_SINGLEFLIGHT_WAIT_SECONDS", 5)
+    monkeypatch.setattr(settings, "EMBED_REDIS_CACHE_ENABLED", False)
+
+
+def test_claims_are_exclusive_and_released_by_owner_only(monkeypatch, fake_redis):
+    _enable(monkeypatch)
+    server = fake_redis
+    flight = EmbeddingSingleFlight(client_factory=lambda: server)
+
+    async def _main():
+        owned_a, waiting_a, token_a = await flight.claim("m", ["h1", "h2"])
+        owned_b, waiting_b, token_b = await flight.claim("m", ["h2", "h3"])
+        await flight.release("m", ["h2"], token_b)  # not b's claim: must stay
+        assert server.data[flight.key("m", "h2")] == token_a
+        await flight.release("m", owned_a, token_a)
+        settled, timed_out = await flight.wait("m", waiting_b)
+        return owned_a, waiting_a, owned_b, waiting_b, settled, timed_out
+
+    owned_a, waiting_a, owned_b, waiting_b, settled, timed_out = asyncio.run(_main())
+
+    assert (owned_a, waiting_a) == (["h1", "h2"], [])
+    assert (owned_b, waiting_b) == (["h3"], ["h2"])
+    assert (settled, timed_out) == (["h2"], [])
+
+
+def test_unreachable_redis_embeds_everything(monkeypatch):
+    _enable(monkeypatch)
+
+    def _down():
+        raise ConnectionError("redis down")
+
+    class _BrokenClient:
+        def pipeline(self, transaction=False):
+            _down()
+
+        async def aclose(self):
+            pass
+
+    flight = EmbeddingSingleFlight(client_factory=_BrokenClient)
+    owned, waiting, _ = asyncio.run(flight.claim("m", ["h1", "h2"]))
+
+    assert owned == ["h1", "h2"] and waiting == []
+
+
+def test_concurrent_ingestions_embed_shared_chunks_once(tmp_path, monkeypatch, fake_redis):
+    _enable(monkeypatch)
+    server = fake_redis
+    embedded = []
+
+    def _manager():
+        manager = SmartEmbeddingManager(MagicMock())
+        manager.model_name = "m"
+        manager.memory_cache = EmbeddingLRUCache(max_bytes=0)
+        manager.single_flight = EmbeddingSingleFlight(client_factory=lambda: server)
+
+        async def _fake_embed(texts, progress_callback=None):
+            embedded.extend(texts)
+            await asyncio.sleep(0.05)
+            return [[float(len(t)), 1.0] for t in texts]
+
+        manager._embed_missing_texts = _fake_embed
+        return manager
+
+    async def _main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'cache.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[ChunkCache.__table__])
+        monkeypatch.setattr(smart_embedding, "AsyncSessionLocal", async_sessionmaker(engine, expire_on_commit=False))
+        try:
+            deck_v1 = [TextNode(text=f"slide {i}") for i in range(6)]
+            deck_v2 = [TextNode(text=f"slide {i}") for i in range(3, 9)]
+            stats = await asyncio.gather(
+                _manager().batch_embed_nodes(deck_v1),
+                _manager().batch_embed_nodes(deck_v2),
+            )
+            return deck_v1 + deck_v2, stats
+        finally:
+            await engine.dispose()
+
+    nodes, stats = asyncio.run(_main())
+
+    assert sorted(embedded) == sorted(f"slide {i}" for i in range(9))
+    assert all(node.embedding == [7.0, 1.0] for node in nodes)
+    assert sum(s["api_embedded"] for s in stats) == 9
+    assert sum(s["singleflight_reused"] for s in stats) == 3
+    assert server.data == {}
@@ -22,7 +22,8 @@ client = TestClient(app)
 # --- Fixtures ---
 @pytest_asyncio.fixture(autouse=True)
 async def setup_database():
-    # Cleanup old
+    # Cleanup old (pooled connections would keep writing to the unlinked file)
+    await engine.dispose()
     if os.path.exists("./test_suite.db"):
         try: os.remove("./test_suite.db")
         except: pass
@@ -82,8 +83,16 @@ async def test_chat_streaming():
     mock_node.node.get_content.return_value = "Citation content."
 
     # Patch get_cached_index to return a mock index that provides as_retriever
+    async def _fake_stream(messages):
+        for token in ("Hello ", "World"):
+            yield "token", token
+
+    async def _cached_embedding(embed_model, question):
+        return [0.1, 0.2]
+
     with patch("app.api.endpoints.chat.get_cached_index") as mock_get_index, \
-         patch("app.api.endpoints.chat._call_dashscope_chat", return_value=("Hello World", "")):
+         patch("app.api.endpoints.chat._stream_dashscope_chat", _fake_stream), \
+         patch("app.api.endpoints.chat.query_embedding_cache.get_or_embed", _cached_embedding):
         mock_index = MagicMock()
         mock_retriever = MagicMock()
         mock_retriever.retrieve.return_value = [mock_node]
@@ -104,5 +113,36 @@ async def test_chat_streaming():
         # Verify Content (SSE format)
         content = response.text
         assert "data: " in content
-        assert "Hello World" in content
+        assert "Hello " in content and "World" in content
         assert '"citations"' in content
+
+
+@pytest.mark.asyncio
+async def test_bulk_delete_documents():
+    """测试批量删除文档（单次索引重写）"""
+    with patch("app.api.endpoints.files.ingest_document_task") as mock_task:
+        mock_task.delay = MagicMock()
+        doc_ids = []
+        for name in ("a.txt", "b.txt"):
+            response = client.post(
+                "/api/v1/files/upload",
+                data={"notebook_id": "nb_bulk"},
+                files={"file": (name, f"content of {name}".encode(), "text/plain")}
+            )
+            doc_ids.append(response.json()["doc_id"])
+
+    assert client.post("/api/v1/files/bulk-delete", json={"notebook_id": "nb_bulk"}).status_code == 400
+
+    with patch("app.services.ingestion.ingestion_service.delete_documents", return_value=4) as mock_delete:
+        response = client.post(
+            "/api/v1/files/bulk-delete",
+            json={"notebook_id": "nb_bulk", "doc_ids": doc_ids + ["missing"]},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert sorted(data["deleted"]) == sorted(doc_ids)
+        assert data["missing"] == ["missing"]
+        assert data["removed_artifacts"] == 2
+        mock_delete.assert_called_once()
+
+    assert client.get(f"/api/v1/files/{doc_ids[0]}/status").status_code == 404
@@ -0,0 +1,90 @@
+import threading
+import time
+
+from app.services.index_cache import NotebookIndexCache, bump_index_version, read_index_version
+
+
+def _build_cache(tmp_path, max_entries=2, delay_s=0.0):
+    calls = []
+
+    def _loader(index_path):
+        calls.append(index_path)
+        if delay_s:
+            time.sleep(delay_s)
+        return object()
+
+    cache = NotebookIndexCache(
+        max_entries=max_entries,
+        loader=_loader,
+        path_resolver=lambda notebook_id: str(tmp_path / notebook_id),
+    )
+    return cache, calls
+
+
+def test_read_index_version_none_for_missing_folder(tmp_path):
+    assert read_index_version(str(tmp_path / "missing")) is None
+
+
+def test_cache_hit_reuses_loaded_index(tmp_path):
+    bump_index_version(str(tmp_path / "nb_1"))
+    cache, calls = _build_cache(tmp_path)
+
+    first = cache.get("nb_1")
+    second = cache.get("nb_1")
+
+    assert first is second
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["loads"] == 1
+
+
+def test_cache_reloads_after_version_bump(tmp_path):
+    bump_index_version(str(tmp_path / "nb_1"))
+    cache, calls = _build_cache(tmp_path)
+
+    first = cache.get("nb_1")
+    bump_index_version(str(tmp_path / "nb_1"))
+    second = cache.get("nb_1")
+
+    assert first is not second
+    assert len(calls) == 2
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    for nb in ("nb_1", "nb_2", "nb_3"):
+        bump_index_version(str(tmp_path / nb))
+    cache, calls = _build_cache(tmp_path, max_entries=2)
+
+    cache.get("nb_1")
+    cache.get("nb_2")
+    cache.get("nb_1")
+    cache.get("nb_3")
+    cache.get("nb_1")
+
+    assert len(calls) == 3
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["entries"] == 2
+
+
+def test_cache_single_flight_under_concurrency(tmp_path):
+    bump_index_version(str(tmp_path / "nb_1"))
+    cache, calls = _build_cache(tmp_path, delay_s=0.05)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("nb_1"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert len({id(r) for r in results}) == 1
+
+
+def test_cache_returns_none_without_index(tmp_path):
+    cache, calls = _build_cache(tmp_path)
+    assert cache.get("nb_missing") is None
+    assert calls == []
@@ -0,0 +1,147 @@
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+
+from app.services import index_writer
+from app.services.index_writer import STAGING_DIRNAME, NotebookIndexWriter, _RenewingLock
+from app.services.vector_store import NotebookVectorStore
+
+
+def _build_writer(tmp_path):
+    locks = {}
+    guard = threading.Lock()
+
+    def _lock_factory(notebook_id):
+        with guard:
+            return locks.setdefault(notebook_id, threading.Lock())
+
+    return NotebookIndexWriter(lock_factory=_lock_factory, path_resolver=lambda nb: str(tmp_path / nb))
+
+
+def _nodes(doc_id, count=3):
+    rng = np.random.default_rng(abs(hash(doc_id)) % 1000)
+    return [
+        TextNode(
+            id_=f"{doc_id}-{i}",
+            text=f"{doc_id} chunk {i}",
+            embedding=rng.standard_normal(4).tolist(),
+            metadata={"source_file_id": doc_id},
+        )
+        for i in range(count)
+    ]
+
+
+def test_commit_nodes_persists_and_clears_staging(tmp_path):
+    writer = _build_writer(tmp_path)
+
+    result = writer.commit_nodes("nb_1", "doc-1", _nodes("doc-1"), window_ms=0)
+
+    assert result["committed_by_other"] is False
+    assert result["batches"] == 1
+    store = NotebookVectorStore.from_persist_dir(str(tmp_path / "nb_1"))
+    assert sorted(store.node_ids_for_sources(["doc-1"])) == ["doc-1-0", "doc-1-1", "doc-1-2"]
+    assert os.listdir(tmp_path / "nb_1" / STAGING_DIRNAME) == []
+
+
+def test_concurrent_commits_are_serialized_and_coalesced(tmp_path):
+    writer = _build_writer(tmp_path)
+    results = {}
+
+    def _ingest(doc_id):
+        results[doc_id] = writer.commit_nodes("nb_1", doc_id, _nodes(doc_id), window_ms=200)
+
+    threads = [threading.Thread(target=_ingest, args=(f"doc-{i}",)) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    store = NotebookVectorStore.from_persist_dir(str(tmp_path / "nb_1"))
+    # No document's nodes are lost to a last-writer-wins persist.
+    assert store.live_count == 18
+    assert sum(r["batches"] for r in results.values()) == 6
+    # Documents finishing inside one window share a single segment append.
+    assert store.segment_count < 6
+    assert any(r["committed_by_other"] for r in results.values())
+    # Every commit marker was collected by the task that owned the batch.
+    assert os.listdir(tmp_path / "nb_1" / STAGING_DIRNAME) == []
+
+
+def test_failed_commit_discards_own_batch(tmp_path, monkeypatch):
+    writer = _build_writer(tmp_path)
+
+    def _boom(self, persist_path=None, fs=None):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(NotebookVectorStore, "persist", _boom)
+    try:
+        writer.commit_nodes("nb_1", "doc-1", _nodes("doc-1"), window_ms=0)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("commit should fail")
+
+    assert os.listdir(tmp_path / "nb_1" / STAGING_DIRNAME) == []
+
+
+def test_batch_removed_without_commit_is_a_failure(tmp_path, monkeypatch):
+    writer = _build_writer(tmp_path)
+
+    def _delete_index_meanwhile(seconds):
+        # The notebook index is deleted while this batch waits out its commit window.
+        shutil.rmtree(tmp_path / "nb_1")
+
+    monkeypatch.setattr(index_writer.time, "sleep", _delete_index_meanwhile)
+    with pytest.raises(RuntimeError, match="vanished"):
+        writer.commit_nodes("nb_1", "doc-1", _nodes("doc-1"), window_ms=10)
+
+
+class _FakeRedisLock:
+    name = "idxlock:nb_1"
+
+    def __init__(self):
+        self.held = False
+        self.renewals = 0
+
+    def acquire(self):
+        self.held = True
+        return True
+
+    def reacquire(self):
+        self.renewals += 1
+        return True
+
+    def release(self):
+        self.held = False
+
+
+def test_redis_lock_is_renewed_while_held_and_shares_one_client(monkeypatch):
+    created = []
+
+    class _Client:
+        def __init__(self):
+            created.append(self)
+
+        def lock(self, name, timeout, blocking_timeout):
+            return _FakeRedisLock()
+
+    monkeypatch.setattr(index_writer, "_lock_client", None)
+    monkeypatch.setattr(index_writer.redis.Redis, "from_url", lambda url: _Client())
+    index_writer._redis_lock_factory("nb_1")
+    index_writer._redis_lock_factory("nb_2")
+    assert len(created) == 1
+
+    lock = _FakeRedisLock()
+    with _RenewingLock(lock, interval=0.01):
+        time.sleep(0.1)
+        assert lock.held
+    renewals = lock.renewals
+    time.sleep(0.05)
+
+    assert renewals >= 2 and lock.renewals == renewals
+    assert not lock.held
@@ -0,0 +1,215 @@
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "dummy_key")
+os.environ.setdefault("DASHSCOPE_API_KEY", "dummy_key")
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.db.session import Base
+from app.models.artifact import Artifact
+from app.models.document import DocStatus, Document
+from app.services import ingestion
+from app.services.index_writer import notebook_index_writer
+from app.services.ingest_checkpoint import STAGE_CHUNKED, STAGE_EMBEDDED, IngestCheckpointStore, ingest_checkpoints
+from app.services.ingestion import ingestion_service
+from app.services.node_cloning import index_fingerprint
+from app.services.vector_store import NotebookVectorStore
+
+
+@pytest.fixture(autouse=True)
+def _local_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    monkeypatch.setattr(settings, "INGEST_CHECKPOINT_ENABLED", True)
+    monkeypatch.setattr(settings, "INGEST_CHECKPOINT_TTL_HOURS", 24.0)
+    monkeypatch.setattr(settings, "VECTOR_STORE_DIR", str(tmp_path / "indexes"))
+    monkeypatch.setattr(settings, "PARSE_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "INDEX_COMMIT_WINDOW_MS", 0)
+    monkeypatch.setattr(notebook_index_writer, "_lock_factory", lambda notebook_id: threading.Lock())
+
+
+def _nodes():
+    nodes = [TextNode(id_=f"n{i}", text=f"chunk {i}", metadata={"source_file_id": "doc-1", "page_number": i}) for i in range(3)]
+    nodes[0].relationships[NodeRelationship.NEXT] = RelatedNodeInfo(node_id="n1")
+    nodes[0].excluded_embed_metadata_keys.append("source_file_id")
+    return nodes
+
+
+def test_checkpoint_round_trip_per_stage():
+    store = IngestCheckpointStore()
+    nodes = _nodes()
+
+    store.save("doc-1", "hash", "fp", STAGE_CHUNKED, nodes, {"parser": "text"})
+    chunked = store.load("doc-1", "hash", "fp")
+    assert chunked.stage == STAGE_CHUNKED and chunked.detail == {"parser": "text"}
+    assert [(n.node_id, n.get_content(), n.metadata) for n in chunked.nodes] == [
+        (n.node_id, n.get_content(), n.metadata) for n in nodes
+    ]
+    assert chunked.nodes[0].relationships[NodeRelationship.NEXT].node_id == "n1"
+    assert chunked.nodes[0].excluded_embed_metadata_keys == ["source_file_id"]
+    assert all(n.embedding is None for n in chunked.nodes)
+
+    for i, node in enumerate(nodes):
+        node.embedding = [float(i), 0.5]
+    store.save("doc-1", "hash", "fp", STAGE_EMBEDDED, nodes)
+    embedded = store.load("doc-1", "hash", "fp")
+    assert embedded.stage == STAGE_EMBEDDED
+    assert [n.embedding for n in embedded.nodes] == [[0.0, 0.5], [1.0, 0.5], [2.0, 0.5]]
+
+
+def test_stale_or_foreign_checkpoints_are_dropped(monkeypatch):
+    store = IngestCheckpointStore()
+    store.save("doc-1", "hash", "fp", STAGE_CHUNKED, _nodes())
+
+    assert store.load("doc-1", "hash", "other-config") is None
+    assert not os.path.exists(os.path.join(settings.INGEST_CHECKPOINT_DIR, "doc-1"))
+
+    store.save("doc-1", "hash", "fp", STAGE_CHUNKED, _nodes())
+    monkeypatch.setattr(time, "time", lambda: 10 ** 12)
+    assert store.load("doc-1", "hash", "fp") is None
+
+
+async def _pipeline_env(tmp_path, monkeypatch, r, fail_embed=False, fail_commit=False, classify=None):
+    text_path = tmp_path / "notes.txt"
+    text_path.write_text("Photosynthesis turns light into chemical energy. " * 40, encoding="utf-8")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'docs.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[Artifact.__table__, Document.__table__])
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as db:
+        db.add(Artifact(hash="h" * 64, size=1, storage_path="hh/hh/h"))
+        db.add(Document(id="doc-1", notebook_id="nb_1", filename="notes.txt", file_hash="h" * 64))
+        await db.commit()
+
+    calls = {"parse": 0, "embed": 0, "commit": 0}
+    real_iter_pages = ingestion_service.document_parser.iter_pages
+    real_commit = notebook_index_writer.commit_nodes
+
+    def _iter_pages(**kwargs):
+        calls["parse"] += 1
+        return real_iter_pages(**kwargs)
+
+    async def _embed(nodes, progress_callback=None):
+        calls["embed"] += 1
+        if fail_embed and calls["embed"] == 1:
+            raise TimeoutError("embedding request timed out")
+        for node in nodes:
+            node.embedding = [1.0, float(len(node.get_content()))]
+        return {"unique_chunks": len(nodes), "api_embedded": len(nodes)}
+
+    def _commit(notebook_id, batch_id, nodes):
+        calls["commit"] += 1
+        if fail_commit and calls["commit"] == 1:
+            raise ConnectionError("index lock wait timed out")
+        return real_commit(notebook_id, batch_id, nodes)
+
+    async def _classify(text):
+        return "🌿"
+
+    async def _no_gc(r):
+        pass
+
+    monkeypatch.setattr(ingestion, "AsyncSessionLocal", session_factory)
+    monkeypatch.setattr(ingestion.redis, "from_url", lambda *a, **k: r)
+    monkeypatch.setattr(ingestion.storage_service, "get_file", lambda file_hash: str(text_path))
+    monkeypatch.setattr(ingestion.classifier_service, "classify_text", classify or _classify)
+    monkeypatch.setattr(ingestion_service.document_parser, "iter_pages", _iter_pages)
+    monkeypatch.setattr(ingestion_service.embedding_manager, "batch_embed_nodes", _embed)
+    monkeypatch.setattr(ingestion_service, "_schedule_cache_gc", _no_gc)
+    monkeypatch.setattr(notebook_index_writer, "commit_nodes", _commit)
+    return engine, session_factory, calls
+
+
+async def _load_doc(session_factory):
+    async with session_factory() as db:
+        return (await db.execute(select(Document).where(Document.id == "doc-1"))).scalar_one()
+
+
+@pytest.mark.asyncio
+async def test_retry_after_index_failure_resumes_from_embedded_checkpoint(tmp_path, monkeypatch, fake_redis):
+    engine, session_factory, calls = await _pipeline_env(tmp_path, monkeypatch, fake_redis, fail_commit=True)
+    try:
+        with pytest.raises(ConnectionError):
+            await ingestion_service.run_pipeline("doc-1")
+        assert calls == {"parse": 1, "embed": 1, "commit": 1}
+
+        await ingestion_service.run_pipeline("doc-1")
+        doc = await _load_doc(session_factory)
+    finally:
+        await engine.dispose()
+
+    assert calls == {"parse": 1, "embed": 1, "commit": 2}
+    assert doc.status == DocStatus.READY and doc.emoji == "🌿"
+    assert json.loads(fake_redis.data["prog:doc-1"])["detail"]["resumed_from"] == STAGE_EMBEDDED
+    assert ingest_checkpoints.load("doc-1", "h" * 64, doc.index_fingerprint) is None
+    store = NotebookVectorStore.from_persist_dir(os.path.join(settings.VECTOR_STORE_DIR, "nb_1"))
+    assert store.live_count > 0 and store.node_ids_for_sources(["doc-1"])
+
+
+@pytest.mark.asyncio
+async def test_retry_after_embedding_failure_skips_parsing(tmp_path, monkeypatch, fake_redis):
+    engine, session_factory, calls = await _pipeline_env(tmp_path, monkeypatch, fake_redis, fail_embed=True)
+    try:
+        with pytest.raises(TimeoutError):
+            await ingestion_service.run_pipeline("doc-1")
+
+        await ingestion_service.run_pipeline("doc-1")
+        doc = await _load_doc(session_factory)
+    finally:
+        await engine.dispose()
+
+    assert calls == {"parse": 1, "embed": 2, "commit": 1}
+    assert doc.status == DocStatus.READY
+    assert json.loads(fake_redis.data["prog:doc-1"])["detail"]["resumed_from"] == STAGE_CHUNKED
+
+
+@pytest.mark.asyncio
+async def test_ready_does_not_wait_for_classification(tmp_path, monkeypatch, fake_redis):
+    seen_on_answer = []
+
+    async def _slow_classify(text):
+        # Answers only once the document is already reported done.
+        for _ in range(500):
+            if '"stage": "done"' in fake_redis.data.get("prog:doc-1", ""):
+                break
+            await asyncio.sleep(0.01)
+        seen_on_answer.append(json.loads(fake_redis.data["prog:doc-1"])["stage"])
+        return "🧪"
+
+    engine, session_factory, calls = await _pipeline_env(tmp_path, monkeypatch, fake_redis, classify=_slow_classify)
+    try:
+        await ingestion_service.run_pipeline("doc-1")
+        doc = await _load_doc(session_factory)
+    finally:
+        await engine.dispose()
+
+    assert seen_on_answer == ["done"]
+    assert doc.status == DocStatus.READY and doc.emoji == "🧪"
+
+
+@pytest.mark.asyncio
+async def test_second_resume_keeps_the_parse_detail(tmp_path, monkeypatch, fake_redis):
+    engine, session_factory, calls = await _pipeline_env(tmp_path, monkeypatch, fake_redis, fail_embed=True, fail_commit=True)
+    try:
+        with pytest.raises(TimeoutError):
+            await ingestion_service.run_pipeline("doc-1")
+        parse_detail = ingest_checkpoints.load("doc-1", "h" * 64, index_fingerprint(
+            ingestion_service.splitter, ingestion_service.document_parser.config_fingerprint("notes.txt")
+        )).detail
+        with pytest.raises(ConnectionError):
+            await ingestion_service.run_pipeline("doc-1")
+        await ingestion_service.run_pipeline("doc-1")
+    finally:
+        await engine.dispose()
+
+    assert parse_detail and calls == {"parse": 1, "embed": 2, "commit": 2}
+    detail = json.loads(fake_redis.data["prog:doc-1"])["detail"]
+    assert detail == {**parse_detail, "resumed_from": STAGE_EMBEDDED}
@@ -0,0 +1,69 @@
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "dummy_key")
+os.environ.setdefault("DASHSCOPE_API_KEY", "dummy_key")
+
+import threading
+
+import pytest
+from llama_index.core.schema import TextNode
+
+from app.core.config import settings
+from app.services.index_writer import notebook_index_writer
+from app.services.ingestion import ingestion_service
+from app.services.vector_store import NotebookVectorStore
+
+
+@pytest.fixture(autouse=True)
+def _local_write_lock(monkeypatch):
+    monkeypatch.setattr(notebook_index_writer, "_lock_factory", lambda notebook_id: threading.Lock())
+
+
+def _seed_notebook(root, notebook_id="nb_1"):
+    path = os.path.join(root, notebook_id)
+    store = NotebookVectorStore.from_persist_dir(path)
+    for doc in ("doc-1", "doc-2", "doc-3"):
+        store.add(
+            [
+                TextNode(id_=f"{doc}-{i}", text=f"{doc} chunk {i}", embedding=[1.0, float(i)], metadata={"source_file_id": doc})
+                for i in range(5)
+            ]
+        )
+        store.persist(path)
+    return path
+
+
+@pytest.mark.asyncio
+async def test_delete_documents_removes_all_nodes_in_one_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_STORE_DIR", str(tmp_path))
+    path = _seed_notebook(str(tmp_path))
+
+    removed = await ingestion_service.delete_documents("nb_1", ["doc-1", "doc-3", "doc-missing"], compact=True)
+
+    assert removed == 10
+    store = NotebookVectorStore.from_persist_dir(path)
+    assert sorted(n.node_id for n in store.get_nodes()) == [f"doc-2-{i}" for i in range(5)]
+    assert store.segment_count == 1
+
+
+@pytest.mark.asyncio
+async def test_delete_document_leaves_tombstones_for_background_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "VECTOR_COMPACT_TOMBSTONE_RATIO", 0.9)
+    path = _seed_notebook(str(tmp_path))
+
+    await ingestion_service.delete_document("nb_1", "doc-2")
+
+    store = NotebookVectorStore.from_persist_dir(path)
+    assert store.segment_count == 3
+    assert store.node_ids_for_sources(["doc-2"]) == []
+    assert store.live_count == 10
+
+
+def test_delete_notebook_index_removes_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_STORE_DIR", str(tmp_path))
+    path = _seed_notebook(str(tmp_path))
+
+    assert ingestion_service.delete_notebook_index("nb_1") is True
+    assert not os.path.exists(path)
+    assert ingestion_service.delete_notebook_index("nb_1") is False
@@ -0,0 +1,173 @@
+import asyncio
+import contextlib
+import threading
+
+import pytest
+from llama_index.core import Document
+from llama_index.core.node_parser import SentenceSplitter
+
+from app.services.ingestion_stream import (
+    BackgroundClassification,
+    StreamingChunkEmbedder,
+    aiter_in_thread,
+    merge_embed_stats,
+)
+
+
+def test_thread_iterator_is_bounded_and_ordered():
+    produced = []
+    max_lead = []
+
+    def _pages():
+        for i in range(50):
+            produced.append(i)
+            yield i
+
+    async def _main():
+        consumed = []
+        async for item in aiter_in_thread(_pages, maxsize=3):
+            max_lead.append(len(produced) - len(consumed))
+            consumed.append(item)
+            await asyncio.sleep(0.001)
+        return consumed
+
+    assert asyncio.run(_main()) == list(range(50))
+    # Queue of 3 + the item in hand + the one the producer is blocked on.
+    assert max(max_lead) <= 5
+
+
+def test_thread_iterator_reraises_producer_errors():
+    def _pages():
+        yield 1
+        raise RuntimeError("No readable text extracted from PDF.")
+
+    async def _main():
+        return [item async for item in aiter_in_thread(_pages, maxsize=2)]
+
+    with pytest.raises(RuntimeError, match="No readable text"):
+        asyncio.run(_main())
+
+
+def test_closing_early_stops_the_producer():
+    closed = threading.Event()
+
+    def _pages():
+        try:
+            for i in range(10_000):
+                yield i
+        finally:
+            closed.set()
+
+    async def _main():
+        async with contextlib.aclosing(aiter_in_thread(_pages, maxsize=2)) as pages:
+            async for item in pages:
+                if item == 3:
+                    break
+
+    asyncio.run(_main())
+    assert closed.is_set()
+
+
+def _pages(count):
+    return [Document(text=" ".join(f"page {p} sentence {s}." for s in range(60)), id_=f"p{p}") for p in range(count)]
+
+
+def test_streamed_chunks_match_batch_chunking_and_overlap_parsing():
+    splitter = SentenceSplitter(chunk_size=64, chunk_overlap=8)
+    expected = [n.get_content() for n in splitter.get_nodes_from_documents(_pages(6))]
+    events = []
+    peak = []
+    running = []
+
+    async def _embed(nodes):
+        running.append(1)
+        peak.append(len(running))
+        events.append(("embed", len(nodes)))
+        await asyncio.sleep(0.01)
+        for node in nodes:
+            node.embedding = [1.0]
+        running.pop()
+        return {"unique_chunks": len(nodes), "api_embedded": len(nodes), "memory_hits": 0}
+
+    async def _main():
+        embedder = StreamingChunkEmbedder(splitter, _embed, batch_nodes=10, max_pending=2)
+        for doc in _pages(6):
+            events.append(("page", doc.id_))
+            await embedder.add_document(doc)
+        stats = await embedder.finish()
+        return embedder, stats
+
+    embedder, stats = asyncio.run(_main())
+
+    assert [n.get_content() for n in embedder.nodes] == expected
+    assert all(n.embedding == [1.0] for n in embedder.nodes)
+    first_embed = next(i for i, e in enumerate(events) if e[0] == "embed")
+    assert first_embed < events.index(("page", "p5"))
+    assert max(peak) <= 2
+    assert stats["unique_chunks"] == len(expected) and stats["embed_batches"] == -(-len(expected) // 10)
+
+
+def test_failed_batch_stops_the_stream():
+    splitter = SentenceSplitter(chunk_size=64, chunk_overlap=8)
+
+    async def _embed(nodes):
+        raise RuntimeError("embedding quota exhausted")
+
+    async def _main():
+        embedder = StreamingChunkEmbedder(splitter, _embed, batch_nodes=5, max_pending=1)
+        for doc in _pages(6):
+            await embedder.add_document(doc)
+        await embedder.finish()
+
+    with pytest.raises(RuntimeError, match="quota"):
+        asyncio.run(_main())
+
+
+def test_merge_embed_stats_sums_counters():
+    merged = merge_embed_stats([
+        {"unique_chunks": 4, "memory_hits": 1, "api_embedded": 3, "memory_cache": {"entries": 1}},
+        {"unique_chunks": 4, "memory_hits": 3, "db_hits": 1, "memory_cache": {"entries": 5}},
+    ])
+
+    assert merged["unique_chunks"] == 8 and merged["memory_hits"] == 4 and merged["db_hits"] == 1
+    assert merged["memory_hit_ratio"] == 0.5
+    assert merged["memory_cache"] == {"entries": 5}
+
+
+def test_background_classification_runs_once_and_reports_when_done():
+    calls = []
+    release = None
+
+    async def _classify(text):
+        calls.append(text)
+        await release.wait()
+        return "🧬"
+
+    async def _main():
+        nonlocal release
+        release = asyncio.Event()
+        classification = BackgroundClassification(_classify)
+        classification.start("first pages")
+        classification.start("again")
+        await asyncio.sleep(0)
+        before = (classification.pending, classification.result())
+        release.set()
+        return before, await classification.wait(), classification.result()
+
+    before, waited, after = asyncio.run(_main())
+
+    assert calls == ["first pages"]
+    assert before == (True, None)
+    assert waited == after == "🧬"
+
+
+def test_background_classification_failure_yields_no_emoji():
+    async def _classify(text):
+        raise TimeoutError("chat completion timed out")
+
+    async def _main():
+        classification = BackgroundClassification(_classify)
+        classification.start("text")
+        return await classification.wait(), classification.result()
+
+    assert asyncio.run(_main()) == (None, None)
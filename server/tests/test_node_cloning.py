@@ -0,0 +1,106 @@
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "dummy_key")
+os.environ.setdefault("DASHSCOPE_API_KEY", "dummy_key")
+
+import threading
+
+import numpy as np
+import pytest
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.db.session import Base
+from app.models.artifact import Artifact
+from app.models.document import DocStatus, Document
+from app.services.index_writer import notebook_index_writer
+from app.services.ingestion import ingestion_service
+from app.services.node_cloning import clone_source_nodes, index_fingerprint
+from app.services.vector_store import NotebookVectorStore
+
+
+@pytest.fixture(autouse=True)
+def _local_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_STORE_DIR", str(tmp_path / "indexes"))
+    monkeypatch.setattr(settings, "INDEX_COMMIT_WINDOW_MS", 0)
+    monkeypatch.setattr(notebook_index_writer, "_lock_factory", lambda notebook_id: threading.Lock())
+
+
+def _seed_source(notebook_id="nb_src", doc_id="doc-src"):
+    nodes = [
+        TextNode(
+            id_=f"n{i}",
+            text=f"chunk {i} of the shared handout",
+            embedding=[1.0, float(i), 0.5],
+            metadata={"source_file_id": doc_id, "notebook_id": notebook_id, "filename": "a.pdf", "page_number": i + 1},
+        )
+        for i in range(3)
+    ]
+    for prev, nxt in zip(nodes, nodes[1:]):
+        prev.relationships[NodeRelationship.NEXT] = RelatedNodeInfo(node_id=nxt.node_id)
+        nxt.relationships[NodeRelationship.PREVIOUS] = RelatedNodeInfo(node_id=prev.node_id)
+    notebook_index_writer.commit_nodes(notebook_id, doc_id, nodes)
+    return nodes
+
+
+def test_clone_rewrites_ownership_and_keeps_vectors():
+    source = _seed_source()
+
+    nodes = clone_source_nodes("nb_src", "doc-src", "nb_dst", "doc-dst", "handout.pdf")
+    notebook_index_writer.commit_nodes("nb_dst", "doc-dst", nodes)
+
+    assert [n.get_content() for n in nodes] == [n.get_content() for n in source]
+    assert all(n.metadata["source_file_id"] == "doc-dst" and n.metadata["notebook_id"] == "nb_dst" for n in nodes)
+    assert nodes[0].metadata["filename"] == "handout.pdf" and nodes[2].metadata["page_number"] == 3
+    assert not {n.node_id for n in nodes} & {n.node_id for n in source}
+    assert nodes[0].relationships[NodeRelationship.NEXT].node_id == nodes[1].node_id
+    assert nodes[2].relationships[NodeRelationship.PREVIOUS].node_id == nodes[1].node_id
+
+    target = NotebookVectorStore.from_persist_dir(os.path.join(settings.VECTOR_STORE_DIR, "nb_dst"))
+    rows = target.rows_for_sources(["doc-dst"])
+    assert len(rows) == 3
+    expected = np.asarray([n.embedding for n in source], dtype=np.float32)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    np.testing.assert_allclose(np.stack([v for _, v, _ in target.iter_rows(rows)]), expected, rtol=1e-6)
+    # Retried clones land on the same ids instead of duplicating rows.
+    again = clone_source_nodes("nb_src", "doc-src", "nb_dst", "doc-dst", "handout.pdf")
+    assert [n.node_id for n in again] == [n.node_id for n in nodes]
+
+
+def test_clone_without_source_rows_returns_none():
+    _seed_source()
+
+    assert clone_source_nodes("nb_src", "doc-other", "nb_dst", "doc-dst", "a.pdf") is None
+    assert clone_source_nodes("nb_missing", "doc-src", "nb_dst", "doc-dst", "a.pdf") is None
+
+
+@pytest.mark.asyncio
+async def test_pipeline_clones_only_from_matching_fingerprint(tmp_path, fake_redis):
+    _seed_source()
+    fingerprint = index_fingerprint(ingestion_service.splitter, {"parser": "pdf"})
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'docs.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[Artifact.__table__, Document.__table__])
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    try:
+        async with session_factory() as db:
+            db.add(Artifact(hash="h" * 64, size=1, storage_path="hh/hh/h"))
+            db.add(Document(
+                id="doc-src", notebook_id="nb_src", filename="a.pdf", file_hash="h" * 64,
+                emoji="📐", status=DocStatus.READY, index_fingerprint=fingerprint,
+            ))
+            target = Document(id="doc-dst", notebook_id="nb_dst", filename="b.pdf", file_hash="h" * 64)
+            db.add(target)
+            await db.commit()
+
+            r = fake_redis
+            assert await ingestion_service._clone_from_sibling(db, r, target, "other-config") is None
+
+            nodes, detail = await ingestion_service._clone_from_sibling(db, r, target, fingerprint)
+    finally:
+        await engine.dispose()
+
+    assert len(nodes) == 3 and detail["cloned_from"] == "doc-src"
+    assert target.emoji == "📐"
+    assert "embedding_done" in r.data["prog:doc-dst"]
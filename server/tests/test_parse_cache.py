@@ -0,0 +1,175 @@
+import json
+import os
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from app.core.config import settings
+from app.services.document_parser import BasePdfOcrProvider, DocumentParserRegistry, PdfDocumentParser, PdfProviderError
+
+
+class _CountingOcrProvider(BasePdfOcrProvider):
+    def __init__(self):
+        self.calls = 0
+
+    def enabled(self) -> bool:
+        return True
+
+    def extract_text(self, image_png_bytes: bytes, page_number: int) -> str:
+        self.calls += 1
+        return f"OCR text for scanned page {page_number}."
+
+
+def _build_mixed_pdf(path: str) -> None:
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 80), "A regular text page with enough characters.")
+    doc.new_page()  # blank: goes to OCR
+    doc.save(path)
+    doc.close()
+
+
+def _registry(ocr):
+    registry = DocumentParserRegistry()
+    registry._pdf_parser = PdfDocumentParser(ocr_provider=ocr, vision_provider=None)
+    return registry
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PARSE_CACHE_DIR", str(tmp_path / "parse_cache"))
+    monkeypatch.setattr(settings, "PARSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "PDF_SCAN_IMAGE_RATIO_THRESHOLD", 0.0)
+    return tmp_path / "parse_cache"
+
+
+def test_second_ingestion_replays_parse_without_ocr(tmp_path, cache_dir):
+    pdf_path = str(tmp_path / "deck.pdf")
+    _build_mixed_pdf(pdf_path)
+    ocr = _CountingOcrProvider()
+    registry = _registry(ocr)
+
+    pages, first_stats = registry.iter_pages(pdf_path, "deck.pdf", content_hash="abcdef0123")
+    first = [(d.text, d.metadata) for d in pages]
+    assert ocr.calls == 1 and first_stats.cache_hit is False
+
+    pages, second_stats = registry.iter_pages(pdf_path, "deck.pdf", content_hash="abcdef0123")
+    assert second_stats.total_pages == 2  # known before the first page, for progress
+    second = [(d.text, d.metadata) for d in pages]
+
+    assert ocr.calls == 1
+    assert second == first
+    assert second_stats.cache_hit is True
+    assert {k: v for k, v in second_stats.to_detail().items() if k != "cache_hit"} == {
+        k: v for k, v in first_stats.to_detail().items() if k != "cache_hit"
+    }
+
+
+def test_changed_ocr_settings_miss_the_cache(tmp_path, cache_dir, monkeypatch):
+    pdf_path = str(tmp_path / "deck.pdf")
+    _build_mixed_pdf(pdf_path)
+    ocr = _CountingOcrProvider()
+    registry = _registry(ocr)
+
+    list(registry.iter_pages(pdf_path, "deck.pdf", content_hash="abcdef0123")[0])
+    monkeypatch.setattr(settings, "PDF_OCR_MODEL_NAME", "another-ocr-model")
+    list(registry.iter_pages(pdf_path, "deck.pdf", content_hash="abcdef0123")[0])
+
+    assert ocr.calls == 2
+    assert len(os.listdir(cache_dir / "ab" / "cd" / "abcdef0123")) == 2
+
+
+def test_interrupted_parse_is_not_cached(tmp_path, cache_dir):
+    pdf_path = str(tmp_path / "deck.pdf")
+    _build_mixed_pdf(pdf_path)
+    ocr = _CountingOcrProvider()
+    registry = _registry(ocr)
+
+    pages, _ = registry.iter_pages(pdf_path, "deck.pdf", content_hash="abcdef0123")
+    next(pages)
+    pages.close()
+
+    assert not os.listdir(cache_dir / "ab" / "cd" / "abcdef0123")
+    _, stats = registry.iter_pages(pdf_path, "deck.pdf", content_hash="abcdef0123")
+    assert stats.cache_hit is False
+
+
+def test_delete_drops_every_fingerprint(tmp_path, cache_dir):
+    from app.services.parse_cache import parse_result_cache
+
+    pdf_path = str(tmp_path / "deck.pdf")
+    _build_mixed_pdf(pdf_path)
+    list(_registry(_CountingOcrProvider()).iter_pages(pdf_path, "deck.pdf", content_hash="abcdef0123")[0])
+
+    parse_result_cache.delete("abcdef0123")
+
+    assert not (cache_dir / "ab" / "cd" / "abcdef0123").exists()
+
+
+class _FailingOcrProvider(_CountingOcrProvider):
+    def extract_text(self, image_png_bytes: bytes, page_number: int) -> str:
+        self.calls += 1
+        raise PdfProviderError("HTTP 503")
+
+
+def test_failed_ocr_call_is_not_cached(tmp_path, cache_dir):
+    pdf_path = str(tmp_path / "deck.pdf")
+    _build_mixed_pdf(pdf_path)
+
+    pages, stats = _registry(_FailingOcrProvider()).iter_pages(pdf_path, "deck.pdf", content_hash="abcdef0123")
+    assert len(list(pages)) == 1  # the scanned page is degraded away
+    assert stats.failed_provider_calls == 1
+
+    ocr = _CountingOcrProvider()
+    pages, stats = _registry(ocr).iter_pages(pdf_path, "deck.pdf", content_hash="abcdef0123")
+    assert len(list(pages)) == 2 and ocr.calls == 1 and stats.cache_hit is False
+
+
+def test_truncated_entry_is_dropped_and_reparsed(tmp_path, cache_dir):
+    import gzip
+
+    from app.services.parse_cache import parse_result_cache
+
+    pdf_path = str(tmp_path / "deck.pdf")
+    _build_mixed_pdf(pdf_path)
+    registry = _registry(_CountingOcrProvider())
+    list(registry.iter_pages(pdf_path, "deck.pdf", content_hash="abcdef0123")[0])
+    path = parse_result_cache.path("abcdef0123", registry._pdf_parser.cache_fingerprint())
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        lines = f.readlines()
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.writelines(lines[:-1])  # lose the stats trailer
+
+    pages, stats = registry.iter_pages(pdf_path, "deck.pdf", content_hash="abcdef0123")
+    replayed = [(d.text, d.metadata) for d in pages]
+
+    # Both pages were still readable; the missing trailer sends the rest of the run to a fresh parse.
+    assert replayed == [(line["text"], line["metadata"]) for line in map(json.loads, lines[1:-1])]
+    assert stats.cache_hit is False
+    assert stats.ocr_pages == 1
+    assert os.path.exists(path)  # rewritten by the fresh parse
+
+
+def test_replay_that_breaks_mid_entry_continues_with_a_fresh_parse(tmp_path, cache_dir):
+    import gzip
+
+    from app.services.parse_cache import parse_result_cache
+
+    pdf_path = str(tmp_path / "deck.pdf")
+    _build_mixed_pdf(pdf_path)
+    ocr = _CountingOcrProvider()
+    registry = _registry(ocr)
+    first = [(d.text, d.metadata) for d in registry.iter_pages(pdf_path, "deck.pdf", content_hash="abcdef0123")[0]]
+    path = parse_result_cache.path("abcdef0123", registry._pdf_parser.cache_fingerprint())
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        lines = f.readlines()
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.writelines(lines[:2] + ["{not json\n"])  # header, first page, then garbage
+
+    pages, stats = registry.iter_pages(pdf_path, "deck.pdf", content_hash="abcdef0123")
+
+    assert [(d.text, d.metadata) for d in pages] == first
+    assert ocr.calls == 2 and stats.cache_hit is False
+    pages, stats = registry.iter_pages(pdf_path, "deck.pdf", content_hash="abcdef0123")
+    assert len(list(pages)) == 2 and stats.cache_hit is True
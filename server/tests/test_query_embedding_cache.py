@@ -0,0 +1,76 @@
+import asyncio
+
+from app.core.config import settings
+from app.services.embedding_memory_cache import EmbeddingLRUCache
+from app.services.embedding_redis_cache import RedisEmbeddingCache
+from app.services.query_embedding_cache import QueryEmbeddingCache, normalize_query, query_hash
+
+
+class _CountingEmbedModel:
+    model_name = "m"
+
+    def __init__(self):
+        self.calls = []
+
+    async def aget_query_embedding(self, query):
+        self.calls.append(query)
+        return [float(len(query)), 1.0]
+
+
+def _cache(server):
+    redis_cache = RedisEmbeddingCache(client_factory=lambda: server, key_prefix="qemb:", ttl_seconds=60)
+    return QueryEmbeddingCache(EmbeddingLRUCache(max_bytes=1024 * 1024), redis_cache)
+
+
+def test_normalization_folds_case_width_and_whitespace():
+    assert normalize_query("  What   is\tRAG？ ") == "what is rag?"
+    assert query_hash("What is RAG?") == query_hash("what  is rag?")
+
+
+def test_repeat_question_is_served_from_memory(monkeypatch, fake_redis):
+    monkeypatch.setattr(settings, "EMBED_QUERY_CACHE_ENABLED", True)
+    model = _CountingEmbedModel()
+    cache = _cache(fake_redis)
+
+    first = asyncio.run(cache.get_or_embed(model, "What is RAG?"))
+    second = asyncio.run(cache.get_or_embed(model, " what is  rag? "))
+
+    assert first == second
+    assert model.calls == ["What is RAG?"]
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1 and stats["misses"] == 1 and stats["hit_ratio"] == 0.5
+
+
+def test_redis_tier_is_shared_between_processes(monkeypatch, fake_redis):
+    monkeypatch.setattr(settings, "EMBED_QUERY_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "EMBED_REDIS_CACHE_ENABLED", True)
+    server = fake_redis
+    model = _CountingEmbedModel()
+
+    asyncio.run(_cache(server).get_or_embed(model, "Define entropy"))
+    other_host = _cache(server)
+    vector = asyncio.run(other_host.get_or_embed(model, "define entropy"))
+
+    assert len(model.calls) == 1
+    assert vector == [14.0, 1.0]
+    assert all(key.startswith("qemb:m:") for key in server.data)
+    assert other_host.stats()["redis_hits"] == 1
+
+
+def test_disabled_cache_always_embeds(monkeypatch, fake_redis):
+    monkeypatch.setattr(settings, "EMBED_QUERY_CACHE_ENABLED", False)
+    model = _CountingEmbedModel()
+    cache = _cache(fake_redis)
+
+    asyncio.run(cache.get_or_embed(model, "q"))
+    asyncio.run(cache.get_or_embed(model, "q"))
+
+    assert len(model.calls) == 2
+    assert cache.stats()["lookups"] == 0
+
+
+def test_question_cache_reuses_the_shared_redis_client():
+    from app.services.query_embedding_cache import query_embedding_cache
+    from app.services.redis_clients import shared_redis_client
+
+    assert query_embedding_cache.redis_cache._client_factory is shared_redis_client
@@ -15,3 +15,39 @@ def test_iter_batches_guard_zero_batch_size():
     items = ["a", "b", "c"]
     batches = list(manager._iter_batches(items, 0))
     assert [len(b) for b in batches] == [1, 1, 1]
+
+
+def test_embed_missing_texts_runs_batches_concurrently_in_order(monkeypatch):
+    import asyncio
+
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "EMBED_AIMD_ENABLED", False)
+    monkeypatch.setattr(settings, "EMBED_BATCH_MAX_TOKENS", 0)
+    monkeypatch.setattr(settings, "EMBED_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "EMBED_MAX_IN_FLIGHT", 3)
+    manager = SmartEmbeddingManager(MagicMock())
+    in_flight = []
+    peak = []
+
+    async def _fake_embed(texts):
+        in_flight.append(texts)
+        peak.append(len(in_flight))
+        # Later batches finish first, so completion order differs from input order.
+        await asyncio.sleep(0.05 / (int(texts[0]) + 1))
+        in_flight.remove(texts)
+        return [[float(t)] for t in texts]
+
+    monkeypatch.setattr(manager, "_aembed_text_batch_via_http", _fake_embed)
+    progress = []
+
+    async def _progress(done, total):
+        progress.append((done, total))
+
+    texts = [str(i) for i in range(11)]
+    vectors = asyncio.run(manager._embed_missing_texts(texts, _progress))
+
+    assert vectors == [[float(i)] for i in range(11)]
+    assert max(peak) == 3
+    assert [done for done, _ in progress] == sorted(done for done, _ in progress)
+    assert progress[-1] == (11, 11)
@@ -1,9 +1,10 @@
-from unittest.mock import MagicMock, patch
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from app.services.smart_embedding import SmartEmbeddingManager
 
 
-def test_embed_text_batch_via_http_orders_by_text_index(monkeypatch):
+def test_aembed_text_batch_via_http_orders_by_text_index(monkeypatch):
     manager = SmartEmbeddingManager(MagicMock())
     monkeypatch.setattr(manager, "_resolve_embed_api_key", lambda: "k")
 
@@ -18,7 +19,7 @@ def test_embed_text_batch_via_http_orders_by_text_index(monkeypatch):
         }
     }
 
-    with patch("app.services.smart_embedding.requests.post", return_value=mock_resp):
-        vectors = manager._embed_text_batch_via_http(["a", "b"])
+    with patch("app.services.smart_embedding.dashscope_client.apost", AsyncMock(return_value=mock_resp)):
+        vectors = asyncio.run(manager._aembed_text_batch_via_http(["a", "b"]))
 
     assert vectors == [[1.0, 1.0], [2.0, 2.0]]
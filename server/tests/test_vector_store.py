@@ -0,0 +1,325 @@
+import os
+import threading
+
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from app.core.config import settings
+from app.services.index_writer import NotebookIndexWriter
+from app.services.vector_store import (
+    SEGMENTS_DIRNAME,
+    TOMBSTONES_FILENAME,
+    NotebookVectorStore,
+    read_vector_header,
+)
+
+
+def _node(node_id: str, embedding, source_id: str = "doc-1") -> TextNode:
+    return TextNode(
+        id_=node_id,
+        text=f"text of {node_id}",
+        embedding=list(embedding),
+        metadata={"source_file_id": source_id},
+    )
+
+
+def _snapshot(path):
+    """Every file under `path` with its size and mtime."""
+    files = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            stat = os.stat(os.path.join(root, name))
+            files[os.path.join(root, name)] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def _segment_files(path):
+    return sorted(name for name in os.listdir(os.path.join(path, SEGMENTS_DIRNAME)) if name.endswith(".vec"))
+
+
+def test_persist_appends_one_segment_per_commit(tmp_path):
+    path = str(tmp_path / "nb")
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.add([_node("a", [1.0, 0.0]), _node("b", [0.0, 1.0])])
+    store.persist(path)
+    first_segments = _segment_files(path)
+
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.add([_node("c", [0.7, 0.7], source_id="doc-2")])
+    store.persist()
+
+    assert len(first_segments) == 1
+    assert len(_segment_files(path)) == 2
+    # The first segment is never rewritten by later commits.
+    assert _segment_files(path)[0] == first_segments[0]
+    assert NotebookVectorStore.from_persist_dir(path).live_count == 3
+
+
+def test_segment_vectors_are_memory_mapped_with_header(tmp_path):
+    path = str(tmp_path / "nb")
+    store = NotebookVectorStore.from_persist_dir(path, model_name="test-embed")
+    store.add([_node("a", [3.0, 4.0]), _node("b", [0.0, 2.0])])
+    store.persist(path)
+
+    header = read_vector_header(os.path.join(path, SEGMENTS_DIRNAME, _segment_files(path)[0]))
+    assert header == {"dim": 2, "count": 2, "model": "test-embed"}
+
+    reloaded = NotebookVectorStore.from_persist_dir(path, model_name="test-embed")
+    vectors = reloaded._segments[0].vectors
+    assert isinstance(vectors, np.memmap)
+    np.testing.assert_allclose(vectors[0], [0.6, 0.8], rtol=1e-6)
+    result = reloaded.query(VectorStoreQuery(query_embedding=[0.0, 1.0], similarity_top_k=1))
+    assert result.ids == ["b"]
+    assert result.nodes[0].metadata["source_file_id"] == "doc-1"
+
+
+def test_delete_writes_tombstones_and_survives_reload(tmp_path):
+    path = str(tmp_path / "nb")
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.add([_node("a", [1.0, 0.0]), _node("b", [0.0, 1.0])])
+    store.persist(path)
+
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.delete_nodes(["a"])
+    store.persist()
+
+    with open(os.path.join(path, TOMBSTONES_FILENAME), "r", encoding="utf-8") as f:
+        assert f.read().split() == ["1", "0", "a"]
+    reloaded = NotebookVectorStore.from_persist_dir(path)
+    assert [n.node_id for n in reloaded.get_nodes()] == ["b"]
+
+
+def test_query_returns_nodes_ordered_by_similarity(tmp_path):
+    store = NotebookVectorStore(persist_dir=str(tmp_path / "nb"))
+    store.add([_node("a", [1.0, 0.0]), _node("b", [0.0, 1.0]), _node("c", [0.8, 0.2])])
+
+    result = store.query(VectorStoreQuery(query_embedding=[1.0, 0.0], similarity_top_k=2))
+
+    assert result.ids == ["a", "c"]
+    assert [n.node_id for n in result.nodes] == ["a", "c"]
+    assert result.nodes[0].get_content() == "text of a"
+
+
+def test_query_matches_brute_force_and_skips_deleted_rows(tmp_path):
+    rng = np.random.default_rng(3)
+    vectors = rng.standard_normal((600, 8)).astype(np.float32)
+    store = NotebookVectorStore(persist_dir=str(tmp_path / "nb"))
+    store.add([_node(f"n{i}", vectors[i]) for i in range(len(vectors))])
+    store.delete_nodes(["n0", "n1"])
+
+    query = rng.standard_normal(8).astype(np.float32)
+    result = store.query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=10))
+
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normed @ (query / np.linalg.norm(query))
+    scores[:2] = -np.inf
+    expected = [f"n{i}" for i in np.argsort(-scores)[:10]]
+    assert result.ids == expected
+    assert result.similarities == sorted(result.similarities, reverse=True)
+
+
+def test_compact_folds_segments_and_drops_tombstones(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_COMPACT_TOMBSTONE_RATIO", 0.3)
+    path = str(tmp_path / "nb")
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.add([_node("a", [1.0, 0.0])])
+    store.persist(path)
+    store.add([_node("b", [0.0, 1.0])])
+    store.persist()
+    store.delete_nodes(["a"])
+    store.persist()
+    assert store.needs_compaction() is True
+
+    store.compact()
+
+    assert len(_segment_files(path)) == 1
+    assert store.needs_compaction() is False
+    reloaded = NotebookVectorStore.from_persist_dir(path)
+    assert [n.node_id for n in reloaded.get_nodes()] == ["b"]
+    assert reloaded.segment_count == 1
+
+
+def test_interrupted_compaction_keeps_deleted_rows_deleted(tmp_path, monkeypatch):
+    path = str(tmp_path / "nb")
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.add([_node("a", [1.0, 0.0])])
+    store.persist(path)
+    store.add([_node("b", [0.0, 1.0])])
+    store.persist()
+    store.delete_nodes(["a"])
+    store.persist()
+
+    def _crash(persist_dir):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "_write_manifest", _crash)
+    try:
+        store.compact()
+    except OSError:
+        pass
+
+    reloaded = NotebookVectorStore.from_persist_dir(path)
+    assert [n.node_id for n in reloaded.get_nodes()] == ["b"]
+
+
+def test_load_retries_when_compaction_removes_segments(tmp_path, monkeypatch):
+    path = str(tmp_path / "nb")
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.add([_node("a", [1.0, 0.0])])
+    store.persist(path)
+    real_load = NotebookVectorStore._load_segments
+    calls = []
+
+    def _flaky_load(self, persist_dir, manifest):
+        calls.append(1)
+        if len(calls) == 1:
+            raise FileNotFoundError("seg-00000001.vec")
+        return real_load(self, persist_dir, manifest)
+
+    monkeypatch.setattr(NotebookVectorStore, "_load_segments", _flaky_load)
+    reloaded = NotebookVectorStore.from_persist_dir(path)
+
+    assert len(calls) == 2
+    assert [n.node_id for n in reloaded.get_nodes()] == ["a"]
+
+
+def test_append_replaces_rows_without_building_the_row_index(tmp_path):
+    path = str(tmp_path / "nb")
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.add([_node("a", [1.0, 0.0]), _node("b", [0.0, 1.0])])
+    store.persist(path)
+
+    reloaded = NotebookVectorStore.from_persist_dir(path)
+    reloaded.add([_node("b", [1.0, 1.0]), _node("c", [1.0, 0.5]), _node("c", [0.5, 1.0])])
+    reloaded.persist()
+
+    assert reloaded._row_by_id is None
+    final = NotebookVectorStore.from_persist_dir(path)
+    assert sorted(n.node_id for n in final.get_nodes()) == ["a", "b", "c"]
+    assert final.live_count == 3
+
+
+def test_iter_rows_spans_segments_and_pending_rows(tmp_path):
+    path = str(tmp_path / "nb")
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.add([_node("a", [3.0, 4.0]), _node("b", [0.0, 2.0], source_id="doc-2")])
+    store.persist(path)
+    store.add([_node("c", [1.0, 0.0])])
+    store.delete_nodes(["a"])
+
+    rows = list(store.iter_rows(batch_size=1))
+    picked = list(store.iter_rows(store.rows_for_sources(["doc-1"])))
+
+    assert [(node_id, meta["source_file_id"]) for node_id, _, meta in rows] == [("b", "doc-2"), ("c", "doc-1")]
+    np.testing.assert_allclose(np.stack([v for _, v, _ in rows]), [[0.0, 1.0], [1.0, 0.0]])
+    assert [node_id for node_id, _, _ in picked] == ["c"]
+
+
+def test_legacy_llama_index_folder_is_converted(tmp_path):
+    from llama_index.core import MockEmbedding, StorageContext, VectorStoreIndex
+
+    path = str(tmp_path / "nb")
+    storage_context = StorageContext.from_defaults()
+    index = VectorStoreIndex(
+        [_node("a", [1.0, 0.0]), _node("b", [0.0, 1.0])],
+        storage_context=storage_context,
+        embed_model=MockEmbedding(embed_dim=2),
+    )
+    index.storage_context.persist(persist_dir=path)
+
+    before = _snapshot(path)
+
+    store = NotebookVectorStore.from_persist_dir(path)
+
+    # Readers serve the legacy rows from memory without touching the folder.
+    assert sorted(n.node_id for n in store.get_nodes()) == ["a", "b"]
+    assert store.is_legacy and _snapshot(path) == before
+
+    writer = NotebookIndexWriter(lock_factory=lambda nb: threading.Lock(), path_resolver=lambda nb: path)
+    assert writer.convert_legacy("nb") is True
+    assert not os.path.exists(os.path.join(path, "docstore.json"))
+    reloaded = NotebookVectorStore.from_persist_dir(path)
+    assert not reloaded.is_legacy and reloaded.live_count == 2
+    assert writer.convert_legacy("nb") is False
+
+
+def test_loading_never_writes_to_the_index_folder(tmp_path):
+    path = str(tmp_path / "nb")
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.add([_node("a", [1.0, 0.0]), _node("b", [0.0, 1.0])])
+    store.persist(path)
+    store.add([_node("c", [0.5, 0.5])])
+    store.delete_nodes(["a"])
+    store.persist()
+    before = _snapshot(path)
+
+    reloaded = NotebookVectorStore.from_persist_dir(path)
+
+    assert reloaded.live_count == 2
+    assert _snapshot(path) == before
+
+
+def _source_filters(source_ids):
+    from llama_index.core.vector_stores import FilterOperator, MetadataFilter, MetadataFilters
+
+    return MetadataFilters(
+        filters=[
+            MetadataFilter(key=k, value=list(source_ids), operator=FilterOperator.IN)
+            for k in ("source_file_id", "doc_id")
+        ],
+        condition="or",
+    )
+
+
+def test_source_filter_uses_postings_and_survives_compaction(tmp_path, monkeypatch):
+    path = str(tmp_path / "nb")
+    rng = np.random.default_rng(11)
+    store = NotebookVectorStore.from_persist_dir(path)
+    for doc in range(6):
+        vectors = rng.standard_normal((40, 4)).astype(np.float32)
+        store.add([_node(f"d{doc}-{i}", vectors[i], source_id=f"doc-{doc}") for i in range(40)])
+        store.persist(path)
+    store.delete_nodes(["d2-0"])
+    store.persist()
+
+    reloaded = NotebookVectorStore.from_persist_dir(path)
+    assert len(reloaded.rows_for_sources(["doc-2"])) == 39
+
+    # Source filters must not fall back to decoding every row's metadata.
+    calls = []
+    original = NotebookVectorStore._metadata_at
+    monkeypatch.setattr(NotebookVectorStore, "_metadata_at", lambda self, row: calls.append(row) or original(self, row))
+    query = VectorStoreQuery(
+        query_embedding=[1.0, 0.0, 0.0, 0.0],
+        similarity_top_k=5,
+        filters=_source_filters(["doc-2", "doc-4"]),
+    )
+    result = reloaded.query(query)
+    assert calls == []
+    assert {n.metadata["source_file_id"] for n in result.nodes} <= {"doc-2", "doc-4"}
+    assert "d2-0" not in result.ids
+
+    reloaded.compact()
+    compacted = NotebookVectorStore.from_persist_dir(path)
+    assert sorted(compacted.node_ids_for_sources(["doc-4"])) == sorted(f"d4-{i}" for i in range(40))
+    assert compacted.query(query).ids == result.ids
+
+
+def test_persist_builds_postings_from_pending_rows_only(tmp_path, monkeypatch):
+    path = str(tmp_path / "nb")
+    store = NotebookVectorStore.from_persist_dir(path)
+    store.add([_node(f"a{i}", [1.0, float(i)], source_id=f"old-{i}") for i in range(50)])
+    store.persist(path)
+
+    monkeypatch.setattr(NotebookVectorStore, "_source_rows", lambda *a: (_ for _ in ()).throw(AssertionError("scan")))
+    store.add([_node("b0", [0.0, 1.0], source_id="new"), _node("b1", [0.5, 1.0], source_id="new")])
+    store.add([_node("c0", [1.0, 1.0], source_id="other")])
+    store.delete_nodes(["b0"])
+    store.persist()
+    monkeypatch.undo()
+
+    reloaded = NotebookVectorStore.from_persist_dir(path)
+    assert reloaded.node_ids_for_sources(["new"]) == ["b1"]
+    assert reloaded.node_ids_for_sources(["other"]) == ["c0"]
+    assert reloaded.node_ids_for_sources(["old-7"]) == ["a7"]
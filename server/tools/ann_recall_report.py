@@ -0,0 +1,96 @@
+import argparse
+import json
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from app.core.config import settings
+from app.services.vector_store import NotebookVectorStore
+from tools.vector_store_benchmark import time_queries
+
+
+def build_synthetic_store(size: int, dim: int, clusters: int, seed: int) -> NotebookVectorStore:
+    # Real embeddings cluster by topic; uniform noise would understate IVF recall.
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size)] + 0.4 * rng.standard_normal((size, dim)).astype(np.float32)
+    store = NotebookVectorStore()
+    store.add(
+        [TextNode(id_=f"node-{i}", text=f"chunk {i}", embedding=vectors[i].tolist()) for i in range(size)]
+    )
+    return store
+
+
+def sample_queries(store: NotebookVectorStore, count: int, seed: int) -> np.ndarray:
+    """Perturbed copies of the notebook's own rows, so queries land where its content is."""
+    rng = np.random.default_rng(seed)
+    live_rows = store.live_rows()
+    picked = rng.choice(live_rows, min(count, len(live_rows)), replace=False)
+    vectors = np.stack([vector for _, vector, _ in store.iter_rows(picked)])
+    return vectors + 0.05 * rng.standard_normal(vectors.shape).astype(np.float32)
+
+
+def recall_report(store: NotebookVectorStore, queries: np.ndarray, top_k: int, nprobes: List[int]) -> dict:
+    settings.VECTOR_ANN_MIN_CHUNKS = 0
+    ann = store.ann_index or store.build_ann_index()
+
+    def _run(q: List[float], **kwargs) -> List[str]:
+        return store.query(VectorStoreQuery(query_embedding=q, similarity_top_k=top_k), **kwargs).ids or []
+
+    exact_ids = [set(_run(q.tolist(), exact=True)) for q in queries]
+    report = {
+        "chunks": store.live_count,
+        "dim": store.dim,
+        "top_k": top_k,
+        "nlist": ann.nlist,
+        "exact": time_queries(lambda q: _run(q, exact=True), queries),
+        "ivf": [],
+    }
+    for nprobe in nprobes:
+        recalls = [
+            len(set(_run(q.tolist(), nprobe=nprobe)) & expected) / max(1, len(expected))
+            for q, expected in zip(queries, exact_ids)
+        ]
+        stats = time_queries(lambda q: _run(q, nprobe=nprobe), queries)
+        report["ivf"].append({"nprobe": nprobe, f"recall@{top_k}": round(float(np.mean(recalls)), 4), **stats})
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Recall@k vs latency of the IVF index against exact search")
+    parser.add_argument("--index-path", default="", help="Notebook index folder; synthetic data when omitted")
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=15)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--nprobes", default="4,8,16,32,64")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", default="")
+    args = parser.parse_args()
+
+    if args.index_path:
+        store = NotebookVectorStore.from_persist_dir(args.index_path)
+    else:
+        store = build_synthetic_store(args.size, args.dim, args.clusters, args.seed)
+    if not store.live_count:
+        print("empty notebook index")
+        return 1
+
+    queries = sample_queries(store, args.queries, args.seed)
+    nprobes = [int(x) for x in args.nprobes.split(",") if x.strip()]
+    report = recall_report(store, queries, args.top_k, nprobes)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.out:
+        out_path = Path(args.out)
+        out_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"report saved: {out_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,115 @@
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from app.services.vector_store import NotebookVectorStore
+
+
+def build_nodes(vectors: np.ndarray) -> List[TextNode]:
+    return [
+        TextNode(
+            id_=f"node-{i}",
+            text=f"chunk {i}",
+            embedding=vectors[i].tolist(),
+            metadata={"source_file_id": f"doc-{i % 50}"},
+        )
+        for i in range(vectors.shape[0])
+    ]
+
+
+def time_queries(run_query: Callable[[List[float]], List[str]], queries: np.ndarray) -> dict:
+    latencies_ms: List[float] = []
+    for q in queries:
+        started_at = time.perf_counter()
+        run_query(q.tolist())
+        latencies_ms.append((time.perf_counter() - started_at) * 1000.0)
+    latencies_ms.sort()
+    p95_index = max(0, int(round(len(latencies_ms) * 0.95)) - 1)
+    return {
+        "p50_ms": round(statistics.median(latencies_ms), 3),
+        "p95_ms": round(latencies_ms[p95_index], 3),
+        "mean_ms": round(statistics.fmean(latencies_ms), 3),
+    }
+
+
+def bench_size(size: int, dim: int, top_k: int, num_queries: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((size, dim)).astype(np.float32)
+    queries = rng.standard_normal((num_queries, dim)).astype(np.float32)
+    nodes = build_nodes(vectors)
+
+    simple = SimpleVectorStore()
+    simple.add(nodes)
+    matrix_store = NotebookVectorStore()
+    matrix_store.add(nodes)
+
+    def _simple_query(q: List[float]) -> List[str]:
+        return simple.query(VectorStoreQuery(query_embedding=q, similarity_top_k=top_k)).ids or []
+
+    def _matrix_query(q: List[float]) -> List[str]:
+        return matrix_store.query(VectorStoreQuery(query_embedding=q, similarity_top_k=top_k)).ids or []
+
+    agreement = []
+    for q in queries[: min(5, num_queries)]:
+        expected = set(_simple_query(q.tolist()))
+        got = set(_matrix_query(q.tolist()))
+        agreement.append(len(expected & got) / max(1, len(expected)))
+
+    simple_stats = time_queries(_simple_query, queries)
+    matrix_stats = time_queries(_matrix_query, queries)
+
+    with tempfile.TemporaryDirectory() as persist_dir:
+        matrix_store.persist(persist_dir)
+        started_at = time.perf_counter()
+        cold_store = NotebookVectorStore.from_persist_dir(persist_dir)
+        load_ms = (time.perf_counter() - started_at) * 1000.0
+        cold_store.query(VectorStoreQuery(query_embedding=queries[0].tolist(), similarity_top_k=top_k))
+        cold_query_ms = (time.perf_counter() - started_at) * 1000.0 - load_ms
+        del cold_store
+    return {
+        "chunks": size,
+        "dim": dim,
+        "top_k": top_k,
+        "simple_vector_store": simple_stats,
+        "notebook_vector_store": matrix_stats,
+        "cold_load_ms": round(load_ms, 3),
+        "cold_first_query_ms": round(cold_query_ms, 3),
+        "speedup_p50": round(simple_stats["p50_ms"] / max(matrix_stats["p50_ms"], 1e-6), 1),
+        "topk_agreement": round(statistics.fmean(agreement), 4) if agreement else 0.0,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare SimpleVectorStore vs NotebookVectorStore query latency")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma separated chunk counts")
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimension (text-embedding-v3 uses 1024)")
+    parser.add_argument("--top-k", type=int, default=15)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", default="")
+    args = parser.parse_args()
+
+    results = []
+    for size in [int(x) for x in args.sizes.split(",") if x.strip()]:
+        result = bench_size(size, args.dim, args.top_k, args.queries, args.seed)
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False))
+
+    if args.out:
+        out_path = Path(args.out)
+        out_path.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"report saved: {out_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())